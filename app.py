@@ -19,12 +19,23 @@ try:
     import os
     import json
     import random
-    from anthropic import Anthropic
+    import datetime
+    import time
     from dotenv import load_dotenv
 
     # バージョン情報
-    VERSION = "3.3.4"
-    VERSION_DATE = "2025-11-17"
+    VERSION = "3.4.0"
+    VERSION_DATE = "2026-10-17"
+
+    # シナリオ生成中にストリーミング表示を更新する間隔（秒）
+    SCENARIO_STREAM_RENDER_INTERVAL = 0.1
+
+    # バックグラウンドで実行中の処理の表示を更新する間隔（秒）
+    JOB_PANEL_REFRESH_SECONDS = 2
+
+    # 保存済みシナリオの1ページあたりの件数と、検索結果として表示する最大件数
+    SCENARIOS_PER_PAGE = 10
+    SCENARIO_SEARCH_RESULT_LIMIT = 50
 
     # 環境変数読み込み（明示的にパスを指定）
     env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -32,8 +43,16 @@ try:
 
     # ユーティリティのインポート
     from utils.prompt_library import PromptLibrary
-    from utils.scenario_manager import load_scenario_history, save_scenario, delete_scenario
+    from utils.scenario_manager import (
+        count_scenarios, list_scenarios, list_scenario_tones, get_scenario,
+        save_scenario, delete_scenario, search_scenarios
+    )
     from modules.article_analysis import render_article_analysis_page
+    from utils import job_manager
+    from utils import llm_gateway
+    from utils.retry_policy import INTERACTIVE_RETRY_POLICY
+    from utils import note_organizer
+    from utils import token_budget
 
 except Exception as e:
     st.error(f"❌ インポートエラーが発生しました")
@@ -49,6 +68,23 @@ if 'df_numeric' not in st.session_state:
 if 'selected_sheet' not in st.session_state:
     st.session_state.selected_sheet = None
 
+
+# バックグラウンド処理の開始（ページを開いたかどうかに関係なく、アプリの起動時に行う）
+@st.cache_resource
+def start_background_workers(api_key):
+    """
+    中断したジョブの再開と、ジョブの自動整理をアプリの起動時に開始する
+    （プロセスごと・API Keyごとに1回だけ実行。以降の再確認は自動整理のスレッドが行う）
+    """
+    return job_manager.start_background_workers(api_key, PromptLibrary())
+
+
+try:
+    startup_api_key = st.secrets["ANTHROPIC_API_KEY"]
+except (KeyError, FileNotFoundError):
+    startup_api_key = os.getenv('ANTHROPIC_API_KEY') or st.session_state.get('api_key')
+start_background_workers(startup_api_key.strip() if startup_api_key else None)
+
 # タイトル
 st.title(f"💡 記事ネタ提案ツール `v{VERSION}`")
 st.caption(f"最終更新: {VERSION_DATE}")
@@ -620,8 +656,6 @@ elif page == "💡 新テーマ提案":
         if st.button("新テーマを提案"):
             with st.spinner("AIが新しいテーマを考案中..."):
                 try:
-                    client = Anthropic(api_key=api_key)
-
                     # ヒットデータのサマリー作成
                     genre_summary = ""
                     if 'ジャンル①' in df_numeric.columns:
@@ -689,15 +723,13 @@ elif page == "💡 新テーマ提案":
 - 実体験風のリアリティ
 - SNSでシェアしたくなる要素"""
 
-                    message = client.messages.create(
-                        model="claude-sonnet-4-20250514",
+                    suggestions = llm_gateway.complete(
+                        api_key,
+                        prompt,
                         max_tokens=4000,
-                        messages=[
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
-
-                    suggestions = message.content[0].text
+                        retry_policy=INTERACTIVE_RETRY_POLICY,
+                        stage="theme_suggestions"
+                    ).text
 
                     # 結果表示
                     st.success("✅ 新テーマ提案が完成しました！")
@@ -1019,8 +1051,6 @@ elif page == "🤖 シナリオ生成":
                                 hit_data_text = "\n".join(hit_parts)
 
                         # Claude APIでシナリオ生成
-                        client = Anthropic(api_key=api_key)
-
                         # ページ数抽出
                         page_num = page_structure.split("ページ")[0]
 
@@ -1112,15 +1142,34 @@ elif page == "🤖 シナリオ生成":
 
                         prompt = "\n".join(prompt_parts)
 
-                        message = client.messages.create(
-                            model="claude-sonnet-4-20250514",
+                        # 届いたところから本文を表示する（描画は一定間隔にまとめて送信量を抑える）
+                        stream_placeholder = st.empty()
+                        streamed_chunks = []
+                        last_render = [0.0]
+
+                        def render_stream(text):
+                            streamed_chunks.append(text)
+                            now = time.monotonic()
+                            if now - last_render[0] >= SCENARIO_STREAM_RENDER_INTERVAL:
+                                last_render[0] = now
+                                stream_placeholder.markdown("".join(streamed_chunks) + " ▌")
+
+                        def reset_stream(attempt, delay, error):
+                            # 再試行時は途中までの本文を捨てて最初から表示し直す
+                            streamed_chunks.clear()
+                            stream_placeholder.info(f"🔁 一時的なエラーのため {delay:.0f}秒後に再試行します（{attempt}回目）")
+
+                        scenario = llm_gateway.stream(
+                            api_key,
+                            prompt,
+                            on_text=render_stream,
                             max_tokens=4000,
-                            messages=[
-                                {"role": "user", "content": prompt}
-                            ]
-                        )
-
-                        scenario = message.content[0].text
+                            retry_policy=INTERACTIVE_RETRY_POLICY,
+                            on_retry=reset_stream,
+                            stage="scenario_generation"
+                        ).text
+                        # 完成した本文は下の「生成されたシナリオ」に表示する
+                        stream_placeholder.empty()
 
                         # セッション状態に保存
                         st.session_state.generated_scenario = scenario
@@ -1243,20 +1292,76 @@ elif page == "🤖 シナリオ生成":
         st.markdown("---")
         st.subheader("📚 保存済みシナリオ")
 
-        history = load_scenario_history()
-        scenarios = history.get('scenarios', [])
+        # 件数だけを数え、一覧は表示するページの行だけを描画する
+        total_scenarios = count_scenarios()
 
-        if not scenarios:
+        if total_scenarios == 0:
             st.info("保存されたシナリオはまだありません。シナリオを生成して「💾 シナリオを保存」ボタンで保存してください。")
         else:
-            st.write(f"**保存数: {len(scenarios)}件**")
+            st.write(f"**保存数: {total_scenarios}件**")
 
             # セッション状態で選択中のシナリオを管理
             if 'selected_scenario_id' not in st.session_state:
                 st.session_state.selected_scenario_id = None
 
+            # ページネーション用のセッション状態（検索語・絞り込みを変えたら1ページ目に戻す）
+            if 'scenario_page' not in st.session_state:
+                st.session_state.scenario_page = 0
+
+            # 検索・絞り込み
+            scenario_query = st.text_input(
+                "🔍 検索",
+                key="scenario_search",
+                placeholder="タイトル・シナリオ本文から検索",
+                on_change=lambda: st.session_state.update(scenario_page=0)
+            ).strip()
+
+            filter_col1, filter_col2 = st.columns(2)
+            with filter_col1:
+                tone_filter = st.selectbox(
+                    "🎭 雰囲気",
+                    ["すべて"] + list_scenario_tones(),
+                    key="scenario_tone_filter",
+                    on_change=lambda: st.session_state.update(scenario_page=0)
+                )
+            with filter_col2:
+                date_range = st.date_input(
+                    "📅 作成日",
+                    value=(),
+                    key="scenario_date_filter",
+                    on_change=lambda: st.session_state.update(scenario_page=0),
+                    help="開始日と終了日を選択（開始日だけでも可）"
+                )
+
+            filters = {
+                "tone": None if tone_filter == "すべて" else tone_filter,
+                "date_from": date_range[0] if len(date_range) > 0 else None,
+                "date_to": date_range[1] if len(date_range) > 1 else None,
+            }
+
+            if scenario_query:
+                search_hits = search_scenarios(scenario_query, SCENARIO_SEARCH_RESULT_LIMIT, **filters)
+                total_listed = len(search_hits)
+                st.caption(f"「{scenario_query}」の検索結果: {total_listed}件" + ("（関連度の高い順に上位のみ表示）" if total_listed >= SCENARIO_SEARCH_RESULT_LIMIT else ""))
+            else:
+                total_listed = count_scenarios(**filters)
+                if filters["tone"] or filters["date_from"]:
+                    st.caption(f"絞り込み結果: {total_listed}件")
+
+            if total_listed == 0:
+                st.info("該当するシナリオはありません。")
+
+            # ページネーション設定（削除で件数が減ったときは最後のページに戻す）
+            total_scenario_pages = max(1, (total_listed + SCENARIOS_PER_PAGE - 1) // SCENARIOS_PER_PAGE)
+            st.session_state.scenario_page = min(st.session_state.scenario_page, total_scenario_pages - 1)
+            start_idx = st.session_state.scenario_page * SCENARIOS_PER_PAGE
+            if scenario_query:
+                listed_scenarios = search_hits[start_idx:start_idx + SCENARIOS_PER_PAGE]
+            else:
+                listed_scenarios = list_scenarios(SCENARIOS_PER_PAGE, start_idx, **filters)
+
             # 一覧表示
-            for scenario in scenarios:
+            for scenario in listed_scenarios:
                 with st.container():
                     col1, col2, col3 = st.columns([6, 2, 1])
 
@@ -1292,12 +1397,29 @@ elif page == "🤖 シナリオ生成":
 
                     st.markdown("---")
 
+            # ページネーションコントロール
+            if total_listed > SCENARIOS_PER_PAGE:
+                col1, col2, col3 = st.columns([1, 2, 1])
+
+                with col1:
+                    if st.session_state.scenario_page > 0:
+                        if st.button("⬅️ 前へ", key="prev_scenario_page"):
+                            st.session_state.scenario_page -= 1
+                            st.rerun()
+
+                with col2:
+                    st.markdown(f"<div style='text-align: center'>ページ {st.session_state.scenario_page + 1} / {total_scenario_pages}</div>", unsafe_allow_html=True)
+
+                with col3:
+                    if st.session_state.scenario_page < total_scenario_pages - 1:
+                        if st.button("次へ ➡️", key="next_scenario_page"):
+                            st.session_state.scenario_page += 1
+                            st.rerun()
+
             # 選択されたシナリオの詳細表示
             if st.session_state.selected_scenario_id:
-                selected_scenario = next(
-                    (s for s in scenarios if s['id'] == st.session_state.selected_scenario_id),
-                    None
-                )
+                # 表示する分だけ本文を読み込む
+                selected_scenario = get_scenario(st.session_state.selected_scenario_id)
 
                 if selected_scenario:
                     st.markdown("---")
@@ -1680,12 +1802,7 @@ elif page == "📝 ネタ管理":
                     st.write(f"**未整理メモ: {len(unprocessed_notes)}件**")
 
                     # カテゴリ情報を取得
-                    category_info_text = ""
-                    if neta_data:
-                        category_info = []
-                        for cat_id, cat_data in neta_data['categories'].items():
-                            category_info.append(f"- **{cat_id}** ({cat_data['name']}): {cat_data['description']}")
-                        category_info_text = "\n".join(category_info)
+                    category_info_text = note_organizer.build_category_info(neta_data)
 
                     # 整理するメモを選択
                     st.markdown("### 整理するメモを選択")
@@ -1707,116 +1824,152 @@ elif page == "📝 ネタ管理":
                     if selected_notes:
                         st.write(f"**選択中: {len(selected_notes)}件**")
 
+                        use_batch = st.checkbox(
+                            "📦 バッチモード（大量のメモ向け）",
+                            value=False,
+                            help="Message Batches でまとめて整理します。料金は通常の半額ですが、結果が出るまでに時間がかかります（最大24時間）。"
+                        )
+
                         if st.button("🤖 AIで自動整理を実行"):
-                            with st.spinner("AIが分析・整理中..."):
-                                try:
-                                    client = Anthropic(api_key=api_key)
-
-                                    # 整理結果を格納
-                                    organized_results = []
-
-                                    for note in selected_notes:
-                                        # AIにカテゴリ分類を依頼
-                                        prompt = f"""以下のネタメモを分析して、適切なカテゴリに分類し、構造化してください。
-
-【利用可能なカテゴリ】
-{category_info_text}
-
-【ネタメモ】
-{note['content']}
-
-【出力形式】（必ずJSON形式で返してください）
-{{
-  "category": "カテゴリID（上記から選択）",
-  "element_name": "要素名（簡潔に）",
-  "additional_fields": {{
-    "description": "説明",
-    "examples": ["例1", "例2"],  // dialogue_patternsの場合
-    "tags": ["タグ1", "タグ2"],  // 該当する場合
-    "trigger": "トリガー",  // situationsの場合
-    "category": "サブカテゴリ"  // dialogue_patternsの場合
-  }},
-  "reasoning": "このカテゴリを選んだ理由"
-}}
+                            try:
+                                # バックグラウンドで並列に整理し、完了したメモから下の「整理結果」に表示する
+                                notes = [{"id": note['id'], "content": note['content']} for note in selected_notes]
+                                job_id = job_manager.create_job(
+                                    job_type="note_organization",
+                                    title=f"AI整理 {len(notes)}件 {datetime.datetime.now().strftime('%m/%d %H:%M')}",
+                                    params={
+                                        "notes": notes,
+                                        "category_info_text": category_info_text,
+                                        "batch": use_batch
+                                    }
+                                )
+                                job_manager.start_note_organization_job(
+                                    job_id=job_id,
+                                    api_key=api_key,
+                                    notes=notes,
+                                    category_info_text=category_info_text,
+                                    batch=use_batch
+                                )
+                                st.session_state.note_organization_job_id = job_id
+                                st.rerun()
 
-【重要】
-- category は必ず上記のカテゴリIDから選択
-- element_name は簡潔で分かりやすく
-- additional_fields はカテゴリに応じて適切なフィールドを含める
-- 必ずJSON形式で返答してください"""
-
-                                        message = client.messages.create(
-                                            model="claude-sonnet-4-20250514",
-                                            max_tokens=1000,
-                                            messages=[
-                                                {"role": "user", "content": prompt}
-                                            ]
-                                        )
-
-                                        # AIの応答を解析
-                                        response_text = message.content[0].text
-
-                                        # JSONを抽出（コードブロックの場合も対応）
-                                        import re
-                                        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                                        if json_match:
-                                            result = json.loads(json_match.group())
-                                            result['original_note_id'] = note['id']
-                                            organized_results.append(result)
-
-                                    # 結果を表示
-                                    st.success(f"✅ {len(organized_results)}件の整理が完了しました！")
-
-                                    for result in organized_results:
-                                        with st.expander(f"📝 {result['element_name']} → {result['category']}"):
-                                            st.write(f"**カテゴリ:** {result['category']} ({neta_data['categories'][result['category']]['name']})")
-                                            st.write(f"**要素名:** {result['element_name']}")
-                                            st.write(f"**理由:** {result['reasoning']}")
-
-                                            if result.get('additional_fields'):
-                                                st.write("**追加情報:**")
-                                                for key, value in result['additional_fields'].items():
-                                                    st.write(f"- {key}: {value}")
-
-                                            col1, col2 = st.columns(2)
-                                            with col1:
-                                                if st.button("✅ 承認してマージ", key=f"approve_{result['original_note_id']}"):
-                                                    # neta_elements.jsonにマージ
-                                                    category_id = result['category']
-                                                    existing_ids = [e.get('id', '') for e in neta_data['categories'][category_id]['elements']]
-                                                    id_prefix = category_id[:2]
-                                                    new_id_num = len(existing_ids) + 1
-                                                    new_id = f"{id_prefix}{new_id_num:03d}"
-
-                                                    new_element = {
-                                                        'id': new_id,
-                                                        'name': result['element_name'],
-                                                        'weight': 1.0,
-                                                        'usage_count': 0,
-                                                        **result.get('additional_fields', {})
-                                                    }
-
-                                                    neta_data['categories'][category_id]['elements'].append(new_element)
-                                                    save_neta_elements(neta_data)
-
-                                                    # 未整理メモのステータスを更新
-                                                    for note in quick_notes_data['notes']:
-                                                        if note['id'] == result['original_note_id']:
-                                                            note['status'] = 'processed'
-                                                            break
-                                                    save_quick_notes(quick_notes_data)
-
-                                                    st.success("マージしました！")
-                                                    st.rerun()
-
-                                            with col2:
-                                                if st.button("❌ スキップ", key=f"skip_{result['original_note_id']}"):
-                                                    st.info("スキップしました")
-
-                                except Exception as e:
-                                    st.error(f"エラーが発生しました: {e}")
-                                    import traceback
-                                    st.code(traceback.format_exc())
+                            except Exception as e:
+                                st.error(f"ジョブの作成中にエラーが発生しました: {e}")
+
+                # AI整理の結果（実行中は定期的に再描画し、完了したメモから順に表示）
+                def render_note_organization_results():
+                    job = job_manager.get_job(st.session_state.note_organization_job_id)
+                    if job is None:
+                        return
+
+                    st.markdown("---")
+                    st.markdown("### 整理結果")
+
+                    notes = (job.get('params') or {}).get('notes') or []
+                    results = job.get('note_results') or {}
+                    is_running = job['status'] in ['pending', 'running']
+
+                    if is_running and job.get('batch'):
+                        counts = job['batch'].get('request_counts') or {}
+                        finished = sum(v for k, v in counts.items() if k != 'processing')
+                        st.info(f"📦 バッチで整理中...（{finished}/{len(notes)}件 処理済み）完了すると結果がまとめて表示されます")
+                        if st.button("🛑 キャンセル", key="cancel_note_organization"):
+                            job_manager.cancel_job(job['id'])
+                            st.rerun()
+                    elif is_running:
+                        st.info(f"🔄 AIが分析・整理中...（{len(results)}/{len(notes)}件 完了）")
+                        st.progress(job['progress'] / 100)
+                        if st.button("🛑 キャンセル", key="cancel_note_organization"):
+                            job_manager.cancel_job(job['id'])
+                            st.rerun()
+                    elif job['status'] == 'completed':
+                        summary = job.get('result') or {}
+                        message = f"✅ {summary.get('succeeded', 0)}件の整理が完了しました！"
+                        if summary.get('failed'):
+                            message += f"（{summary['failed']}件は失敗）"
+                        st.success(message)
+                    elif job['status'] == 'failed':
+                        st.error(f"エラーが発生しました: {job.get('error')}")
+                    elif job['status'] == 'cancelled':
+                        st.warning("🛑 整理をキャンセルしました")
+
+                    # 承認済み・スキップしたメモは表示しない
+                    processed_ids = {note['id'] for note in load_quick_notes()['notes'] if note.get('status') != 'unprocessed'}
+                    skipped_ids = st.session_state.setdefault('skipped_note_ids', set())
+
+                    for note in notes:
+                        entry = results.get(note['id'])
+                        if entry is None or note['id'] in processed_ids or note['id'] in skipped_ids:
+                            continue
+
+                        if entry['status'] == 'failed':
+                            with st.expander(f"⚠️ {note['content'][:40]} → 整理に失敗"):
+                                st.error(entry.get('error'))
+                            continue
+
+                        result = entry['result']
+                        category_id = result['category']
+                        category = neta_data['categories'].get(category_id)
+
+                        with st.expander(f"📝 {result['element_name']} → {category_id}"):
+                            if category is None:
+                                st.warning(f"カテゴリ「{category_id}」は存在しないため、マージできません")
+                            else:
+                                st.write(f"**カテゴリ:** {category_id} ({category['name']})")
+                            st.write(f"**要素名:** {result['element_name']}")
+                            st.write(f"**理由:** {result.get('reasoning', '')}")
+
+                            if result.get('additional_fields'):
+                                st.write("**追加情報:**")
+                                for key, value in result['additional_fields'].items():
+                                    st.write(f"- {key}: {value}")
+
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                if category is not None and st.button("✅ 承認してマージ", key=f"approve_{note['id']}"):
+                                    # neta_elements.jsonにマージ
+                                    existing_ids = [e.get('id', '') for e in category['elements']]
+                                    id_prefix = category_id[:2]
+                                    new_id_num = len(existing_ids) + 1
+                                    new_id = f"{id_prefix}{new_id_num:03d}"
+
+                                    new_element = {
+                                        'id': new_id,
+                                        'name': result['element_name'],
+                                        'weight': 1.0,
+                                        'usage_count': 0,
+                                        **result.get('additional_fields', {})
+                                    }
+
+                                    category['elements'].append(new_element)
+                                    save_neta_elements(neta_data)
+
+                                    # 未整理メモのステータスを更新
+                                    latest_notes = load_quick_notes()
+                                    for quick_note in latest_notes['notes']:
+                                        if quick_note['id'] == note['id']:
+                                            quick_note['status'] = 'processed'
+                                            break
+                                    save_quick_notes(latest_notes)
+
+                                    st.success("マージしました！")
+                                    st.rerun()
+
+                            with col2:
+                                if st.button("❌ スキップ", key=f"skip_{note['id']}"):
+                                    skipped_ids.add(note['id'])
+                                    st.rerun()
+
+                    # ジョブが終わったら自動更新を止めるため、ページ全体を再実行する
+                    was_running = st.session_state.get('note_organization_running', False)
+                    st.session_state.note_organization_running = is_running
+                    if was_running and not is_running:
+                        st.rerun()
+
+                if st.session_state.get('note_organization_job_id'):
+                    note_job = job_manager.get_job(st.session_state.note_organization_job_id)
+                    note_job_running = bool(note_job) and note_job['status'] in ['pending', 'running']
+                    st.fragment(run_every=JOB_PANEL_REFRESH_SECONDS if note_job_running else None)(render_note_organization_results)()
 
 # 設定ページ
 elif page == "⚙️ 設定":
@@ -1853,18 +2006,11 @@ elif page == "⚙️ 設定":
                         # APIキーをトリム
                         test_key = current_key.strip()
 
-                        # Anthropicクライアントを作成
-                        client = Anthropic(api_key=test_key)
-
-                        # テストリクエスト
-                        message = client.messages.create(
-                            model="claude-sonnet-4-20250514",
-                            max_tokens=50,
-                            messages=[{"role": "user", "content": "Hello"}]
-                        )
+                        # テストリクエスト（共有ゲートウェイ経由）
+                        completion = llm_gateway.complete(test_key, "Hello", max_tokens=50)
 
                         st.success("✅ API接続成功！正常に動作しています。")
-                        st.info(f"レスポンス: {message.content[0].text[:100]}...")
+                        st.info(f"レスポンス: {completion.text[:100]}...")
 
                     except Exception as e:
                         st.error(f"❌ API接続失敗: {e}")
@@ -1957,3 +2103,68 @@ elif page == "⚙️ 設定":
                     st.error(f"保存中にエラーが発生しました: {e}")
             elif save_button:
                 st.warning("APIキーを入力してください")
+
+    # ジョブの自動整理の結果
+    st.markdown("---")
+    st.subheader("🧹 ジョブの自動整理")
+    st.caption(
+        f"完了・失敗・キャンセルしたジョブは、{job_manager.RETENTION_INTERVAL_SECONDS // 60}分ごとに"
+        "保持期間・件数・サイズの上限を超えた古いものから自動で削除されます。"
+    )
+
+    retention_report = job_manager.get_retention_report()
+    if retention_report:
+        ran_at = datetime.datetime.fromisoformat(retention_report['ran_at']).strftime('%Y/%m/%d %H:%M')
+        st.write(
+            f"前回の実行: {ran_at} / 削除したジョブ: {retention_report['jobs_pruned']}件 / "
+            f"削除したblob: {retention_report['blobs_removed']}件 / 解放: {retention_report['bytes_reclaimed'] / 1024:,.1f} KB"
+        )
+    else:
+        st.caption("まだ実行されていません")
+
+    if st.button("🧹 今すぐ整理"):
+        report = job_manager.run_retention()
+        st.success(f"✅ {report['jobs_pruned']}件のジョブを削除しました（{report['bytes_reclaimed'] / 1024:,.1f} KB 解放）")
+
+    # 応答キャッシュ
+    st.markdown("---")
+    st.subheader("💾 応答キャッシュ")
+    st.caption("同じ記事を分析し直したときは、保存済みの応答を再利用してAPI呼び出しを省きます。")
+
+    if job_manager.response_cache_enabled():
+        cache_stats = job_manager.get_response_cache_stats()
+        st.write(f"保存数: {cache_stats['count']}件 / サイズ: {cache_stats['bytes'] / 1024:,.1f} KB")
+
+        if st.button("🗑️ 応答キャッシュを削除"):
+            job_manager.clear_response_cache()
+            st.success("✅ 応答キャッシュを削除しました")
+    else:
+        st.caption("無効になっています（LLM_CACHE_MAX_MB=0）")
+
+    # 出力トークンの実績（max_tokens の自動調整に使う）
+    st.markdown("---")
+    st.subheader("📏 出力トークンの実績")
+    st.caption(
+        f"ステージごとの実際の出力トークン数から、上位{token_budget.PERCENTILE:.0f}パーセンタイルに"
+        f"{(token_budget.HEADROOM - 1) * 100:.0f}%の余裕を持たせた値を max_tokens にします"
+        f"（実績が{token_budget.MIN_SAMPLES}件未満のステージは固定値）。"
+    )
+
+    token_stats = token_budget.get_stats()
+    if token_stats:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "ステージ": key,
+                    "件数": stats['count'],
+                    "中央値": stats['p50'],
+                    f"{token_budget.PERCENTILE:.0f}%点": stats['high'],
+                    "途切れた回数": stats['truncated'],
+                }
+                for key, stats in sorted(token_stats.items())
+            ]),
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("まだ実績がありません")
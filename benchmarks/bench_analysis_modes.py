@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+記事分析モードのベンチマーク
+標準モード（基本分析 → 深堀り分析の2回）と高速モード（1回で両方を出力）の
+待ち時間とトークン数を、疑似サーバー（fake_anthropic_server.py）に対して両モードを実行して比較する
+テーマ生成はどちらのモードでも同じため含めない
+
+使い方:
+    # 疑似サーバーで比較する（APIキー不要。リポジトリで再現できる計測はこの方法だけ）
+    python benchmarks/bench_analysis_modes.py
+    python benchmarks/bench_analysis_modes.py --latency 1.0 --tokens-per-second 60
+
+    # 手元で実際のAPIに対して両モードを実行し、呼び出しごとの時間とトークン数を記録する（ANTHROPIC_API_KEY が必要）
+    python benchmarks/bench_analysis_modes.py --live --output /tmp/analysis_modes_live.json
+
+    # --live で記録したファイルから比較する
+    python benchmarks/bench_analysis_modes.py --replay /tmp/analysis_modes_live.json
+
+疑似サーバーの応答は内容が固定で、時間は「最初の出力までの待ち時間 + 出力トークン数 / 出力速度」になる。
+呼び出し回数が減る分の差（1回分の待ち時間とプロンプトの入力トークン）を確認する用途で、
+モデルの実際の出力の長さ・品質の差は --live の記録で比較する（実際の応答の記録はリポジトリに含めない）
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_anthropic_server import start_server
+from utils import llm_gateway
+from utils import job_manager
+from utils.prompt_library import PromptLibrary
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ARTICLES_PATH = os.path.join(FIXTURES_DIR, 'analysis_articles.json')
+
+# 疑似サーバーでの計測の既定値（最初の出力までの秒数・出力速度・1つの分析の長さ）
+FAKE_LATENCY_SECONDS = 0.8
+FAKE_TOKENS_PER_SECOND = 400
+FAKE_REPLY_CHARS = 1200
+
+
+def _timed_stream(gateway, request):
+    """1回の呼び出しを実行し、最初のテキストまでの時間・全体の時間・使用量を記録する"""
+    request = dict(request)
+    request.pop('template_version', None)
+    request.pop('usage_key', None)
+
+    start = time.perf_counter()
+    first_text_at = []
+
+    def on_text(_text):
+        if not first_text_at:
+            first_text_at.append(time.perf_counter())
+
+    completion = gateway.stream(on_text=on_text, **request)
+    end = time.perf_counter()
+    return completion, {
+        "seconds": round(end - start, 3),
+        "ttft_seconds": round((first_text_at[0] if first_text_at else end) - start, 3),
+        "usage": completion.usage,
+        "stop_reason": completion.stop_reason,
+        "output_chars": len(completion.text),
+    }
+
+
+def record(gateway, articles, path, model=llm_gateway.DEFAULT_MODEL):
+    """記事ごとに両モードを実行して記録する"""
+    prompts = PromptLibrary()
+    recordings = []
+
+    for index, article in enumerate(articles, 1):
+        title, content = article['title'], article['content']
+        print(f"[{index}/{len(articles)}] {title}")
+
+        basic_completion, basic_call = _timed_stream(gateway, job_manager._basic_analysis_request(prompts, title, content))
+        _, deep_call = _timed_stream(gateway, job_manager._deep_analysis_request(prompts, content, basic_completion.text))
+        fast_completion, fast_call = _timed_stream(gateway, job_manager._fast_analysis_request(prompts, title, content))
+
+        # 高速モードの応答が基本分析・深堀り分析に分けられるか
+        try:
+            job_manager._split_fast_analysis(fast_completion.text)
+            fast_call['split_ok'] = True
+        except ValueError:
+            fast_call['split_ok'] = False
+
+        recordings.append({
+            "title": title,
+            "standard": [dict(basic_call, stage="basic_analysis"), dict(deep_call, stage="deep_analysis")],
+            "fast": [dict(fast_call, stage="fast_analysis")],
+        })
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "recorded_at": datetime.datetime.now().isoformat(),
+            "model": model,
+            "articles": recordings,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"記録しました: {path}")
+
+
+def _summarize(recordings, mode):
+    """記事1件あたりの待ち時間（呼び出しは順番に行うため合計）とトークン数"""
+    per_article = []
+    for article in recordings:
+        calls = article[mode]
+        usage = [call['usage'] for call in calls]
+        per_article.append({
+            "seconds": sum(call['seconds'] for call in calls),
+            "ttft_seconds": calls[0]['ttft_seconds'],
+            "input_tokens": sum(u.get('input_tokens', 0) + u.get('cache_creation_input_tokens', 0) + u.get('cache_read_input_tokens', 0) for u in usage),
+            "cache_read_tokens": sum(u.get('cache_read_input_tokens', 0) for u in usage),
+            "output_tokens": sum(u.get('output_tokens', 0) for u in usage),
+            "truncated": sum(1 for call in calls if call.get('stop_reason') == "max_tokens"),
+            "split_failed": sum(1 for call in calls if call.get('split_ok') is False),
+        })
+    return per_article
+
+
+def report(data):
+    recordings = data['articles']
+    print(f"記録: {data.get('recorded_at', '-')} / モデル: {data.get('model', '-')} / 記事 {len(recordings)}件")
+    print()
+
+    summaries = {mode: _summarize(recordings, mode) for mode in job_manager.ANALYSIS_MODES}
+    for mode, per_article in summaries.items():
+        seconds = [a['seconds'] for a in per_article]
+        print(f"{job_manager.ANALYSIS_MODES[mode]}")
+        print(f"  待ち時間     mean {statistics.mean(seconds):7.2f} s | p50 {statistics.median(seconds):7.2f} s | max {max(seconds):7.2f} s")
+        print(f"  最初の出力   mean {statistics.mean(a['ttft_seconds'] for a in per_article):7.2f} s")
+        print(f"  入力トークン mean {statistics.mean(a['input_tokens'] for a in per_article):9.0f}（うちキャッシュ読み込み {statistics.mean(a['cache_read_tokens'] for a in per_article):.0f}）")
+        print(f"  出力トークン mean {statistics.mean(a['output_tokens'] for a in per_article):9.0f}")
+        print(f"  途切れ {sum(a['truncated'] for a in per_article)}件 / 見出しの分割失敗 {sum(a['split_failed'] for a in per_article)}件")
+        print()
+
+    def ratio(key):
+        standard = statistics.mean(a[key] for a in summaries['standard'])
+        fast = statistics.mean(a[key] for a in summaries['fast'])
+        return (fast - standard) / standard * 100 if standard else 0.0
+
+    print(f"高速モード / 標準モード: 待ち時間 {ratio('seconds'):+.1f}% | 入力トークン {ratio('input_tokens'):+.1f}% | 出力トークン {ratio('output_tokens'):+.1f}%")
+
+
+def record_fake(articles, latency, tokens_per_second, reply_chars):
+    """疑似サーバーを起動して両モードを実行し、一時ファイルに記録した内容を返す"""
+    server = start_server(latency=latency, tokens_per_second=tokens_per_second, reply_chars=reply_chars)
+    host, port = server.server_address[:2]
+    gateway = llm_gateway.get_gateway("sk-fake", base_url=f"http://{host}:{port}")
+    model = f"疑似サーバー（待ち時間 {latency} s / {tokens_per_second} tokens/s / 応答 {reply_chars}文字）"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'analysis_modes_fake.json')
+            record(gateway, articles, path, model=model)
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記事分析モードのベンチマーク（既定は疑似サーバーで計測）")
+    parser.add_argument('--live', action='store_true', help="実際のAPIで両モードを実行して --output に記録する")
+    parser.add_argument('--output', help="--live の記録の保存先")
+    parser.add_argument('--replay', help="--live で記録したファイルから比較する")
+    parser.add_argument('--latency', type=float, default=FAKE_LATENCY_SECONDS, help="疑似サーバー: 最初の出力までの秒数")
+    parser.add_argument('--tokens-per-second', type=float, default=FAKE_TOKENS_PER_SECOND, help="疑似サーバー: 出力の速度")
+    parser.add_argument('--reply-chars', type=int, default=FAKE_REPLY_CHARS, help="疑似サーバー: 1つの分析の長さ（文字数）")
+    args = parser.parse_args()
+
+    with open(ARTICLES_PATH, encoding='utf-8') as f:
+        articles = json.load(f)
+
+    if args.live:
+        api_key = os.getenv('ANTHROPIC_API_KEY')
+        if not api_key:
+            sys.exit("ANTHROPIC_API_KEY を設定してください")
+        if not args.output:
+            sys.exit("--output で記録の保存先を指定してください")
+        record(llm_gateway.get_gateway(api_key.strip()), articles, args.output)
+        return
+
+    if args.replay:
+        with open(args.replay, encoding='utf-8') as f:
+            report(json.load(f))
+        return
+
+    report(record_fake(articles, args.latency, args.tokens_per_second, args.reply_chars))
+
+
+if __name__ == "__main__":
+    main()
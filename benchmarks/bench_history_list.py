@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+履歴一覧の読み込みのベンチマーク
+分析・シナリオの本文の長さを 1,000 → 100,000 文字と変えても、
+一覧の表示に必要なデータ（件数と1ページ分の行・シナリオ履歴の一覧）を読み込む時間が
+変わらないことを確認する（本文は blob に分離し、詳細を開いたときだけ読み込む）
+
+比較のため、本文を履歴ファイルにそのまま持つ旧形式のシナリオ履歴の読み込み時間も表示する
+
+使い方:
+    python benchmarks/bench_history_list.py
+"""
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import scenario_manager
+from utils.analysis_store import AnalysisStore
+from utils.blob_store import put_text
+
+
+BODY_CHARS = [1_000, 10_000, 100_000]
+DOCUMENTS = 300
+PAGE_SIZE = 5
+REPEAT = 30
+
+
+def make_body(chars, seed):
+    """ダミーの本文（blob の重複排除が効かないよう、文書ごとに内容を変える）"""
+    line = f"{seed:05d} 主人公は義母に新築祝いとして50万円を要求された。"
+    return (line * (chars // len(line) + 1))[:chars]
+
+
+def timed(func):
+    """func を REPEAT 回実行した時間の中央値（ミリ秒）"""
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def bench_analyses(tmp, chars):
+    """分析一覧: 件数 + 1ページ分の行"""
+    blobs_dir = os.path.join(tmp, 'blobs')
+    store = AnalysisStore(os.path.join(tmp, 'analysis_history.db'))
+    for i in range(DOCUMENTS):
+        body = make_body(chars, i)
+        store.insert({
+            "id": f"ana_bench_{i:05d}",
+            "title": f"ベンチマーク記事 {i}",
+            "summary": body[:100],
+            "content": put_text(body, blobs_dir),
+            "basic_analysis": put_text(body + "基本", blobs_dir),
+            "deep_analysis": put_text(body + "深堀り", blobs_dir),
+            "themes": put_text(body + "テーマ", blobs_dir),
+            "created_at": (datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i)).isoformat(),
+        })
+    store.flush()
+
+    elapsed = timed(lambda: (store.count(), store.list_page(PAGE_SIZE, 0)))
+    store.close()
+    return elapsed
+
+
+def bench_scenarios(tmp, chars, inline):
+    """シナリオ一覧: シナリオ履歴の読み込み（inline なら本文を履歴ファイルに持つ旧形式）"""
+    blobs_dir = os.path.join(tmp, 'blobs')
+    path = os.path.join(tmp, 'scenario_history.json')
+    scenarios = []
+    for i in range(DOCUMENTS):
+        body = make_body(chars, i)
+        scenarios.append({
+            "id": f"scn_bench_{i:05d}",
+            "title": f"ベンチマークシナリオ {i}",
+            "summary": body[:150],
+            "content": body if inline else put_text(body, blobs_dir),
+            "parameters": {"tone": "スカッと"},
+            "created_at": (datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i)).isoformat(),
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"version": "1.0.0", "scenarios": scenarios}, f, ensure_ascii=False)
+
+    scenario_manager.SCENARIO_HISTORY_PATH = path
+    return timed(scenario_manager.load_scenario_history)
+
+
+def main():
+    print(f"各 {DOCUMENTS}件 / 一覧の読み込み時間の中央値")
+    print(f"{'本文の長さ':>10} | {'分析一覧':>10} | {'シナリオ一覧':>12} | {'シナリオ一覧（旧形式）':>16}")
+    for chars in BODY_CHARS:
+        with tempfile.TemporaryDirectory() as tmp:
+            analyses = bench_analyses(tmp, chars)
+            scenarios = bench_scenarios(tmp, chars, inline=False)
+            inline = bench_scenarios(tmp, chars, inline=True)
+        print(f"{chars:>12,} | {analyses:>8.2f} ms | {scenarios:>10.2f} ms | {inline:>14.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+ジョブストアのベンチマーク
+ジョブ件数を 100 → 100,000 件と増やしても、1ジョブの状態更新にかかる時間が
+一定であることを確認する
+
+使い方:
+    python benchmarks/bench_job_store.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.job_store import JobStore
+
+
+JOB_COUNTS = [100, 1_000, 10_000, 100_000]
+UPDATES_PER_RUN = 500
+
+
+def make_job(i):
+    """ダミーのジョブを作成"""
+    return {
+        "id": f"job_bench_{i:06d}",
+        "type": "analysis",
+        "status": "completed",
+        "title": f"ベンチマーク記事 {i}",
+        "params": {"article_title": "", "article_content": "本文" * 50},
+        "result": None,
+        "error": None,
+        "created_at": datetime.datetime.now().isoformat(),
+        "started_at": None,
+        "completed_at": None,
+        "progress": 100
+    }
+
+
+def bench(job_count):
+    """job_count 件のストアで、進捗更新1回あたりの平均時間（ミリ秒）を返す"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(os.path.join(tmp, 'jobs.db'))
+        store.replace_all([make_job(i) for i in range(job_count)])
+
+        # 最新のジョブを実行中にして、進捗更新を繰り返す
+        target = f"job_bench_{job_count - 1:06d}"
+
+        def tick(progress):
+            def apply(job):
+                job['status'] = "running"
+                job['progress'] = progress
+            return apply
+
+        start = time.perf_counter()
+        for n in range(UPDATES_PER_RUN):
+            store.update(target, tick(n % 100))
+        elapsed = time.perf_counter() - start
+
+        store.close()
+        return elapsed / UPDATES_PER_RUN * 1000
+
+
+def main():
+    print(f"{'jobs':>10} | {'update (ms)':>12}")
+    print("-" * 27)
+    for job_count in JOB_COUNTS:
+        print(f"{job_count:>10,} | {bench(job_count):>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
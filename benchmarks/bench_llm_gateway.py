@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+LLMゲートウェイのベンチマーク
+呼び出しごとに Anthropic() を作る従来の方式と、共有ゲートウェイ（コネクション再利用）で
+1回あたりのオーバーヘッドを比較する
+
+使い方:
+    python benchmarks/bench_llm_gateway.py            # ローカルの疑似サーバーで計測（APIキー不要）
+    python benchmarks/bench_llm_gateway.py --live     # 実際のAPIで計測（ANTHROPIC_API_KEY が必要、TLSハンドシェイク込み）
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anthropic import Anthropic
+
+from utils import llm_gateway
+
+
+FAKE_RESPONSE = {
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": llm_gateway.DEFAULT_MODEL,
+    "content": [{"type": "text", "text": "OK"}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 5, "output_tokens": 1},
+}
+
+
+class _FakeMessagesHandler(BaseHTTPRequestHandler):
+    """/v1/messages に固定の応答を返す（keep-alive 対応）"""
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を1回で送る（分割送信による遅延ACK待ちを避ける）
+    wbufsize = 64 * 1024
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('content-length', 0)))
+        body = json.dumps(FAKE_RESPONSE).encode('utf-8')
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(call, iterations):
+    """call を iterations 回実行し、1回あたりの時間（ミリ秒）のリストを返す"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<28} mean {statistics.mean(timings):8.2f} ms | p50 {statistics.median(timings):8.2f} ms | max {max(timings):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--live', action='store_true', help="実際のAPIで計測する")
+    parser.add_argument('-n', '--iterations', type=int, default=None)
+    args = parser.parse_args()
+
+    server = None
+    if args.live:
+        api_key = os.environ['ANTHROPIC_API_KEY']
+        base_url = None
+        iterations = args.iterations or 10
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeMessagesHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_key = "sk-ant-bench"
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        iterations = args.iterations or 200
+
+    warnings.simplefilter('ignore', DeprecationWarning)
+    request = dict(model=llm_gateway.DEFAULT_MODEL, max_tokens=1, messages=[{"role": "user", "content": "Hi"}])
+
+    def per_call_client():
+        client = Anthropic(api_key=api_key, base_url=base_url, max_retries=0)
+        client.messages.create(**request)
+        client.close()
+
+    gateway = llm_gateway.get_gateway(api_key, base_url=base_url)
+
+    def shared_gateway():
+        gateway.complete("Hi", max_tokens=1)
+
+    # ウォームアップ（初回のプール作成・DNS解決を除外）
+    shared_gateway()
+
+    print(f"{'live API' if args.live else 'local fake server'} / {iterations} calls")
+    report("before: Anthropic() per call", measure(per_call_client, iterations))
+    report("after: shared gateway", measure(shared_gateway, iterations))
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
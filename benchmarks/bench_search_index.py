@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+検索インデックスのベンチマーク
+保存済みの分析を模したダミー文書を数万件登録し、検索1回にかかる時間と、
+保存・削除1件ごとのインデックス更新の時間を計測する
+
+使い方:
+    python benchmarks/bench_search_index.py
+    python benchmarks/bench_search_index.py --docs 50000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.search_index import SearchIndex
+
+
+PEOPLE = ["義母", "夫", "ママ友", "上司", "同僚", "元彼", "義姉", "隣人", "店員", "幼なじみ", "先輩", "担任", "大家", "親友", "義父"]
+PLACES = ["新居", "職場", "保育園", "実家", "ファミレス", "結婚式場", "マンションの集会所", "病院", "駅前のカフェ", "PTAの会合"]
+EVENTS = ["お金を要求された", "悪口を言いふらされた", "手柄を横取りされた", "約束をすっぽかされた", "浮気が発覚した",
+          "嘘の噂を流された", "勝手に合鍵を作られた", "SNSに写真を無断で載せられた", "借金を押し付けられた", "ランチ代を払わされた"]
+ENDINGS = ["証拠の録音を聞かせた", "親族の前で記録を見せた", "弁護士から内容証明を送った", "会社の上層部に報告した",
+           "本人の発言をそのまま読み上げた", "周囲がすべてを知っていたことが分かった"]
+
+QUERIES = ["義母", "ママ友 保育園", "内容証明", "夫 浮気", "合鍵", "親族の前で記録を見せた", "存在しない語句",
+           # 記事のタイトル・本文を貼り付けた長い検索語（見出し語が MAX_JOIN_TERMS を超える）
+           "主人公は職場で義母に浮気が発覚した。金額は120万円。最後に主人公は親族の前で記録を見せた。"]
+
+
+def make_document(rnd, i):
+    """ダミーの分析（タイトル・記事内容・テーマ）を作成"""
+    person, place = rnd.choice(PEOPLE), rnd.choice(PLACES)
+    sentences = []
+    for _ in range(rnd.randint(6, 12)):
+        sentences.append(f"主人公は{place}で{rnd.choice(PEOPLE)}に{rnd.choice(EVENTS)}。金額は{rnd.randint(1, 300)}万円。")
+    sentences.append(f"最後に主人公は{rnd.choice(ENDINGS)}。")
+    content = "\n".join(sentences)
+    return {
+        "id": f"ana_bench_{i:06d}",
+        "title": f"{person}に{rnd.choice(EVENTS)}話 #{i}",
+        "summary": content[:100],
+        "created_at": (datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i)).isoformat(),
+        "texts": [content, f"テーマ案: {person}への逆転劇（{rnd.choice(ENDINGS)}）"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検索インデックスのベンチマーク")
+    parser.add_argument('--docs', type=int, default=20_000, help="登録する文書数")
+    parser.add_argument('--repeat', type=int, default=20, help="検索語ごとの試行回数")
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, 'search_index.db'))
+
+        start = time.perf_counter()
+        index.rebuild("analysis", (make_document(rnd, i) for i in range(args.docs)))
+        print(f"{args.docs:,}件を登録: {time.perf_counter() - start:.1f} s "
+              f"（{os.path.getsize(os.path.join(tmp, 'search_index.db')) / 1024 / 1024:.0f} MB）")
+        print()
+
+        for query in QUERIES:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                hits = index.search("analysis", query, 50)
+                times.append((time.perf_counter() - start) * 1000)
+            times.sort()
+            p95 = times[max(0, int(len(times) * 0.95) - 1)]
+            print(f"{query[:16]:<16} 該当 {len(hits):3d}件（上位50件まで） | p50 {statistics.median(times):6.1f} ms | p95 {p95:6.1f} ms")
+
+        # 保存・削除ごとのインデックス更新
+        add_times, remove_times = [], []
+        for i in range(args.docs, args.docs + 100):
+            document = make_document(rnd, i)
+            start = time.perf_counter()
+            index.add("analysis", document)
+            add_times.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            index.remove("analysis", document['id'])
+            remove_times.append((time.perf_counter() - start) * 1000)
+        print()
+        print(f"1件の追加 p50 {statistics.median(add_times):.1f} ms | 1件の削除 p50 {statistics.median(remove_times):.1f} ms")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
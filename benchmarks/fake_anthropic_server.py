@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Anthropic API の疑似サーバー（オフライン検証・負荷試験用）
+Messages（通常・ストリーミング）と Message Batches（作成・状態確認・キャンセル・結果の取得）を実装し、
+記事分析・シナリオ生成・ネタメモのAI整理・バッチモードをAPIキーなしで動かせる
+
+使い方:
+    # サーバーとして起動し、アプリの接続先をこのサーバーに向ける
+    python benchmarks/fake_anthropic_server.py --port 8787 --latency 0.5 --tokens-per-second 80
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 ANTHROPIC_API_KEY=sk-fake LLM_BATCH_POLL_INTERVAL=2 streamlit run app.py
+
+    # 疑似サーバーに対して通常・ストリーミング・バッチの呼び出しを確認する
+    python benchmarks/fake_anthropic_server.py --check
+
+応答の内容:
+    - プロンプトに「JSON形式」を含む場合（ネタメモのAI整理）はカテゴリ分類のJSON
+    - 高速分析のプロンプトには「=== 基本分析 ===」「=== 深堀り分析 ===」の見出し付きの文章
+    - それ以外はプロンプトの先頭を含む固定の文章（--reply-chars で長さを指定できる）
+    - 応答が max_tokens を超える場合は切り詰めて stop_reason を max_tokens にする
+
+エラー:
+    - プロンプトに FAKE_ERROR を含むリクエストは、Messages では 400、バッチでは errored になる
+    - --error-rate の割合のリクエストは、Messages では 529（overloaded。再試行の対象）、バッチでは errored になる
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _now_iso(offset_seconds: float = 0) -> str:
+    moment = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=offset_seconds)
+    return moment.isoformat().replace('+00:00', 'Z')
+
+
+def _prompt_text(params) -> str:
+    """リクエストのユーザーメッセージを1つの文字列にまとめる"""
+    parts = []
+    for message in params.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get('text', '') for block in content or [])
+    return "\n".join(parts)
+
+
+def _count_tokens(text: str) -> int:
+    """トークン数の概算（日本語はおよそ2文字で1トークン）"""
+    return max(1, len(text) // 2)
+
+
+def fake_reply(params, reply_chars: int = 0) -> str:
+    """リクエストに対する疑似応答の本文（reply_chars を指定すると、その長さまで文章を繰り返す）"""
+    prompt = _prompt_text(params)
+    if "JSON形式" in prompt:
+        return json.dumps({
+            "category": "situations",
+            "element_name": "疑似サーバーの要素",
+            "additional_fields": {"description": "疑似サーバーが返した説明"},
+            "reasoning": "疑似サーバーの固定応答です"
+        }, ensure_ascii=False)
+
+    body = f"【疑似応答】{prompt.strip()[:40]}"
+    if reply_chars > len(body):
+        body = (body + "\n") * (reply_chars // (len(body) + 1) + 1)
+        body = body[:reply_chars]
+
+    if "=== 基本分析 ===" in prompt and "=== 深堀り分析 ===" in prompt:
+        return f"=== 基本分析 ===\n{body}\n\n=== 深堀り分析 ===\n{body}"
+    return body
+
+
+def _truncate(params, text: str):
+    """max_tokens を超える応答を切り詰める（本文, stop_reason）"""
+    max_chars = int(params.get('max_tokens', 4096)) * 2
+    if len(text) > max_chars:
+        return text[:max_chars], "max_tokens"
+    return text, "end_turn"
+
+
+def fake_message(params, text: str):
+    """Messages API の応答（Message）"""
+    text, stop_reason = _truncate(params, text)
+    return {
+        "id": f"msg_fake_{random.randrange(16 ** 12):012x}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get('model', 'claude-fake'),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": _count_tokens(_prompt_text(params)), "output_tokens": _count_tokens(text)},
+    }
+
+
+def fake_stream_events(params, text: str, chunk_chars: int = 8):
+    """ストリーミング応答の (イベント名, データ) の列"""
+    message = fake_message(params, text)
+    text = message['content'][0]['text']
+
+    yield "message_start", {
+        "type": "message_start",
+        "message": dict(message, content=[], stop_reason=None, usage=dict(message['usage'], output_tokens=0)),
+    }
+    yield "content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    for start in range(0, len(text), chunk_chars):
+        yield "content_block_delta", {
+            "type": "content_block_delta", "index": 0,
+            "delta": {"type": "text_delta", "text": text[start:start + chunk_chars]},
+        }
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message['stop_reason'], "stop_sequence": None},
+        "usage": {"output_tokens": message['usage']['output_tokens']},
+    }
+    yield "message_stop", {"type": "message_stop"}
+
+
+class FakeAnthropicState:
+    """作成されたバッチの状態（サーバー内で共有）"""
+
+    def __init__(self, batch_delay: float = 1.0, error_rate: float = 0.0, latency: float = 0.0, tokens_per_second: float = 0.0, reply_chars: int = 0):
+        """
+        Args:
+            batch_delay: バッチが完了するまでの秒数
+            error_rate: エラーにするリクエストの割合（0〜1）
+            latency: Messages の応答（ストリーミングでは最初のイベント）までの秒数
+            tokens_per_second: 出力の速度（0 なら待たずに返す）
+            reply_chars: 応答本文の長さ（0 なら短い固定の文章）
+        """
+        self.batch_delay = batch_delay
+        self.error_rate = error_rate
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_chars = reply_chars
+        self.batches = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def create_batch(self, requests):
+        with self.lock:
+            batch_id = f"msgbatch_fake_{next(self._ids):06d}"
+            self.batches[batch_id] = {
+                "requests": requests,
+                "created": time.monotonic(),
+                "created_at": _now_iso(),
+                "canceled": False,
+                "results": None,
+            }
+            return batch_id
+
+    def _finish(self, batch):
+        """バッチの結果を確定する（キャンセル済みなら残りは canceled）"""
+        if batch['results'] is not None:
+            return
+        results = []
+        for request in batch['requests']:
+            params = request.get('params', {})
+            if batch['canceled']:
+                result = {"type": "canceled"}
+            elif "FAKE_ERROR" in _prompt_text(params) or random.random() < self.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "疑似サーバーのエラー"}}}
+            else:
+                result = {"type": "succeeded", "message": fake_message(params, fake_reply(params, self.reply_chars))}
+            results.append({"custom_id": request['custom_id'], "result": result})
+        batch['results'] = results
+        batch['ended_at'] = _now_iso()
+
+    def describe(self, batch_id, base_url):
+        """バッチの状態（MessageBatch）"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch['canceled'] or time.monotonic() - batch['created'] >= self.batch_delay:
+                self._finish(batch)
+
+            ended = batch['results'] is not None
+            counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+            if ended:
+                for entry in batch['results']:
+                    counts[entry['result']['type']] += 1
+            else:
+                counts['processing'] = len(batch['requests'])
+
+            return {
+                "id": batch_id,
+                "type": "message_batch",
+                "processing_status": "ended" if ended else ("canceling" if batch['canceled'] else "in_progress"),
+                "request_counts": counts,
+                "created_at": batch['created_at'],
+                "expires_at": _now_iso(24 * 60 * 60),
+                "ended_at": batch.get('ended_at'),
+                "archived_at": None,
+                "cancel_initiated_at": batch.get('cancel_initiated_at'),
+                "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+            }
+
+    def cancel(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is not None and batch['results'] is None:
+                batch['canceled'] = True
+                batch['cancel_initiated_at'] = _now_iso()
+
+    def results(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            return None if batch is None else batch['results']
+
+
+def make_handler(state: FakeAnthropicState):
+    class _FakeAnthropicHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # ヘッダーと本文を1回で送る（分割送信による遅延ACK待ちを避ける）
+        wbufsize = 64 * 1024
+
+        def _base_url(self):
+            host, port = self.server.server_address[:2]
+            return f"http://{host}:{port}"
+
+        def _send(self, status, body, content_type='application/json'):
+            data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('content-type', content_type)
+            self.send_header('content-length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_found(self):
+            self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+
+        def _send_error(self, status, error_type, message):
+            self._send(status, {"type": "error", "error": {"type": error_type, "message": message}})
+
+        def _write_chunk(self, data: bytes):
+            """chunked 形式で1つの断片を送る"""
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def _messages(self, body):
+            """Messages API（stream=true ならSSEで少しずつ返す）"""
+            if "FAKE_ERROR" in _prompt_text(body):
+                self._send_error(400, "invalid_request_error", "疑似サーバーのエラー（FAKE_ERROR）")
+                return
+            if random.random() < state.error_rate:
+                self._send_error(529, "overloaded_error", "疑似サーバーの過負荷")
+                return
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            text = fake_reply(body, state.reply_chars)
+            if not body.get('stream'):
+                message = fake_message(body, text)
+                if state.tokens_per_second:
+                    time.sleep(message['usage']['output_tokens'] / state.tokens_per_second)
+                self._send(200, message)
+                return
+
+            self.send_response(200)
+            self.send_header('content-type', 'text/event-stream')
+            self.send_header('transfer-encoding', 'chunked')
+            self.end_headers()
+            try:
+                for event, data in fake_stream_events(body, text):
+                    if state.tokens_per_second and event == "content_block_delta":
+                        time.sleep(_count_tokens(data['delta']['text']) / state.tokens_per_second)
+                    payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    self._write_chunk(payload.encode('utf-8'))
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # クライアントが受信途中で切断した（キャンセル時は意図した動作）ので、黙って応答を終える
+                self.close_connection = True
+
+        def _read_json(self):
+            length = int(self.headers.get('content-length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_POST(self):
+            path = urlparse(self.path).path.rstrip('/')
+            body = self._read_json()
+
+            if path == "/v1/messages":
+                self._messages(body)
+            elif path == "/v1/messages/batches":
+                batch_id = state.create_batch(body.get('requests', []))
+                self._send(200, state.describe(batch_id, self._base_url()))
+            elif path.startswith("/v1/messages/batches/") and path.endswith("/cancel"):
+                batch_id = path.split('/')[-2]
+                state.cancel(batch_id)
+                described = state.describe(batch_id, self._base_url())
+                self._send(200, described) if described else self._not_found()
+            else:
+                self._not_found()
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip('/')
+
+            if path.startswith("/v1/messages/batches/") and path.endswith("/results"):
+                results = state.results(path.split('/')[-2])
+                if results is None:
+                    self._not_found()
+                    return
+                lines = "\n".join(json.dumps(entry, ensure_ascii=False) for entry in results) + "\n"
+                self._send(200, lines.encode('utf-8'), content_type='application/binary')
+            elif path.startswith("/v1/messages/batches/"):
+                described = state.describe(path.split('/')[-1], self._base_url())
+                self._send(200, described) if described else self._not_found()
+            else:
+                self._not_found()
+
+        def log_message(self, *args):
+            pass
+
+    return _FakeAnthropicHandler
+
+
+class _FakeAnthropicServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        """クライアントの切断（ストリーミングのキャンセルなど）はトレースバックを出さない"""
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_server(port: int = 0, **options) -> ThreadingHTTPServer:
+    """
+    疑似サーバーをバックグラウンドスレッドで起動する（port=0 なら空いているポート）
+
+    Args:
+        **options: FakeAnthropicState の引数（batch_delay / error_rate / latency / tokens_per_second / reply_chars）
+    """
+    state = FakeAnthropicState(**options)
+    server = _FakeAnthropicServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check(**options):
+    """疑似サーバーに対して通常・ストリーミング・バッチの呼び出しと、応答の記録・再生を確認する"""
+    import tempfile
+
+    from utils import llm_gateway, llm_transport
+    from utils.retry_policy import RetryPolicy
+
+    # --error-rate の 529 は再試行で吸収する
+    retry_policy = RetryPolicy(max_attempts=20, base_delay=0.05, max_delay=0.2)
+
+    server = start_server(**options)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    gateway = llm_gateway.LLMGateway("sk-fake", base_url=base_url)
+
+    # 通常・ストリーミング
+    completion = gateway.complete("こんにちは", max_tokens=100, retry_policy=retry_policy)
+    print(f"complete: {completion.text[:30]!r} {completion.usage}")
+    chunks = []
+    streamed = gateway.stream("こんにちは", on_text=chunks.append, max_tokens=100, retry_policy=retry_policy, on_retry=lambda *_: chunks.clear())
+    print(f"stream: {len(chunks)}回に分けて受信 {streamed.stop_reason}")
+    assert streamed.text == completion.text, "ストリーミングと通常の応答が一致しません"
+
+    try:
+        gateway.complete("FAKE_ERROR", max_tokens=100)
+        raise AssertionError("FAKE_ERROR のリクエストが失敗になっていません")
+    except Exception as e:
+        assert getattr(e, 'status_code', None) == 400, e
+
+    # バッチ
+    requests = {
+        f"note-{index}": {"prompt": f"必ずJSON形式で返答してください ネタメモ{index}", "max_tokens": 100}
+        for index in range(20)
+    }
+    requests["note-error"] = {"prompt": "FAKE_ERROR", "max_tokens": 100}
+
+    start = time.perf_counter()
+    results = gateway.run_batch(
+        requests,
+        poll_interval=0.2,
+        on_poll=lambda status: print(f"  {status['processing_status']}: {status['request_counts']}")
+    )
+    elapsed = time.perf_counter() - start
+
+    succeeded = [cid for cid, result in results.items() if not isinstance(result, Exception)]
+    errored = [cid for cid, result in results.items() if isinstance(result, Exception)]
+    print(f"バッチ: {len(results)}件（成功 {len(succeeded)}件 / 失敗 {len(errored)}件）{elapsed:.1f}秒")
+
+    assert set(results) == set(requests), "custom_id と結果が対応していません"
+    assert "note-error" in errored, "FAKE_ERROR のリクエストが失敗になっていません"
+
+    # 記録 → サーバーを止めて再生
+    with tempfile.TemporaryDirectory() as fixtures_dir:
+        recorder = llm_gateway.LLMGateway("sk-fake", base_url=base_url, transport=llm_transport.RecordingTransport(fixtures_dir))
+        recorded = recorder.stream("記録と再生の確認", max_tokens=100, retry_policy=retry_policy)
+        server.shutdown()
+
+        player = llm_gateway.LLMGateway("sk-fake", base_url=base_url, transport=llm_transport.ReplayTransport(fixtures_dir))
+        replayed = player.stream("記録と再生の確認", max_tokens=100)
+        assert (replayed.text, replayed.usage) == (recorded.text, recorded.usage), "再生した応答が記録と一致しません"
+        print(f"記録・再生: {len(os.listdir(fixtures_dir))}件のフィクスチャから同じ応答を再生")
+
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anthropic API の疑似サーバー")
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--batch-delay', type=float, default=1.0, help="バッチが完了するまでの秒数")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="エラーにするリクエストの割合（0〜1）")
+    parser.add_argument('--latency', type=float, default=0.0, help="応答（ストリーミングでは最初のイベント）までの秒数")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help="出力の速度（0 なら待たない）")
+    parser.add_argument('--reply-chars', type=int, default=0, help="応答本文の長さ（0 なら短い固定の文章）")
+    parser.add_argument('--check', action='store_true', help="疑似サーバーに対して各APIの動作を確認して終了する")
+    args = parser.parse_args()
+
+    options = dict(
+        batch_delay=args.batch_delay,
+        error_rate=args.error_rate,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        reply_chars=args.reply_chars,
+    )
+    if args.check:
+        check(**options)
+        return
+
+    server = start_server(port=args.port, **options)
+    print(f"疑似サーバーを起動しました: http://127.0.0.1:{server.server_address[1]}")
+    print("Ctrl+C で終了")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+ストレージのマルチプロセス負荷テスト
+複数プロセスから同時にジョブの作成・更新・削除と分析履歴（AnalysisStore）の durable な保存・削除を行い、
+別の複数プロセスから同時に分析履歴の一覧・詳細を読み続ける。
+読み込み中に壊れた行・欠けた行が見えないこと、最後にデータが壊れていないこと・件数が合っていることを確認する
+
+使い方:
+    python benchmarks/stress_storage.py [書き込むプロセス数] [1プロセスあたりの操作回数] [読み込むプロセス数]
+"""
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.analysis_store import AnalysisStore
+from utils.job_store import JobStore
+from utils.telemetry import percentile
+
+
+# 一覧の1ページの件数（分析履歴の画面と同じ）
+PAGE_SIZE = 5
+
+
+def make_analysis(worker_id, i, job_id):
+    """ダミーの分析を作成（本文は blob の参照を模す）"""
+    return {
+        "id": f"ana_{worker_id}_{i}",
+        "job_id": job_id,
+        "title": f"stress {worker_id}-{i}",
+        "summary": "本文" * 50,
+        "content": {"blob": f"{worker_id:02d}{i:04d}".ljust(64, '0'), "size": 4000},
+        "stage_metrics": {},
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+
+
+def writer(worker_id, iterations, jobs_db_path, history_db_path, results):
+    """1プロセス分の書き込みの負荷をかける（分析の保存は durable で、戻った時点でディスクにある）"""
+    jobs = JobStore(jobs_db_path)
+    history = AnalysisStore(history_db_path)
+    waits = []
+
+    for i in range(iterations):
+        job_id = f"job_{worker_id}_{i}"
+        jobs.insert({
+            "id": job_id,
+            "type": "analysis",
+            "status": "pending",
+            "title": f"stress {worker_id}-{i}",
+            "params": {},
+            "result": None,
+            "error": None,
+            "created_at": datetime.datetime.now().isoformat(),
+            "started_at": None,
+            "completed_at": None,
+            "progress": 0
+        })
+
+        for progress in (10, 40, 70, 100):
+            def apply(job, progress=progress):
+                job['status'] = "completed" if progress == 100 else "running"
+                job['progress'] = progress
+            jobs.update(job_id, apply)
+
+        start = time.perf_counter()
+        history.insert(make_analysis(worker_id, i, job_id), durable=True)
+        waits.append(time.perf_counter() - start)
+
+        # 偶数番目は削除する
+        if i % 2 == 0:
+            jobs.delete(job_id)
+            history.delete(f"ana_{worker_id}_{i}")
+
+    jobs.close()
+    history.close()
+    results.put(("writer", waits))
+
+
+def reader(history_db_path, stop, results):
+    """
+    書き込みが終わるまで一覧・詳細を読み続ける
+    一覧に出た行は列が揃っていること、削除しない分析（奇数番目）は一覧に出たあと詳細も読めることを確認する
+    """
+    history = AnalysisStore(history_db_path)
+    reads = 0
+    errors = []
+
+    while not stop.is_set():
+        # 先頭から順にページをめくる
+        offset = (reads * PAGE_SIZE) % max(history.count(), 1)
+        for row in history.list_page(PAGE_SIZE, offset):
+            if set(row) != {"id", "title", "summary", "created_at"} or not row['title'] or not row['summary']:
+                errors.append(f"一覧の行が不正: {row}")
+                continue
+            analysis = history.get(row['id'])
+            if analysis is None:
+                if int(row['id'].rsplit('_', 1)[1]) % 2 == 1:
+                    errors.append(f"一覧にある分析が読めません: {row['id']}")
+            elif analysis['title'] != row['title'] or 'content' not in analysis:
+                errors.append(f"詳細が一覧と一致しません: {row['id']}")
+        reads += 1
+
+    history.close()
+    results.put(("reader", (reads, errors[:10])))
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs_db_path = os.path.join(tmp, 'jobs.db')
+        history_db_path = os.path.join(tmp, 'analysis_history.db')
+
+        # スキーマは先に作っておく（読み込むプロセスが空のデータベースを作らないように）
+        AnalysisStore(history_db_path).close()
+
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        reader_procs = [
+            multiprocessing.Process(target=reader, args=(history_db_path, stop, results))
+            for _ in range(readers)
+        ]
+        writer_procs = [
+            multiprocessing.Process(target=writer, args=(n, iterations, jobs_db_path, history_db_path, results))
+            for n in range(processes)
+        ]
+
+        start = time.perf_counter()
+        for p in reader_procs + writer_procs:
+            p.start()
+
+        waits, reads, read_errors = [], 0, []
+        for _ in writer_procs:
+            _, value = results.get()
+            waits.extend(value)
+        for p in writer_procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for _ in reader_procs:
+            _, (count, errors) = results.get()
+            reads += count
+            read_errors.extend(errors)
+        for p in reader_procs:
+            p.join()
+
+        failed = [p.exitcode for p in reader_procs + writer_procs if p.exitcode != 0]
+        expected = processes * (iterations - (iterations + 1) // 2)
+        expected_ids = {f"ana_{n}_{i}" for n in range(processes) for i in range(1, iterations, 2)}
+
+        jobs = JobStore(jobs_db_path).list()
+        history = AnalysisStore(history_db_path)
+        saved_ids = {analysis['id'] for analysis in history.iter_all()}
+        saved_count = history.count()
+        history.close()
+
+        ok = True
+        if failed:
+            print(f"❌ 異常終了したプロセス: {len(failed)}件")
+            ok = False
+        if len(jobs) != expected or any(j['status'] != 'completed' or j['progress'] != 100 for j in jobs):
+            print(f"❌ ジョブ件数または状態が不正: {len(jobs)}件（期待値 {expected}件）")
+            ok = False
+        if saved_count != expected or saved_ids != expected_ids:
+            print(f"❌ 履歴件数が不正: {saved_count}件（期待値 {expected}件）")
+            ok = False
+        if read_errors:
+            print("❌ 読み込み中に不正な履歴が見えました:")
+            for error in read_errors:
+                print(f"   {error}")
+            ok = False
+
+        print(f"書き込み {processes}プロセス × {iterations}回 ＋ 読み込み {readers}プロセス: {elapsed:.2f}秒")
+        print(f"  durable な保存の待ち時間: p50 {percentile(waits, 50) * 1000:.1f}ms / p95 {percentile(waits, 95) * 1000:.1f}ms")
+        print(f"  一覧・詳細の読み込み: {reads}回（{reads / elapsed:.0f}回/秒）")
+        print("✅ データの破損・欠落はありません" if ok else "❌ 整合性チェックに失敗しました")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,95 +2,135 @@
 記事分析＆ネタ展開ページ
 """
 import streamlit as st
-from anthropic import Anthropic
-import os
-import json
 import datetime
 import time
 from utils.prompt_library import PromptLibrary
 from utils import job_manager
+from utils import telemetry
+from utils import analysis_history
+from utils.ids import new_id
+from utils.blob_store import resolve_fields
+
+
+# blob に保存する本文フィールド
+ANALYSIS_BODY_FIELDS = ['content', 'basic_analysis', 'deep_analysis', 'themes']
+
+# 分析一覧の1ページあたりの件数
+ANALYSES_PER_PAGE = 5
+
+# 検索結果として表示する最大件数
+SEARCH_RESULT_LIMIT = 50
+
+# 実行中ジョブパネルの自動更新間隔（秒）
+JOB_PANEL_REFRESH_SECONDS = 2
+
+
+# まとめて分析で記事を区切る行
+BULK_ARTICLE_SEPARATOR = "===="
+
+# 処理時間の内訳に表示するステージ名
+STAGE_LABELS = {
+    "basic_analysis": "基本分析",
+    "deep_analysis": "深堀り分析",
+    "fast_analysis": "高速分析",
+    "themes": "テーマ生成",
+    "note_organization": "ネタメモのAI整理",
+    "theme_suggestions": "新テーマ提案",
+    "scenario_generation": "シナリオ生成",
+}
+
+# 「ステージごとの処理時間」で集計する直近の呼び出し数
+METRICS_SUMMARY_LIMIT = 1000
+
+
+def _stage_label(stage):
+    """ステージの表示名（テーマ生成の「themes:6」は「テーマ生成（6個）」）"""
+    name, _, num_themes = (stage or "").partition(':')
+    label = STAGE_LABELS.get(name, name)
+    return f"{label}（{num_themes}個）" if num_themes else label
+
+
+def _format_seconds(seconds):
+    return f"{seconds:.1f}秒" if seconds is not None else "-"
+
+
+def _render_stage_breakdown(stage_metrics):
+    """1件の分析のステージごとの処理時間・トークン数を表で表示"""
+    rows = []
+    for stage, metrics in stage_metrics.items():
+        rows.append({
+            "ステージ": _stage_label(stage),
+            "処理時間": _format_seconds(metrics.get('seconds')),
+            "最初の出力まで": _format_seconds(metrics.get('ttft_seconds')),
+            "入力トークン": metrics.get('input_tokens', 0),
+            "キャッシュ読み込み": metrics.get('cache_read_input_tokens', 0),
+            "出力トークン": metrics.get('output_tokens', 0),
+            "再試行": metrics.get('retries', 0),
+            "応答キャッシュ": "利用" if metrics.get('response_cache') == "hit" else "",
+            "モデル": metrics.get('model') or "",
+        })
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def _render_metrics_summary():
+    """直近の呼び出しをステージ・プロンプトのバージョンごとに集計して表示"""
+    rows = telemetry.summarize(telemetry.read_entries(limit=METRICS_SUMMARY_LIMIT))
+    if not rows:
+        st.info("まだ計測結果がありません。分析を実行すると記録されます。")
+        return
+
+    st.dataframe([
+        {
+            "ステージ": _stage_label(row['stage']),
+            "プロンプト": (row['template_version'] or "-")[:8],
+            "呼び出し": row['calls'],
+            "キャッシュ": row['cache_hits'],
+            "処理時間 p50": _format_seconds(row['p50_seconds']),
+            "処理時間 p95": _format_seconds(row['p95_seconds']),
+            "最初の出力 p50": _format_seconds(row['p50_ttft_seconds']),
+            "平均入力": row['avg_input_tokens'],
+            "平均キャッシュ読み込み": row['avg_cache_read_tokens'],
+            "平均出力": row['avg_output_tokens'],
+            "再試行": row['retries'],
+            "最終": datetime.datetime.fromisoformat(row['last_at']).strftime('%m/%d %H:%M') if row['last_at'] else "-",
+        }
+        for row in rows
+    ], use_container_width=True, hide_index=True)
+    st.caption(f"直近{METRICS_SUMMARY_LIMIT}回の呼び出しを集計。プロンプトを編集するとバージョンが変わり、別の行に集計されます。")
+
+
+def _parse_bulk_articles(text):
+    """
+    まとめて分析の入力を記事ごとに分ける
+    「====」だけの行で区切り、各記事の1行目をタイトル、2行目以降を内容とする
+
+    Returns:
+        list: [(タイトル, 内容), ...]
+    """
+    articles = []
+    block = []
+    for line in text.splitlines() + [BULK_ARTICLE_SEPARATOR]:
+        if line.strip() == BULK_ARTICLE_SEPARATOR:
+            lines = list(block)
+            while lines and not lines[0].strip():
+                lines.pop(0)
+            if lines:
+                title = lines[0].strip()
+                content = "\n".join(lines[1:]).strip()
+                if content:
+                    articles.append((title, content))
+            block = []
+        else:
+            block.append(line)
+    return articles
 
 
-# 分析履歴のファイルパス
-ANALYSIS_HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'analysis_history.json')
-
-
-def load_analysis_history():
-    """分析履歴を読み込む"""
-    try:
-        with open(ANALYSIS_HISTORY_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"version": "1.0.0", "last_updated": datetime.datetime.now().strftime("%Y-%m-%d"), "analyses": []}
-
-
-def save_analysis_history(data):
-    """分析履歴を保存する"""
-    data['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d")
-    # ディレクトリが存在しない場合は作成
-    os.makedirs(os.path.dirname(ANALYSIS_HISTORY_PATH), exist_ok=True)
-    with open(ANALYSIS_HISTORY_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
-def save_analysis(title, content, basic_analysis, deep_analysis, themes=None):
-    """分析結果を保存する"""
-    history = load_analysis_history()
-
-    # 新しい分析IDを生成
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    analysis_id = f"ana_{timestamp}"
-
-    # タイトルが空の場合、記事内容の最初の50文字を使用
-    if not title or title.strip() == "":
-        # 改行やタブを除去して最初の50文字を取得
-        clean_content = content.replace('\n', ' ').replace('\t', ' ').strip()
-        title = clean_content[:50] + "..." if len(clean_content) > 50 else clean_content
-
-    # 要約を生成（記事内容の最初の100文字）
-    summary = content[:100] + "..." if len(content) > 100 else content
-
-    # 新しい分析データを作成
-    new_analysis = {
-        "id": analysis_id,
-        "title": title,
-        "content": content,
-        "summary": summary,
-        "basic_analysis": basic_analysis,
-        "deep_analysis": deep_analysis,
-        "themes": themes,
-        "created_at": datetime.datetime.now().isoformat(),
-    }
-
-    # 履歴に追加（最新が先頭）
-    history['analyses'].insert(0, new_analysis)
-
-    # 保存
-    save_analysis_history(history)
-
-    return analysis_id
-
-
-def delete_analysis(analysis_id):
-    """指定されたIDの分析を削除する"""
-    history = load_analysis_history()
-    history['analyses'] = [a for a in history['analyses'] if a['id'] != analysis_id]
-    save_analysis_history(history)
-
-
-def render_article_analysis_page(api_key):
-    """記事ネタ提案ページを表示"""
-
-    # APIキーのトリム処理（余分な空白や改行を削除）
-    if api_key:
-        api_key = api_key.strip()
-
-    # プロンプトライブラリの初期化
-    prompts = PromptLibrary()
-
-    # ========== 実行中のジョブを表示 ==========
-    running_jobs = job_manager.get_running_jobs()
-    running_analysis_jobs = [j for j in running_jobs if j['type'] == 'analysis']
+def _render_running_jobs_panel():
+    """実行中のジョブ一覧（フラグメントとして定期的に再描画される）"""
+    # 変更がなければメモリ上のスナップショットをそのまま使う
+    snapshot = job_manager.get_jobs_snapshot()
+    running_analysis_jobs = [j for j in snapshot['running'] if j['type'] == 'analysis']
+    batch_jobs = {j['id']: j for j in snapshot['running'] if j['type'] == 'analysis_batch'}
 
     if running_analysis_jobs:
         st.info(f"🔄 {len(running_analysis_jobs)}件の分析が実行中です")
@@ -108,24 +148,85 @@ def render_article_analysis_page(api_key):
                         'pending': '⏳ 待機中',
                         'running': '🔄 実行中',
                     }.get(job['status'], job['status'])
+                    if job['status'] == 'pending':
+                        position = job_manager.get_queue_position(job['id'])
+                        if position:
+                            status_text += f"（{position}番目）"
                     st.caption(f"{status_text} ({job['progress']}%)")
 
+                    if (job.get('params') or {}).get('analysis_mode') == "fast":
+                        st.caption("⚡ 高速モード")
+
+                    # まとめて分析（Message Batches）の記事は、バッチの処理状況を表示
+                    batch_job = batch_jobs.get((job.get('params') or {}).get('batch_job_id'))
+                    if batch_job and batch_job.get('batch'):
+                        counts = batch_job['batch'].get('request_counts') or {}
+                        finished = sum(v for k, v in counts.items() if k != 'processing')
+                        st.caption(f"📦 バッチ処理中（{finished}/{finished + counts.get('processing', 0)}件）")
+                    elif batch_job:
+                        st.caption("📦 バッチ送信待ち")
+
+                    # 完了したステージの処理時間
+                    stage_times = [
+                        f"{_stage_label(stage)} {_format_seconds(metrics.get('seconds'))}"
+                        for stage, metrics in (job.get('usage') or {}).items()
+                    ]
+                    if stage_times:
+                        st.caption("⏱️ " + " / ".join(stage_times))
+
+                    # 一時的なエラーで再試行している場合
+                    retry_count = sum(info['attempts'] - 1 for info in (job.get('retries') or {}).values())
+                    if retry_count:
+                        st.caption(f"🔁 再試行 {retry_count}回")
+
+                    # max_tokens の上限で出力が途切れたステージ
+                    if job.get('truncated'):
+                        st.caption(f"✂️ 出力が上限で途切れました（{', '.join(job['truncated'])}）")
+
+                    # 同じ記事の分析結果を応答キャッシュから再利用したステージ
+                    cache_hits = sum(1 for status in (job.get('response_cache') or {}).values() if status == "hit")
+                    if cache_hits:
+                        st.caption(f"💾 キャッシュ利用 {cache_hits}件")
+
                 with col3:
                     if st.button("🗑️", key=f"cancel_{job['id']}", help="キャンセル"):
-                        job_manager.delete_job(job['id'])
+                        job_manager.cancel_job(job['id'])
                         st.rerun()
 
                 st.markdown("---")
 
-            # 自動更新（5秒ごと）
-            if st.button("🔄 状態を更新"):
-                st.rerun()
+            st.caption("💡 進捗は自動で更新されます。ページを離れても処理は継続され、完了すると自動的に「保存済みの記事ネタ提案」に保存されます。")
+
+    # ジョブが完了・失敗したらページ全体を更新して、履歴や失敗一覧に反映する
+    running_ids = {job['id'] for job in running_analysis_jobs}
+    previous_ids = st.session_state.get('running_analysis_job_ids', set())
+    st.session_state.running_analysis_job_ids = running_ids
+    if previous_ids - running_ids:
+        st.rerun()
+
+
+def render_article_analysis_page(api_key):
+    """記事ネタ提案ページを表示"""
+
+    # APIキーのトリム処理（余分な空白や改行を削除）
+    if api_key:
+        api_key = api_key.strip()
+
+    # プロンプトライブラリの初期化
+    prompts = PromptLibrary()
 
-            st.caption("💡 ページを離れても処理は継続されます。完了すると自動的に「保存済みの記事ネタ提案」に保存されます。")
+    # ========== 実行中のジョブを表示 ==========
+    # ジョブ一覧はメモリ上のスナップショットから取得（ディスクは読まない）
+    snapshot = job_manager.get_jobs_snapshot()
+    has_running = any(j['type'] == 'analysis' for j in snapshot['running'])
+
+    # 実行中のジョブがある間だけ、パネル部分のみを定期的に再描画する
+    # （描画は変更バージョンごとのスナップショットから行い、変更がなければジョブストアは SNAPSHOT_MAX_AGE 秒に1回しか読まない。
+    #   フラグメントは描画を省くと表示が消え、変更を待って止めるとキャンセルのボタンが効かなくなるため、一定間隔で再描画する）
+    st.fragment(run_every=JOB_PANEL_REFRESH_SECONDS if has_running else None)(_render_running_jobs_panel)()
 
     # 失敗したジョブを表示
-    all_jobs = job_manager.load_jobs()
-    failed_analysis_jobs = [j for j in all_jobs['jobs'] if j['type'] == 'analysis' and j['status'] == 'failed']
+    failed_analysis_jobs = [j for j in snapshot['failed'] if j['type'] == 'analysis']
 
     if failed_analysis_jobs:
         st.error(f"❌ {len(failed_analysis_jobs)}件のジョブが失敗しました")
@@ -169,6 +270,20 @@ def render_article_analysis_page(api_key):
         help="記事の要約やあらすじを入力してください。詳細でなくても大丈夫です。"
     )
 
+    force_refresh = st.checkbox(
+        "🔄 キャッシュを使わずに分析し直す",
+        value=False,
+        help="同じ記事を分析したことがある場合、通常は保存済みの結果を再利用します。チェックするとClaudeに問い合わせ直します。"
+    )
+
+    analysis_mode = st.radio(
+        "分析モード",
+        options=list(job_manager.ANALYSIS_MODES),
+        format_func=job_manager.ANALYSIS_MODES.get,
+        horizontal=True,
+        help="高速モードは基本分析と深堀り分析を1回の問い合わせでまとめて行います。待ち時間と入力トークンが減りますが、深堀り分析は標準モードより簡潔になることがあります。"
+    )
+
     # 分析実行
     col1, col2 = st.columns([3, 1])
 
@@ -176,7 +291,7 @@ def render_article_analysis_page(api_key):
         analyze_button = st.button("🔍 この記事を分析", use_container_width=True, type="primary")
 
     with col2:
-        st.caption("所要時間: 約30秒")
+        st.caption("所要時間: 約20秒" if analysis_mode == "fast" else "所要時間: 約30秒")
 
     # 分析実行
     if analyze_button:
@@ -193,7 +308,11 @@ def render_article_analysis_page(api_key):
                     title=job_title,
                     params={
                         "article_title": article_title,
-                        "article_content": article_content
+                        "article_content": article_content,
+                        "auto_generate_themes": True,
+                        "num_themes": 6,
+                        "force_refresh": force_refresh,
+                        "analysis_mode": analysis_mode
                     }
                 )
 
@@ -205,7 +324,9 @@ def render_article_analysis_page(api_key):
                     article_content=article_content,
                     prompts=prompts,
                     auto_generate_themes=True,
-                    num_themes=6
+                    num_themes=6,
+                    force_refresh=force_refresh,
+                    analysis_mode=analysis_mode
                 )
 
                 st.success(f"✅ 分析とテーマ生成（6個）をバックグラウンドで開始しました！")
@@ -218,19 +339,99 @@ def render_article_analysis_page(api_key):
             except Exception as e:
                 st.error(f"ジョブの作成中にエラーが発生しました: {e}")
 
+    # ========== まとめて分析（Message Batches） ==========
+    with st.expander("📦 まとめて分析（バッチモード）", expanded=False):
+        st.caption(
+            "たまったヒット記事を夜間などにまとめて分析します。料金は通常の半額ですが、"
+            "完了までに時間がかかります（最大24時間）。完了した記事から「保存済みの記事ネタ提案」に保存されます。"
+        )
+        bulk_text = st.text_area(
+            "記事（「====」だけの行で区切り、各記事の1行目をタイトルにしてください）",
+            placeholder="""【衝撃】月収20万で義母に50万要求された
+主人公は30代主婦。義母が突然「新築祝いに50万円ちょうだい」と言ってきた...
+====
+元カレの結婚式に呼ばれた話
+主人公は20代会社員。別れた元カレから結婚式の招待状が届き...""",
+            height=200,
+            key="bulk_articles"
+        )
+        bulk_articles = _parse_bulk_articles(bulk_text) if bulk_text else []
+        if bulk_articles:
+            st.write(f"**{len(bulk_articles)}件の記事**")
+
+        bulk_generate_themes = st.checkbox(
+            "🎯 テーマ（6個）も生成する",
+            value=True,
+            key="bulk_generate_themes",
+            help="チェックを外すと基本分析・深堀り分析だけを行います（テーマ生成の分の料金がかかりません）"
+        )
+
+        if st.button("📦 バッチで分析を開始", disabled=not bulk_articles):
+            if not api_key:
+                st.error("⚠️ API Keyが設定されていません。「⚙️ 設定」から設定してください。")
+            else:
+                try:
+                    # バッチ全体を実行するジョブと、記事ごとのジョブ（進捗・結果の保存先）を作成
+                    batch_job_id = new_id("job")
+                    job_ids = []
+                    for title, content in bulk_articles:
+                        job_ids.append(job_manager.create_job(
+                            job_type="analysis",
+                            title=title or f"記事分析 {datetime.datetime.now().strftime('%m/%d %H:%M')}",
+                            params={
+                                "article_title": title,
+                                "article_content": content,
+                                "auto_generate_themes": bulk_generate_themes,
+                                "num_themes": 6,
+                                "force_refresh": force_refresh,
+                                "batch_job_id": batch_job_id
+                            }
+                        ))
+
+                    job_manager.create_job(
+                        job_type="analysis_batch",
+                        title=f"まとめて分析 {len(job_ids)}件",
+                        params={
+                            "job_ids": job_ids,
+                            "num_themes": 6,
+                            "force_refresh": force_refresh,
+                            "auto_generate_themes": bulk_generate_themes
+                        },
+                        job_id=batch_job_id
+                    )
+                    job_manager.start_article_analysis_batch_job(
+                        job_id=batch_job_id,
+                        api_key=api_key,
+                        job_ids=job_ids,
+                        prompts=prompts,
+                        num_themes=6,
+                        force_refresh=force_refresh,
+                        auto_generate_themes=bulk_generate_themes
+                    )
+
+                    st.success(f"✅ {len(job_ids)}件の記事をバッチで分析します")
+                    time.sleep(1)
+                    st.rerun()
+
+                except Exception as e:
+                    st.error(f"ジョブの作成中にエラーが発生しました: {e}")
+
+    # ========== ステージごとの処理時間 ==========
+    with st.expander("⏱️ ステージごとの処理時間", expanded=False):
+        _render_metrics_summary()
+
     st.markdown("---")
 
     # ========== 保存済みの履歴 ==========
     st.subheader("📚 保存済みの記事ネタ提案")
 
-    # 履歴を読み込み
-    history = load_analysis_history()
-    analyses = history.get('analyses', [])
+    # 件数だけを数え、一覧は表示するページの行だけを読み込む
+    total_analyses = analysis_history.count_analyses()
 
-    if not analyses:
+    if total_analyses == 0:
         st.info("保存された分析はまだありません。上の入力フォームで分析を実行して保存してください。")
     else:
-        st.write(f"**保存数: {len(analyses)}件**")
+        st.write(f"**保存数: {total_analyses}件**")
 
         # セッション状態で選択中の分析を管理
         if 'selected_analysis_id' not in st.session_state:
@@ -243,12 +444,32 @@ def render_article_analysis_page(api_key):
         # 一覧表示
         st.markdown("### 📋 分析一覧")
 
-        # ページネーション設定
-        items_per_page = 5
-        total_pages = (len(analyses) + items_per_page - 1) // items_per_page
+        # 検索（検索語を変えたら1ページ目に戻す）
+        search_query = st.text_input(
+            "🔍 検索",
+            key="analysis_search",
+            placeholder="タイトル・記事内容・テーマから検索",
+            on_change=lambda: st.session_state.update(analysis_page=0)
+        ).strip()
+
+        if search_query:
+            search_hits = analysis_history.search_analyses(search_query, SEARCH_RESULT_LIMIT)
+            total_items = len(search_hits)
+            st.caption(f"「{search_query}」の検索結果: {total_items}件" + ("（関連度の高い順に上位のみ表示）" if total_items >= SEARCH_RESULT_LIMIT else ""))
+            if not search_hits:
+                st.info("該当する分析はありません。")
+        else:
+            total_items = total_analyses
+
+        # ページネーション設定（削除で件数が減ったときは最後のページに戻す）
+        items_per_page = ANALYSES_PER_PAGE
+        total_pages = max(1, (total_items + items_per_page - 1) // items_per_page)
+        st.session_state.analysis_page = min(st.session_state.analysis_page, total_pages - 1)
         start_idx = st.session_state.analysis_page * items_per_page
-        end_idx = min(start_idx + items_per_page, len(analyses))
-        page_analyses = analyses[start_idx:end_idx]
+        if search_query:
+            page_analyses = search_hits[start_idx:start_idx + items_per_page]
+        else:
+            page_analyses = analysis_history.list_analyses(items_per_page, start_idx)
 
         for analysis in page_analyses:
             # 要約を20文字に短縮
@@ -280,7 +501,7 @@ def render_article_analysis_page(api_key):
                 # 削除ボタン
                 if st.button("🗑️", key=f"delete_{analysis['id']}", help="削除"):
                     try:
-                        delete_analysis(analysis['id'])
+                        analysis_history.delete_analysis(analysis['id'])
                         st.success("削除しました")
                         if st.session_state.selected_analysis_id == analysis['id']:
                             st.session_state.selected_analysis_id = None
@@ -289,7 +510,7 @@ def render_article_analysis_page(api_key):
                         st.error(f"削除中にエラーが発生しました: {e}")
 
         # ページネーションコントロール（5件以上の場合のみ表示）
-        if len(analyses) > items_per_page:
+        if total_items > items_per_page:
             col1, col2, col3 = st.columns([1, 2, 1])
 
             with col1:
@@ -309,12 +530,11 @@ def render_article_analysis_page(api_key):
 
         # 選択された分析の詳細表示
         if st.session_state.selected_analysis_id:
-            selected_analysis = next(
-                (a for a in analyses if a['id'] == st.session_state.selected_analysis_id),
-                None
-            )
+            selected_analysis = analysis_history.get_analysis(st.session_state.selected_analysis_id)
 
             if selected_analysis:
+                # 表示する分だけ本文を読み込む
+                selected_analysis = resolve_fields(selected_analysis, ANALYSIS_BODY_FIELDS)
                 st.markdown("---")
                 st.markdown(f"## 📖 詳細: {selected_analysis['title']}")
 
@@ -329,6 +549,11 @@ def render_article_analysis_page(api_key):
                 with st.expander("📝 記事内容", expanded=True):
                     st.markdown(selected_analysis['content'])
 
+                # 処理時間の内訳（計測を始める前の分析にはない）
+                if selected_analysis.get('stage_metrics'):
+                    with st.expander("⏱️ 処理時間の内訳", expanded=False):
+                        _render_stage_breakdown(selected_analysis['stage_metrics'])
+
                 # 生成テーマを表示
                 st.markdown("### 💡 生成テーマ")
                 if selected_analysis.get('themes'):
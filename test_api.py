@@ -1,32 +1,34 @@
 #!/usr/bin/env python3
-"""APIキーのテストスクリプト"""
+"""
+APIキーのテストスクリプト
+共有ゲートウェイ経由で呼び出すため、ANTHROPIC_BASE_URL（疑似サーバー）や
+LLM_TRANSPORT=replay（記録した応答の再生）でもAPIに接続せずに実行できる
+"""
 from dotenv import load_dotenv
 import os
-from anthropic import Anthropic
 
-# 環境変数読み込み
+# 環境変数読み込み（LLM_TRANSPORT などをゲートウェイの読み込み前に反映する）
 load_dotenv()
 
+from utils import llm_gateway
+
 api_key = os.getenv('ANTHROPIC_API_KEY')
 
 print(f"API Key exists: {api_key is not None}")
 print(f"API Key length: {len(api_key) if api_key else 0}")
 print(f"API Key prefix: {api_key[:20] if api_key else 'None'}...")
 
-# Anthropicクライアントを作成してテスト
+# 共有ゲートウェイでテスト
 try:
-    client = Anthropic(api_key=api_key)
-    print("\nClient created successfully")
-
-    # 簡単なテストリクエスト
-    print("Sending test request...")
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=100,
-        messages=[{"role": "user", "content": "Hello, just testing!"}]
+    print("\nSending test request...")
+    completion = llm_gateway.complete(
+        api_key,
+        "Hello, just testing!",
+        model=llm_gateway.DEFAULT_MODEL,
+        max_tokens=100
     )
 
-    print(f"✅ Success! Response: {message.content[0].text[:50]}...")
+    print(f"✅ Success! Response: {completion.text[:50]}...")
 
 except Exception as e:
     print(f"❌ Error: {e}")
@@ -0,0 +1,53 @@
+"""
+テスト共通の準備
+ジョブ・履歴・検索インデックス・計測ログなどの保存先を一時ディレクトリに差し替え、
+Anthropic API の代わりに疑似サーバー（benchmarks/fake_anthropic_server.py）に接続する
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_anthropic_server import start_server
+from utils import analysis_history, blob_store, job_manager, llm_gateway, search_index, telemetry, token_budget
+from utils.analysis_store import AnalysisStore
+from utils.job_store import JobStore
+from utils.response_cache import ResponseCache
+from utils.search_index import SearchIndex
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """data/ の代わりに使う一時ディレクトリ（応答キャッシュは無効にする）"""
+    monkeypatch.setattr(job_manager, "_job_store", JobStore(str(tmp_path / "jobs.db")))
+    monkeypatch.setattr(job_manager, "_response_cache", ResponseCache(str(tmp_path / "response_cache.db"), max_bytes=0, ttl_seconds=0))
+    monkeypatch.setattr(analysis_history, "_store", AnalysisStore(str(tmp_path / "analysis_history.db")))
+    monkeypatch.setattr(search_index, "_index", SearchIndex(str(tmp_path / "search_index.db")))
+    monkeypatch.setattr(blob_store, "BLOBS_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(token_budget, "TOKEN_USAGE_PATH", str(tmp_path / "token_usage.json"))
+    monkeypatch.setattr(telemetry, "METRICS_LOG_PATH", str(tmp_path / "metrics.jsonl"))
+    return tmp_path
+
+
+@pytest.fixture
+def gateway(data_dir, monkeypatch):
+    """疑似サーバーに接続するゲートウェイ（送信したバッチのIDを created に記録する）"""
+    server = start_server(batch_delay=0.5)
+    host, port = server.server_address[:2]
+    gateway = llm_gateway.LLMGateway("sk-fake", base_url=f"http://{host}:{port}")
+    gateway.created = []
+    create_batch = gateway.create_batch
+
+    def counting_create_batch(requests, **kwargs):
+        batch_id = create_batch(requests, **kwargs)
+        gateway.created.append(batch_id)
+        return batch_id
+
+    gateway.create_batch = counting_create_batch
+    monkeypatch.setattr(llm_gateway, "get_gateway", lambda api_key, base_url=None: gateway)
+    monkeypatch.setattr(llm_gateway, "BATCH_POLL_INTERVAL_SECONDS", 0.1)
+
+    yield gateway
+    server.shutdown()
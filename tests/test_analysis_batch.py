@@ -0,0 +1,48 @@
+"""
+記事分析の Message Batches モード
+テーマ生成（auto_generate_themes）の指定は、標準モードと同じように扱う
+（Anthropic API の疑似サーバーに接続して実行する。gateway は conftest.py）
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import analysis_history, job_manager
+from utils.prompt_library import PromptLibrary
+
+
+ARTICLES = [
+    ("義母の合鍵", "義母に合鍵を勝手に作られ、留守中に家に入られていた。"),
+    ("ママ友のランチ", "ママ友にランチ代を毎回払わされていた。"),
+]
+
+
+def _run_batch(auto_generate_themes):
+    job_ids = [
+        job_manager.create_job("analysis", title, {"article_title": title, "article_content": content})
+        for title, content in ARTICLES
+    ]
+    batch_job_id = job_manager.create_job("analysis_batch", "記事分析", {"job_ids": job_ids})
+    job_manager.run_article_analysis_batch_job(
+        batch_job_id, "sk-fake", job_ids, PromptLibrary(), auto_generate_themes=auto_generate_themes
+    )
+    return job_ids
+
+
+@pytest.mark.parametrize("auto_generate_themes, stages", [(True, 3), (False, 2)])
+def test_batch_honours_auto_generate_themes(gateway, auto_generate_themes, stages):
+    job_ids = _run_batch(auto_generate_themes)
+
+    assert len(gateway.created) == stages
+    for job_id in job_ids:
+        job = job_manager.get_job(job_id)
+        assert job['status'] == "completed"
+        assert ('themes' in job['checkpoints']) == auto_generate_themes
+
+    analysis_history.flush()
+    saved = [analysis_history.get_analysis(row['id']) for row in analysis_history.list_analyses(10)]
+    assert len(saved) == len(ARTICLES)
+    assert all(bool(analysis.get('themes')) == auto_generate_themes for analysis in saved)
@@ -0,0 +1,51 @@
+"""
+分析履歴ストアの durable な追加
+ジョブの完了前の保存は、戻った時点でディスクに書き込まれている（失敗した場合はあとから書き込まれない）
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.analysis_store import AnalysisStore
+
+
+def _analysis(analysis_id):
+    return {"id": analysis_id, "title": "タイトル", "summary": "要約", "created_at": "2026-01-01T00:00:00"}
+
+
+def _saved_ids(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM analyses")]
+
+
+def test_durable_insert_is_on_disk_when_it_returns(tmp_path):
+    db_path = str(tmp_path / "analysis_history.db")
+    store = AnalysisStore(db_path, flush_interval=60)
+    store.insert(_analysis("ana_1"), durable=True)
+
+    # バックグラウンドの書き込みを待たずに、別の接続から読める
+    assert _saved_ids(db_path) == ["ana_1"]
+    store.close()
+
+
+def test_failed_durable_insert_is_not_written_later(tmp_path):
+    db_path = str(tmp_path / "analysis_history.db")
+    store = AnalysisStore(db_path, flush_interval=60)
+    store.count()
+
+    flush_locked = store._flush_locked
+
+    def failing_flush():
+        store._flush_locked = flush_locked
+        raise sqlite3.OperationalError("disk I/O error")
+
+    store._flush_locked = failing_flush
+    with pytest.raises(sqlite3.OperationalError):
+        store.insert(_analysis("ana_1"), durable=True)
+
+    store.close()
+    assert _saved_ids(db_path) == []
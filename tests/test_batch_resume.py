@@ -0,0 +1,119 @@
+"""
+Message Batches のジョブの再開
+異常終了したプロセスが送信したバッチが処理中なら、再開時に新しいバッチを送信せず、その結果を待つ
+（Anthropic API の疑似サーバーに接続して実行する。gateway は conftest.py）
+"""
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import job_manager, llm_gateway, note_organizer
+
+
+NOTES = [
+    {"id": "note_a", "content": "義母に合鍵を勝手に作られた"},
+    {"id": "note_b", "content": "ママ友にランチ代を払わされた"},
+]
+
+
+def _dead_owner():
+    """終了済みのプロセスを担当とする owner"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return dict(job_manager._PROCESS_OWNER, pid=process.pid, token="crashed")
+
+
+def _orphan_note_batch_job(batch=None):
+    """バッチの完了を待つ間に担当プロセスが異常終了した、メモ整理のジョブ"""
+    job_id = job_manager.create_job("note_organization", "メモ整理", {"notes": NOTES, "batch": True})
+
+    def apply(job):
+        job['status'] = "running"
+        job['owner'] = _dead_owner()
+        if batch:
+            job['batch'] = batch
+
+    job_manager._job_store.update(job_id, apply)
+    return job_id
+
+
+def _wait_finished(job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_manager.get_job(job_id)
+        if job['status'] not in ["pending", "running"]:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"ジョブが完了しません: {job_id}")
+
+
+def test_resume_reattaches_to_in_progress_batch(gateway):
+    # 異常終了の前に送信していたバッチ（custom_id はメモの並び順）
+    submitted = gateway.create_batch({
+        f"note-{index}": {
+            "model": llm_gateway.DEFAULT_MODEL,
+            "max_tokens": note_organizer.NOTE_ORGANIZE_MAX_TOKENS,
+            "messages": [{"role": "user", "content": note_organizer.build_prompt(note['content'], "")}],
+        }
+        for index, note in enumerate(NOTES)
+    })
+    job_id = _orphan_note_batch_job({"id": submitted, "stage": "notes", "processing_status": "in_progress"})
+
+    assert job_manager.resume_orphaned_jobs("sk-fake", prompts=None) == 1
+    job = _wait_finished(job_id)
+
+    assert gateway.created == [submitted]
+    assert job['status'] == "completed"
+    assert job['batch']['id'] == submitted
+    assert {entry['status'] for entry in job['note_results'].values()} == {"completed"}
+
+
+def test_resume_submits_batch_when_none_in_progress(gateway):
+    job_id = _orphan_note_batch_job({"id": "msgbatch_ended", "stage": "notes", "processing_status": "ended"})
+
+    assert job_manager.resume_orphaned_jobs("sk-fake", prompts=None) == 1
+    job = _wait_finished(job_id)
+
+    assert len(gateway.created) == 1
+    assert job['status'] == "completed"
+    assert job['batch']['id'] == gateway.created[0]
+
+
+def test_failed_status_check_leaves_batch_running_for_resume(gateway):
+    job_id = job_manager.create_job("note_organization", "メモ整理", {"notes": NOTES, "batch": True})
+    retrieve_batch = gateway.retrieve_batch
+    failures = []
+
+    def failing_retrieve_batch(batch_id, **kwargs):
+        if not failures:
+            failures.append(batch_id)
+            raise RuntimeError("状態確認に失敗")
+        return retrieve_batch(batch_id, **kwargs)
+
+    gateway.retrieve_batch = failing_retrieve_batch
+    job_manager.run_note_organization_batch_job(job_id, "sk-fake", NOTES, "")
+
+    # バッチはキャンセルせず、ジョブは担当なしの再開待ちに戻る
+    job = job_manager.get_job(job_id)
+    assert job['status'] == "pending" and job['owner'] is None
+    assert retrieve_batch(gateway.created[0])['processing_status'] != "canceling"
+
+    assert job_manager.resume_orphaned_jobs("sk-fake", prompts=None) == 1
+    job = _wait_finished(job_id)
+    assert job['status'] == "completed"
+    assert gateway.created == failures
+
+
+def test_repeated_resume_does_not_start_job_twice(gateway):
+    job_id = _orphan_note_batch_job()
+
+    assert job_manager.resume_orphaned_jobs("sk-fake", prompts=None) == 1
+    # 定期的な再確認：このプロセスが担当しているジョブは再開しない
+    assert job_manager.resume_orphaned_jobs("sk-fake", prompts=None) == 0
+    job = _wait_finished(job_id)
+
+    assert job['status'] == "completed"
+    assert len(gateway.created) == 1
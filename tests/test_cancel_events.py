@@ -0,0 +1,45 @@
+"""
+キャンセル要求のイベント
+このプロセスで実行中のジョブの分だけを持ち、他のジョブのキャンセル・確認では作らない
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import job_manager
+from utils.job_store import JobStore
+
+
+@pytest.fixture(autouse=True)
+def job_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_manager, "_job_store", JobStore(str(tmp_path / "jobs.db")))
+    monkeypatch.setattr(job_manager, "_cancel_events", {})
+
+
+def test_cancel_and_check_do_not_create_events_for_jobs_not_running_here():
+    finished = job_manager.create_job("analysis", "完了済み", {})
+    job_manager.update_job_status(finished, "completed")
+    other = job_manager.create_job("analysis", "他プロセスで実行中", {})
+    job_manager.update_job_status(other, "running")
+
+    job_manager.cancel_job(finished)
+    assert job_manager.cancel_job(other)
+    assert job_manager.is_cancelled(other)
+    assert not job_manager.is_cancelled(finished)
+
+    assert job_manager._cancel_events == {}
+
+
+def test_cancel_sets_event_of_running_worker():
+    job_id = job_manager.create_job("analysis", "実行中", {})
+    job_manager.update_job_status(job_id, "running")
+    event = job_manager._cancel_event(job_id)
+
+    job_manager.cancel_job(job_id)
+
+    assert event.is_set()
+    with pytest.raises(job_manager.JobCancelled):
+        job_manager._cancellable_sleep(job_id, 10)
@@ -0,0 +1,33 @@
+"""
+ページから直接呼ぶ生成（新テーマ提案・シナリオ生成）の計測
+stage を指定した complete() / stream() は、ジョブのステージと同じ形式で計測ログに追記する
+（Anthropic API の疑似サーバーに接続して実行する。gateway は conftest.py）
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import llm_gateway, telemetry
+
+
+def test_complete_and_stream_record_telemetry(gateway):
+    llm_gateway.complete("sk-fake", "新しいテーマを提案して", max_tokens=400, stage="theme_suggestions")
+    chunks = []
+    llm_gateway.stream("sk-fake", "シナリオを書いて", on_text=chunks.append, max_tokens=400, stage="scenario_generation")
+
+    entries = telemetry.read_entries()
+    assert [entry['stage'] for entry in entries] == ["theme_suggestions", "scenario_generation"]
+    assert chunks
+    for entry in entries:
+        assert entry['seconds'] is not None and entry['output_tokens'] > 0
+        assert entry['max_tokens'] == 400 and entry['retries'] == 0
+    assert entries[1]['ttft_seconds'] is not None
+
+    rows = telemetry.summarize(entries)
+    assert {row['stage'] for row in rows} == {"theme_suggestions", "scenario_generation"}
+
+
+def test_calls_without_stage_are_not_recorded(gateway):
+    llm_gateway.complete("sk-fake", "Hello", max_tokens=50)
+    assert telemetry.read_entries() == []
@@ -0,0 +1,88 @@
+"""
+ジョブスケジューラ
+種別ごとの同時実行数の上限・待機中のジョブのキャンセル・バッチ用の専用ワーカー
+"""
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.job_scheduler import JobScheduler
+
+
+def test_batch_jobs_do_not_occupy_regular_workers():
+    scheduler = JobScheduler(max_workers=1, type_limits={"analysis": 1, "analysis_batch": 1, "note_organization_batch": 1})
+    release = threading.Event()
+    ran = threading.Event()
+
+    # バッチの完了待ちのジョブが2つ実行中でも、通常のジョブは待たずに実行される
+    scheduler.submit("batch-1", "analysis_batch", release.wait)
+    scheduler.submit("batch-2", "note_organization_batch", release.wait)
+    scheduler.submit("job-1", "analysis", ran.set)
+
+    assert ran.wait(5)
+    release.set()
+    scheduler.shutdown()
+
+
+def test_type_limit_caps_concurrency_per_type():
+    scheduler = JobScheduler(max_workers=3, type_limits={"analysis": 1}, batch_types=())
+    lock = threading.Lock()
+    running = {"analysis": 0}
+    peak = {"analysis": 0}
+    release = threading.Event()
+    other_ran = threading.Event()
+
+    def job():
+        with lock:
+            running["analysis"] += 1
+            peak["analysis"] = max(peak["analysis"], running["analysis"])
+        release.wait()
+        with lock:
+            running["analysis"] -= 1
+
+    for i in range(3):
+        scheduler.submit(f"analysis-{i}", "analysis", job)
+    # 上限のない種別は、空いているワーカーですぐに実行される
+    scheduler.submit("theme-1", "theme_generation", other_ran.set)
+
+    assert other_ran.wait(5)
+    # 上限に達した種別のジョブは、ワーカーが空いていても待機する
+    assert scheduler.pending_count() == 2
+    release.set()
+    scheduler.shutdown()
+    assert peak["analysis"] == 1
+
+
+def test_cancel_removes_only_queued_jobs():
+    scheduler = JobScheduler(max_workers=1, type_limits={}, batch_types=())
+    started = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+    ran = []
+
+    def run(job_id):
+        ran.append(job_id)
+        finished.set()
+
+    def blocking():
+        started.set()
+        release.wait()
+
+    scheduler.submit("job-1", "analysis", blocking)
+    assert started.wait(5)
+    scheduler.submit("job-2", "analysis", run, "job-2")
+    scheduler.submit("job-3", "analysis", run, "job-3")
+    assert scheduler.queue_position("job-3") == 2
+
+    # 実行中のジョブはキューから取り除けない
+    assert not scheduler.cancel("job-1")
+    assert scheduler.cancel("job-2")
+    assert not scheduler.cancel("job-2")
+    assert scheduler.queue_position("job-3") == 1
+
+    release.set()
+    assert finished.wait(5)
+    scheduler.shutdown()
+    assert ran == ["job-3"]
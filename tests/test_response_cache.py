@@ -0,0 +1,83 @@
+"""
+応答キャッシュ
+有効期限（TTL）を過ぎた応答は返さず、合計サイズの上限を超えたら最後に使われたのが古いものから削除する（LRU）
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import response_cache
+from utils.response_cache import ResponseCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+def test_expired_response_is_not_returned(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "response_cache.db"), max_bytes=1024, ttl_seconds=60)
+    cache.put("key", "応答")
+
+    clock.now += 59
+    assert cache.get("key") == "応答"
+
+    # 使っても有効期限は延びない（保存した時刻から数える）
+    clock.now += 2
+    assert cache.get("key") is None
+    assert cache.stats()['count'] == 0
+    cache.close()
+
+
+def test_least_recently_used_is_evicted_over_max_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "response_cache.db"), max_bytes=30, ttl_seconds=3600)
+    cache.put("a", "a" * 10)
+    clock.now += 1
+    cache.put("b", "b" * 10)
+    clock.now += 1
+    cache.put("c", "c" * 10)
+
+    # a を使うと、最後に使われたのが最も古いのは b になる
+    clock.now += 1
+    assert cache.get("a") == "a" * 10
+    clock.now += 1
+    cache.put("d", "d" * 10)
+
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    assert cache.stats() == {"count": 3, "bytes": 30}
+    cache.close()
+
+
+def test_expired_entries_are_dropped_on_put_and_oversized_is_skipped(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "response_cache.db"), max_bytes=30, ttl_seconds=60)
+    cache.put("old", "o" * 10)
+    clock.now += 61
+    cache.put("new", "n" * 10)
+    assert cache.stats() == {"count": 1, "bytes": 10}
+
+    # 上限より大きい応答は保存しない（他の応答も消さない）
+    cache.put("huge", "h" * 31)
+    assert cache.get("huge") is None
+    assert cache.get("new") == "n" * 10
+    cache.close()
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "response_cache.db"), max_bytes=0, ttl_seconds=60)
+    cache.put("key", "応答")
+    assert not cache.enabled
+    assert cache.get("key") is None
@@ -0,0 +1,85 @@
+"""
+リトライポリシー
+待ち時間は equal jitter（バックオフの 50%〜100%）で上限を超えず、retry-after があればそれに従う
+"""
+import email.utils
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import retry_policy
+from utils.retry_policy import RetryPolicy
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = _Response(headers or {})
+
+
+@pytest.mark.parametrize("attempt, backoff", [(1, 2.0), (2, 4.0), (3, 8.0), (6, 30.0)])
+def test_delay_is_equal_jitter_within_backoff(attempt, backoff):
+    policy = RetryPolicy(base_delay=2.0, max_delay=30.0)
+    delays = [policy.delay_for(attempt, _APIError(529)) for _ in range(500)]
+
+    assert all(backoff * 0.5 <= delay <= backoff for delay in delays)
+    # 範囲の下半分・上半分のどちらにも散らばる
+    assert min(delays) < backoff * 0.75 < max(delays)
+
+
+def test_delay_bounds_follow_random(monkeypatch):
+    policy = RetryPolicy(base_delay=2.0, max_delay=60.0, jitter=0.5)
+    monkeypatch.setattr(retry_policy.random, "random", lambda: 0.0)
+    assert policy.delay_for(2, _APIError(529)) == 4.0
+    monkeypatch.setattr(retry_policy.random, "random", lambda: 1.0)
+    assert policy.delay_for(2, _APIError(529)) == 2.0
+
+
+def test_retry_after_overrides_backoff_and_cap():
+    policy = RetryPolicy(base_delay=2.0, max_delay=10.0)
+
+    assert policy.delay_for(1, _APIError(429, {"retry-after": "42"})) == 42.0
+    assert policy.delay_for(1, _APIError(429, {"retry-after-ms": "1500", "retry-after": "42"})) == 1.5
+
+    retry_at = email.utils.formatdate(time.time() + 20, usegmt=True)
+    assert 18 <= policy.delay_for(1, _APIError(503, {"retry-after": retry_at})) <= 20
+
+    # 解釈できない値はバックオフに戻る
+    assert 1.0 <= policy.delay_for(1, _APIError(503, {"retry-after": "soon"})) <= 2.0
+
+
+def test_call_retries_transient_errors_until_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0)
+    slept, retried = [], []
+
+    def always_overloaded():
+        raise _APIError(529, {"retry-after": "3"})
+
+    with pytest.raises(_APIError):
+        policy.call(always_overloaded, on_retry=lambda *args: retried.append(args[:2]), sleep=slept.append)
+
+    assert slept == [3.0, 3.0]
+    assert retried == [(1, 3.0), (2, 3.0)]
+
+
+def test_call_does_not_retry_client_errors():
+    policy = RetryPolicy(max_attempts=4)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise _APIError(400)
+
+    with pytest.raises(_APIError):
+        policy.call(bad_request, sleep=lambda _: pytest.fail("待機してはいけない"))
+    assert len(calls) == 1
@@ -0,0 +1,61 @@
+"""
+シナリオ履歴の旧形式（本文をそのまま持つ）からの移行
+初めて読み込んだときに1回だけ本文を blob に移し、本文を持つシナリオだけを変更する
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import scenario_manager
+from utils.blob_store import BLOB_MIN_CHARS, is_ref
+
+
+LONG_CONTENT = "# 義母の合鍵\n" + "義母に合鍵を勝手に作られた。" * (BLOB_MIN_CHARS // 10)
+
+
+@pytest.fixture
+def history_path(data_dir, monkeypatch):
+    path = data_dir / "scenario_history.json"
+    monkeypatch.setattr(scenario_manager, "SCENARIO_HISTORY_PATH", str(path))
+    monkeypatch.setattr(scenario_manager, "_history_cache", {"signature": None, "scenarios": [], "by_id": {}, "migrated": False})
+    return path
+
+
+def _scenario(scenario_id, **fields):
+    return dict({"id": scenario_id, "title": scenario_id, "summary": "", "parameters": {}, "created_at": "2026-01-01T00:00:00"}, **fields)
+
+
+def _write(path, scenarios):
+    path.write_text(json.dumps({"version": "1.0.0", "last_updated": "2026-01-01", "scenarios": scenarios}, ensure_ascii=False), encoding='utf-8')
+
+
+def _read(path):
+    return {s['id']: s for s in json.loads(path.read_text(encoding='utf-8'))['scenarios']}
+
+
+def test_inline_bodies_are_migrated_when_history_is_loaded(history_path):
+    _write(history_path, [
+        _scenario("scn_long", content=LONG_CONTENT),
+        _scenario("scn_short", content="短い本文"),
+        _scenario("scn_none"),
+    ])
+
+    assert scenario_manager.count_scenarios() == 3
+
+    saved = _read(history_path)
+    assert is_ref(saved['scn_long']['content'])
+    assert saved['scn_short']['content'] == "短い本文"
+    assert "content" not in saved['scn_none']
+    assert scenario_manager.get_scenario("scn_long")['content'] == LONG_CONTENT
+
+
+def test_history_without_inline_bodies_is_not_rewritten(history_path):
+    _write(history_path, [_scenario("scn_none"), _scenario("scn_short", content="短い本文")])
+    before = history_path.stat().st_mtime_ns
+
+    assert [s['id'] for s in scenario_manager.list_scenarios(10)] == ["scn_none", "scn_short"]
+    assert history_path.stat().st_mtime_ns == before
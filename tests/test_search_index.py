@@ -0,0 +1,63 @@
+"""
+検索インデックスの絞り込み
+条件（where）は limit 件に絞る前に適用し、関連度の低い文書でも条件に合えば結果に含める
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.search_index import SearchIndex
+
+
+def _document(i, title):
+    return {
+        "id": f"scn_{i:03d}",
+        "title": title,
+        "summary": "",
+        "created_at": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}",
+        "texts": ["義母に合鍵を勝手に作られた話"],
+    }
+
+
+def test_where_applies_before_limit(tmp_path):
+    index = SearchIndex(str(tmp_path / "search_index.db"))
+    # タイトルにも検索語を含む文書（関連度が高い）が上位を占め、条件に合う文書は下位にだけある
+    documents = [_document(i, "義母の合鍵") for i in range(100)]
+    documents += [_document(i, "別の話") for i in range(100, 110)]
+    index.rebuild("scenario", documents)
+
+    wanted = {document['id'] for document in documents[100:]}
+    hits = index.search("scenario", "合鍵", limit=5, where=lambda doc_id: doc_id in wanted)
+
+    assert len(hits) == 5
+    assert {hit['id'] for hit in hits} <= wanted
+    assert len(index.search("scenario", "合鍵", limit=50, where=lambda doc_id: doc_id in wanted)) == 10
+    index.close()
+
+
+def test_long_query_does_not_exceed_join_limit(tmp_path, monkeypatch):
+    index = SearchIndex(str(tmp_path / "search_index.db"))
+    title = "【衝撃】月収20万で義母に50万要求された話。夫は見て見ぬふりを続け、親族の集まりで録音を聞かせた結果、義母は泣きながら謝罪し、夫も土下座した"
+    ending = "その後の生活はすっかり変わり、義母は二度とお金の話をしなくなった。"
+    body = title * 2 + ending
+    assert len(title) > 60
+    documents = [
+        {"id": "target", "title": title, "summary": "", "created_at": "2026-01-02T00:00:00", "texts": [body]},
+        {"id": "other", "title": "別の話", "summary": "", "created_at": "2026-01-01T00:00:00", "texts": [title[:30]]},
+    ]
+    index.rebuild("analysis", documents)
+
+    query = title + ending
+    assert len(query) > 100
+    hits = index.search("analysis", query)
+    assert [hit['id'] for hit in hits] == ["target"]
+
+    # 結合する見出し語を減らしても、すべてを結合した場合と同じスコアになる
+    short_query = title[:40]
+    monkeypatch.setattr("utils.search_index.MAX_JOIN_TERMS", 60)
+    joined = index.search("analysis", short_query)
+    monkeypatch.setattr("utils.search_index.MAX_JOIN_TERMS", 2)
+    split = index.search("analysis", short_query)
+    assert [(hit['id'], hit['score']) for hit in split] == [(hit['id'], hit['score']) for hit in joined]
+    index.close()
@@ -0,0 +1,165 @@
+"""
+分析履歴の保存・読み込み
+ジョブの完了時も画面からの操作も、分析履歴の読み書きはすべてこのモジュールを通す。
+保存はキューに積んでバックグラウンドでまとめて書き込み、プロセスの終了時には書き込み待ちの分を書き込む
+（ジョブの完了時の保存は durable を指定し、ディスクに書き込んでからジョブを完了にする）
+"""
+import atexit
+import datetime
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.analysis_store import AnalysisStore
+from utils.blob_store import externalize, resolve_fields
+from utils.ids import new_id
+from utils import search_index
+
+
+ANALYSIS_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'analysis_history.db')
+ANALYSIS_HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'analysis_history.json')  # 旧形式（移行元）
+
+# まとめて書き込むまでの最大の待ち時間（秒）と、待たずに書き込む件数（環境変数で変更可能）
+FLUSH_INTERVAL_SECONDS = float(os.getenv('ANALYSIS_HISTORY_FLUSH_SECONDS', '1'))
+FLUSH_MAX_BATCH = int(os.getenv('ANALYSIS_HISTORY_FLUSH_MAX_BATCH', '100'))
+
+# 検索インデックスでの文書の種類
+SEARCH_KIND = "analysis"
+
+# 分析履歴ストア（SQLite / WALモード）
+_store = AnalysisStore(
+    ANALYSIS_DB_PATH,
+    legacy_json_path=ANALYSIS_HISTORY_PATH,
+    flush_interval=FLUSH_INTERVAL_SECONDS,
+    max_batch=FLUSH_MAX_BATCH,
+)
+
+
+def save_analysis(title: str, content: str, basic_analysis: str, deep_analysis: str, themes: str = None, stage_metrics: Dict[str, Any] = None, durable: bool = False) -> str:
+    """
+    分析結果を履歴に追加する（ディスクへの書き込みはまとめて行う。保存に失敗した場合は例外を送出する）
+
+    Args:
+        stage_metrics: ステージごとの処理時間・トークン数
+        durable: True ならディスクに書き込んでから戻る（ジョブを完了にする前の保存用）
+
+    Returns:
+        分析ID
+    """
+    # 新しい分析IDを生成
+    analysis_id = new_id("ana")
+
+    # タイトルが空の場合、記事内容の最初の50文字を使用
+    if not title or title.strip() == "":
+        # 改行やタブを除去して最初の50文字を取得
+        clean_content = content.replace('\n', ' ').replace('\t', ' ').strip()
+        title = clean_content[:50] + "..." if len(clean_content) > 50 else clean_content
+
+    # 要約を生成（記事内容の最初の100文字）
+    summary = content[:100] + "..." if len(content) > 100 else content
+
+    # 新しい分析データを作成
+    # 本文・分析結果は blob に保存し、履歴には参照だけを持たせる
+    new_analysis = {
+        "id": analysis_id,
+        "title": title,
+        "content": externalize(content),
+        "summary": summary,
+        "basic_analysis": externalize(basic_analysis),
+        "deep_analysis": externalize(deep_analysis),
+        "themes": externalize(themes),
+        "stage_metrics": stage_metrics or {},
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+    _store.insert(new_analysis, durable=durable)
+    _index_analysis(dict(new_analysis, content=content, themes=themes))
+
+    return analysis_id
+
+
+def count_analyses() -> int:
+    """保存済みの分析の件数"""
+    return _store.count()
+
+
+def list_analyses(limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """保存済みの分析を新しい順に1ページ分取得（id・title・summary・created_at のみ）"""
+    return _store.list_page(limit, offset)
+
+
+def get_analysis(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """保存済みの分析を1件取得（本文・分析結果は blob の参照のまま）"""
+    return _store.get(analysis_id)
+
+
+def delete_analysis(analysis_id: str):
+    """保存済みの分析を削除"""
+    _store.delete(analysis_id)
+    try:
+        search_index.get_index().remove(SEARCH_KIND, analysis_id)
+    except Exception as e:
+        print(f"検索インデックスの更新エラー: {e}")
+
+
+# =====================================================
+# 検索
+# =====================================================
+
+def _search_document(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """検索インデックスに登録する内容（タイトル・記事内容・テーマ）"""
+    return {
+        "id": analysis['id'],
+        "title": analysis.get('title'),
+        "summary": analysis.get('summary'),
+        "created_at": analysis['created_at'],
+        "texts": [analysis.get('content') or "", analysis.get('themes') or ""],
+    }
+
+
+def _index_analysis(analysis: Dict[str, Any]):
+    """保存した分析を検索インデックスに追加（失敗しても保存は続ける）"""
+    try:
+        search_index.get_index().add(SEARCH_KIND, _search_document(analysis))
+    except Exception as e:
+        print(f"検索インデックスの更新エラー: {e}")
+
+
+def _ensure_search_index():
+    """検索インデックスを作る前に保存された分析があれば、初回の検索時にまとめて登録する"""
+    index = search_index.get_index()
+    if not index.is_built(SEARCH_KIND):
+        index.rebuild(SEARCH_KIND, (
+            _search_document(resolve_fields(analysis, ['content', 'themes'])) for analysis in _store.iter_all()
+        ))
+
+
+def search_analyses(query: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    タイトル・記事内容・テーマから分析を検索（関連度の高い順）
+
+    Returns:
+        [{id, title, summary, created_at, score}, ...]
+    """
+    _ensure_search_index()
+    return search_index.get_index().search(SEARCH_KIND, query, limit)
+
+
+def iter_analyses() -> Iterator[Dict[str, Any]]:
+    """すべての分析を少しずつ読み込む（blob の参照の収集用）"""
+    return _store.iter_all()
+
+
+def flush():
+    """書き込み待ちの分析をディスクに書き込む（書き込みが終わるまで戻らない）"""
+    _store.flush()
+
+
+def shutdown():
+    """終了時の処理: 書き込み待ちの分析を書き込んで接続を閉じる"""
+    try:
+        _store.close()
+    except Exception as e:
+        print(f"分析履歴の書き込みエラー（終了時）: {e}")
+
+
+# Streamlit の停止（Ctrl+C / SIGTERM）を含め、プロセスの終了時に書き込み待ちの分を書き込む
+atexit.register(shutdown)
@@ -0,0 +1,251 @@
+"""
+分析履歴ストア（SQLite / WALモード）
+analysis_history.json の全件読み込みを置き換え、一覧は表示する行だけを、
+詳細は1件だけを読み込む（created_at・id にインデックス）
+
+追加はメモリ上のキューに積むだけで戻り、バックグラウンドのスレッドが一定間隔でまとめて書き込む
+（多数のジョブが同時に完了しても、書き込みは1回のトランザクションにまとまる）。
+flush() はそれまでに追加した分析をディスクに書き込んでから戻る。読み込み・削除の前にも flush() する
+durable を指定した追加は、同時に書き込み待ちの分とまとめて書き込んでから戻る
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at DESC, seq DESC);
+"""
+
+# 一覧に返す列（本文・分析結果を含む data は読まない）
+_LIST_COLUMNS = ("id", "title", "summary", "created_at")
+
+
+class AnalysisStore:
+    def __init__(self, db_path, legacy_json_path=None, flush_interval: float = 1.0, max_batch: int = 100):
+        """
+        Args:
+            db_path: SQLiteデータベースのパス
+            legacy_json_path: 旧形式の analysis_history.json（存在すれば初回のみ取り込む）
+            flush_interval: 追加してからまとめて書き込むまでの最大の待ち時間（秒）
+            max_batch: この件数がたまったら待たずに書き込む
+        """
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._conn = None
+
+        # 書き込み待ちの分析の行（追加順）
+        self._pending = []
+        self._pending_changed = threading.Condition()
+        self._flusher = None
+
+    def _connect(self):
+        """プロセス内で共有する接続を取得（self._lock を保持した状態で呼ぶ）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # 書き込みはまとめて行うため、コミットごとにディスクへ同期しても回数は少ない
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            self._migrate_legacy_json(conn)
+            self._conn = conn
+        return self._conn
+
+    def _migrate_legacy_json(self, conn):
+        """旧形式の analysis_history.json が残っていれば取り込んでリネームする"""
+        if not self.legacy_json_path:
+            return
+
+        # 複数プロセスが同時に起動しても1回だけ取り込むよう、書き込みロック中に確認する
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not os.path.exists(self.legacy_json_path):
+                conn.execute("COMMIT")
+                return
+
+            try:
+                with open(self.legacy_json_path, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"旧分析履歴ファイルの読み込みエラー: {e}")
+                conn.execute("COMMIT")
+                return
+
+            # 旧形式は新しい順に並んでいるので、古い順に挿入する
+            for analysis in reversed(legacy.get('analyses', [])):
+                conn.execute(
+                    "INSERT OR IGNORE INTO analyses (id, title, summary, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                    _row_values(analysis)
+                )
+            os.replace(self.legacy_json_path, self.legacy_json_path + '.migrated')
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """書き込み待ちの分析を書き込んでから接続を閉じる"""
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # -------------------------------------------------
+    # まとめ書き込み
+    # -------------------------------------------------
+
+    def _flush_locked(self):
+        """書き込み待ちの分析を1回のトランザクションで書き込む（self._lock を保持した状態で呼ぶ）"""
+        with self._pending_changed:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO analyses (id, title, summary, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                    batch
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception:
+            # 失敗した分は次回の書き込みで再試行する
+            with self._pending_changed:
+                self._pending[:0] = batch
+            raise
+
+    def flush(self):
+        """それまでに追加した分析をディスクに書き込む（書き込みが終わるまで戻らない）"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_loop(self):
+        """書き込み待ちができたら flush_interval だけ待ってまとめて書き込む"""
+        while True:
+            with self._pending_changed:
+                while not self._pending:
+                    self._pending_changed.wait()
+                # 待つ間に追加された分もまとめる（max_batch に達したら待たない）
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_changed.wait(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"分析履歴の書き込みエラー: {e}")
+                time.sleep(self.flush_interval)
+
+    # -------------------------------------------------
+    # 操作
+    # -------------------------------------------------
+
+    def insert(self, analysis: Dict[str, Any], durable: bool = False):
+        """
+        分析を追加（書き込みはバックグラウンドでまとめて行う）
+
+        Args:
+            durable: True ならディスクに書き込んでから戻る（失敗した場合は追加せずに例外を送出する）
+        """
+        # JSON にできないデータはここで呼び出し元に例外を返す
+        row = _row_values(analysis)
+        with self._pending_changed:
+            self._pending.append(row)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="analysis-history-flush", daemon=True)
+                self._flusher.start()
+            self._pending_changed.notify_all()
+
+        if durable:
+            try:
+                self.flush()
+            except Exception:
+                # 呼び出し元には失敗を返すので、あとから書き込まれないようキューから外す
+                with self._pending_changed:
+                    self._pending = [pending for pending in self._pending if pending is not row]
+                raise
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """分析を1件取得（本文・分析結果は blob の参照のまま）"""
+        with self._lock:
+            self._flush_locked()
+            row = self._connect().execute("SELECT data FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+            return json.loads(row[0]) if row is not None else None
+
+    def delete(self, analysis_id: str):
+        """分析を削除"""
+        with self._lock:
+            self._flush_locked()
+            self._connect().execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
+
+    def count(self) -> int:
+        """分析の件数"""
+        with self._lock:
+            self._flush_locked()
+            return self._connect().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def list_page(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        一覧の1ページ分を新しい順に取得（id・title・summary・created_at のみ）
+
+        Args:
+            limit: 取得件数
+            offset: 先頭から読み飛ばす件数
+        """
+        with self._lock:
+            self._flush_locked()
+            rows = self._connect().execute(
+                f"SELECT {', '.join(_LIST_COLUMNS)} FROM analyses ORDER BY created_at DESC, seq DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+            return [dict(zip(_LIST_COLUMNS, row)) for row in rows]
+
+    def iter_all(self, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """すべての分析を少しずつ読み込む（blob の参照の収集など、全件が必要な処理用）"""
+        self.flush()
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT seq, data FROM analyses WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (last_seq, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, data in rows:
+                yield json.loads(data)
+            last_seq = rows[-1][0]
+
+
+def _row_values(analysis: Dict[str, Any]):
+    """INSERT 用の値タプルを作成"""
+    return (
+        analysis['id'],
+        analysis.get('title') or "",
+        analysis.get('summary') or "",
+        analysis['created_at'],
+        json.dumps(analysis, ensure_ascii=False),
+    )
@@ -0,0 +1,143 @@
+"""
+コンテンツアドレス方式のテキスト保存領域
+長いテキストは内容のハッシュ名で data/blobs/ に圧縮して1度だけ書き込み、
+ジョブや履歴のレコードには参照（{"blob": "<sha256>"}）だけを持たせる
+"""
+import gzip
+import hashlib
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from utils.file_store import write_bytes_atomic
+
+
+BLOBS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'blobs')
+
+# これより短いテキストはレコードにそのまま持たせる
+BLOB_MIN_CHARS = 200
+
+
+def _blob_path(digest: str, blobs_dir: str = None) -> str:
+    """ハッシュ値から保存先パスを作る（先頭2文字でディレクトリを分ける）"""
+    return os.path.join(blobs_dir or BLOBS_DIR, digest[:2], f"{digest}.txt.gz")
+
+
+def is_ref(value: Any) -> bool:
+    """値が blob への参照か"""
+    return isinstance(value, dict) and set(value) == {"blob"}
+
+
+def put_text(text: str, blobs_dir: str = None) -> Dict[str, str]:
+    """テキストを保存して参照を返す（同じ内容はすでにあれば書き込まない）"""
+    data = text.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(digest, blobs_dir)
+
+    if os.path.exists(path):
+        # 既存の blob を再利用する場合も更新日時を新しくし、ガベージコレクションの対象外にする
+        try:
+            os.utime(path)
+            return {"blob": digest}
+        except FileNotFoundError:
+            pass
+
+    write_bytes_atomic(path, gzip.compress(data, compresslevel=6))
+
+    return {"blob": digest}
+
+
+def get_text(ref: Dict[str, str], blobs_dir: str = None) -> Optional[str]:
+    """参照からテキストを読み込む（見つからない場合は None）"""
+    try:
+        with open(_blob_path(ref['blob'], blobs_dir), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+    except FileNotFoundError:
+        return None
+
+
+def externalize(value: Any) -> Any:
+    """長いテキストなら blob に保存して参照に置き換える（それ以外はそのまま）"""
+    if isinstance(value, str) and len(value) >= BLOB_MIN_CHARS:
+        return put_text(value)
+    return value
+
+
+def resolve(value: Any) -> Any:
+    """参照ならテキストを読み込んで返す（旧形式のインライン文字列などはそのまま）"""
+    if is_ref(value):
+        return get_text(value)
+    return value
+
+
+def externalize_fields(record: Optional[Dict[str, Any]], fields: Iterable[str] = None) -> Optional[Dict[str, Any]]:
+    """辞書の指定フィールド（省略時は全フィールド）を externalize したコピーを返す"""
+    if record is None:
+        return None
+    return {
+        key: externalize(value) if fields is None or key in fields else value
+        for key, value in record.items()
+    }
+
+
+def resolve_fields(record: Optional[Dict[str, Any]], fields: Iterable[str] = None) -> Optional[Dict[str, Any]]:
+    """辞書の指定フィールド（省略時は全フィールド）の参照を解決したコピーを返す"""
+    if record is None:
+        return None
+    return {
+        key: resolve(value) if fields is None or key in fields else value
+        for key, value in record.items()
+    }
+
+
+def collect_references(value: Any, refs: set = None) -> set:
+    """レコード（入れ子の dict / list）に含まれる blob のハッシュ値を集める"""
+    if refs is None:
+        refs = set()
+    if is_ref(value):
+        refs.add(value['blob'])
+    elif isinstance(value, dict):
+        for item in value.values():
+            collect_references(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            collect_references(item, refs)
+    return refs
+
+
+def collect_garbage(referenced: set, grace_seconds: float = 3600, blobs_dir: str = None):
+    """
+    どこからも参照されていない blob を削除する
+    保存直後でまだ参照が書き込まれていない blob を消さないよう、grace_seconds より新しいものは残す
+
+    Returns:
+        (削除件数, 削除したバイト数)
+    """
+    blobs_dir = blobs_dir or BLOBS_DIR
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    removed_bytes = 0
+
+    if not os.path.isdir(blobs_dir):
+        return 0, 0
+
+    for root, _, files in os.walk(blobs_dir):
+        for name in files:
+            if not name.endswith('.txt.gz'):
+                continue
+            digest = name[:-len('.txt.gz')]
+            if digest in referenced:
+                continue
+
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            removed_bytes += stat.st_size
+
+    return removed, removed_bytes
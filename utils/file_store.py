@@ -0,0 +1,89 @@
+"""
+JSONファイルの安全な読み書き
+OSのファイルロックと「一時ファイルに書いてリネーム」で、
+複数プロセスから同じファイルを更新しても壊れないようにする
+"""
+import contextlib
+import json
+import os
+import tempfile
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    path 専用のロックファイル（path + '.lock'）で排他ロックを取得する
+    プロセス間・スレッド間のどちらでも有効
+    """
+    lock_path = path + '.lock'
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_json(path: str, default_factory: Callable[[], Any]):
+    """
+    JSONファイルを読み込む（存在しない場合は default_factory() を返す）
+    書き込みは常にリネームで行うため、ロックなしでも途中状態は見えない
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default_factory()
+
+
+def write_bytes_atomic(path: str, data: bytes):
+    """一時ファイルに書き込んでからリネームし、アトミックに置き換える"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path: str, data: Any):
+    """JSONをアトミックに書き込む"""
+    write_bytes_atomic(path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+@contextlib.contextmanager
+def locked_update(path: str, default_factory: Callable[[], Any]):
+    """
+    ロックを取得してJSONを読み込み、ブロックを抜けるときに保存する
+
+    使い方:
+        with locked_update(path, lambda: {"items": []}) as data:
+            data['items'].append(item)
+    """
+    with file_lock(path):
+        data = read_json(path, default_factory)
+        yield data
+        write_json_atomic(path, data)
@@ -0,0 +1,58 @@
+"""
+ID生成ユーティリティ
+ULID形式（時刻順に並ぶ26文字）の一意なIDを生成する
+"""
+import os
+import threading
+import time
+
+
+# Crockford's Base32（I, L, O, U を除く）
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+
+def _encode(value: int, length: int) -> str:
+    """整数を Base32 の固定長文字列に変換"""
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def new_ulid() -> str:
+    """
+    ULIDを生成する（48bitのミリ秒時刻 + 80bitの乱数）
+    同じミリ秒内で連続して呼ばれた場合は乱数部を1つ進め、必ず単調増加にする
+    """
+    global _last_ms, _last_random
+
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            # 同一ミリ秒（または時計の巻き戻り）: 直前の値から進める
+            now_ms = _last_ms
+            random_part = _last_random + 1
+            if random_part >= 1 << 80:
+                now_ms += 1
+                random_part = int.from_bytes(os.urandom(10), 'big')
+        else:
+            random_part = int.from_bytes(os.urandom(10), 'big')
+
+        _last_ms = now_ms
+        _last_random = random_part
+
+    return _encode(now_ms, 10) + _encode(random_part, 16)
+
+
+def new_id(prefix: str) -> str:
+    """
+    プレフィックス付きのIDを生成する
+
+    例: new_id("job") -> "job_01JAB3X6Q1M2V7R8K9T0W5Y4ZC"
+    """
+    return f"{prefix}_{new_ulid()}"
@@ -1,48 +1,127 @@
 """
 バックグラウンドジョブ管理システム
 """
-import json
 import os
 import datetime
+import socket
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Dict, Any, Callable
-from anthropic import Anthropic
+from utils.job_store import JobStore
+from utils.ids import new_id
+from utils.blob_store import externalize, externalize_fields, resolve_fields, collect_references, collect_garbage
+from utils.job_scheduler import get_scheduler
+from utils.retry_policy import RetryPolicy, DEFAULT_RETRY_POLICY
+from utils.response_cache import ResponseCache, make_key
+from utils import llm_gateway
+from utils import note_organizer
+from utils import token_budget
+from utils import telemetry
+from utils import analysis_history
+from utils import scenario_manager
 
 
 # ジョブ状態ファイルのパス
-JOBS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'jobs.json')
-ANALYSIS_HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'analysis_history.json')
-
-# ロック（スレッドセーフな操作のため）
-_jobs_lock = threading.Lock()
-_history_lock = threading.Lock()
+JOBS_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'jobs.db')
+JOBS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'jobs.json')  # 旧形式（移行元）
+RESPONSE_CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'response_cache.db')
+
+# ジョブストア（SQLite / WALモード）
+_job_store = JobStore(JOBS_DB_PATH, legacy_json_path=JOBS_FILE_PATH)
+
+# 同じリクエストへの応答キャッシュ（環境変数で変更可能。LLM_CACHE_MAX_MB=0 で無効）
+_response_cache = ResponseCache(
+    RESPONSE_CACHE_DB_PATH,
+    max_bytes=int(os.getenv('LLM_CACHE_MAX_MB', '50')) * 1024 * 1024,
+    ttl_seconds=float(os.getenv('LLM_CACHE_TTL_DAYS', '7')) * 24 * 60 * 60,
+)
+
+# 記事分析のモード（standard: 基本分析 → 深堀り分析の2回、fast: 1回の呼び出しで両方を出力）
+ANALYSIS_MODES = {
+    "standard": "標準（2段階で分析）",
+    "fast": "高速（1回で分析）",
+}
+
+# 高速分析の応答で基本分析・深堀り分析を区切る見出し行（prompts/analysis/fast_analysis.txt と揃える）
+FAST_ANALYSIS_BASIC_HEADING = "=== 基本分析 ==="
+FAST_ANALYSIS_DEEP_HEADING = "=== 深堀り分析 ==="
+
+# ジョブの変更バージョン（ワーカーが更新するたびに上がる）
+_change_lock = threading.Lock()
+_change_version = 0
+
+# 一覧表示用のスナップショット（バージョンが変わるか、一定時間経つまで再利用）
+SNAPSHOT_MAX_AGE = 5.0
+_snapshot_lock = threading.Lock()
+_snapshot = None  # (version, 作成時刻, データ)
+
+# キャンセル要求（job_id -> Event）。ストリーミング中の中断に使う
+# このプロセスで実行中のジョブの分だけを持ち、ワーカーの終了時に破棄する
+_cancel_events = {}
+_cancel_lock = threading.Lock()
+
+# このプロセスの識別情報（ジョブの実行担当を記録し、異常終了したプロセスのジョブを検出する）
+_PROCESS_OWNER = {"host": socket.gethostname(), "pid": os.getpid(), "token": new_id("proc")}
+
+
+def _on_jobs_changed():
+    """ジョブストアの変更通知を受けてバージョンを上げる"""
+    global _change_version
+    with _change_lock:
+        _change_version += 1
+
+
+_job_store.add_listener(_on_jobs_changed)
+
+
+def get_change_version() -> int:
+    """ジョブの変更バージョンを取得（変化していなければ一覧も変わっていない）"""
+    with _change_lock:
+        return _change_version
+
+
+def get_jobs_snapshot() -> Dict[str, Any]:
+    """
+    実行中・失敗したジョブの一覧をメモリから取得する
+    このプロセスでの変更はすぐに反映し、他プロセスの変更は SNAPSHOT_MAX_AGE 秒ごとに確認する
+
+    Returns:
+        {"version": int, "running": [...], "failed": [...]}
+    """
+    global _snapshot
+    with _snapshot_lock:
+        version = get_change_version()
+        if _snapshot is not None:
+            snapshot_version, created, data = _snapshot
+            if snapshot_version == version and time.monotonic() - created < SNAPSHOT_MAX_AGE:
+                return data
+
+        jobs = _job_store.list(statuses=['pending', 'running', 'failed'])
+        data = {
+            "version": version,
+            "running": [job for job in jobs if job['status'] in ['pending', 'running']],
+            "failed": [job for job in jobs if job['status'] == 'failed'],
+        }
+        # 読み込み中に他プロセスの変更を検知した場合は次回作り直す
+        _snapshot = (version, time.monotonic(), data)
+        return data
 
 
 def load_jobs():
     """ジョブ一覧を読み込む"""
-    try:
-        with _jobs_lock:
-            with open(JOBS_FILE_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except FileNotFoundError:
-        return {"version": "1.0.0", "jobs": []}
+    return {"version": "1.0.0", "jobs": _job_store.list()}
 
 
 def save_jobs(data):
-    """ジョブ一覧を保存する"""
-    with _jobs_lock:
-        os.makedirs(os.path.dirname(JOBS_FILE_PATH), exist_ok=True)
-        with open(JOBS_FILE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
+    """ジョブ一覧を保存する（一覧全体を置き換える）"""
+    _job_store.replace_all(data.get('jobs', []))
 
-def create_job(job_type: str, title: str, params: Dict[str, Any]) -> str:
-    """新しいジョブを作成"""
-    jobs_data = load_jobs()
 
+def create_job(job_type: str, title: str, params: Dict[str, Any], job_id: str = None) -> str:
+    """新しいジョブを作成（job_id を省略すると新しいIDを発行）"""
     # ジョブIDを生成
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    job_id = f"job_{timestamp}"
+    job_id = job_id or new_id("job")
 
     # 新しいジョブを作成
     new_job = {
@@ -50,202 +129,655 @@ def create_job(job_type: str, title: str, params: Dict[str, Any]) -> str:
         "type": job_type,
         "status": "pending",
         "title": title,
-        "params": params,
+        "params": externalize_fields(params),
         "result": None,
         "error": None,
         "created_at": datetime.datetime.now().isoformat(),
         "started_at": None,
         "completed_at": None,
-        "progress": 0
+        "progress": 0,
+        "owner": dict(_PROCESS_OWNER),
+        "checkpoints": {}
     }
 
-    # ジョブリストに追加
-    jobs_data['jobs'].insert(0, new_job)
-
     # 保存
-    save_jobs(jobs_data)
+    _job_store.insert(new_job)
 
     return job_id
 
 
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたことを表す例外"""
+
+
+class BatchWaitInterrupted(Exception):
+    """送信済みのバッチの完了待ちが中断された（バッチは処理を続けており、再開時に再接続できる）"""
+
+
 def update_job_status(job_id: str, status: str, progress: int = None, result: Any = None, error: str = None):
-    """ジョブの状態を更新"""
-    jobs_data = load_jobs()
+    """ジョブの状態を更新（キャンセル済みのジョブは更新しない）"""
+    def apply(job):
+        if job['status'] == "cancelled":
+            return
 
-    for job in jobs_data['jobs']:
-        if job['id'] == job_id:
-            job['status'] = status
+        job['status'] = status
 
-            if progress is not None:
-                job['progress'] = progress
+        if progress is not None:
+            job['progress'] = progress
 
-            if status == "running" and job['started_at'] is None:
-                job['started_at'] = datetime.datetime.now().isoformat()
+        if status == "running" and job['started_at'] is None:
+            job['started_at'] = datetime.datetime.now().isoformat()
 
-            if status in ["completed", "failed"]:
-                job['completed_at'] = datetime.datetime.now().isoformat()
+        if status in ["completed", "failed"]:
+            job['completed_at'] = datetime.datetime.now().isoformat()
 
-            if result is not None:
-                job['result'] = result
+        if result is not None:
+            # 長いテキストは blob に保存し、ジョブには参照だけを持たせる
+            job['result'] = externalize_fields(result) if isinstance(result, dict) else externalize(result)
 
-            if error is not None:
-                job['error'] = error
+        if error is not None:
+            job['error'] = error
 
-            break
+    _job_store.update(job_id, apply)
 
-    save_jobs(jobs_data)
 
+def save_checkpoint(job_id: str, stage: str, output: Any):
+    """ステージの出力をチェックポイントとしてジョブに保存（長いテキストは blob に保存）"""
+    output = externalize(output)
 
-def get_job(job_id: str) -> Optional[Dict[str, Any]]:
-    """ジョブ情報を取得"""
-    jobs_data = load_jobs()
+    def apply(job):
+        job.setdefault('checkpoints', {})[stage] = output
 
-    for job in jobs_data['jobs']:
-        if job['id'] == job_id:
-            return job
+    _job_store.update(job_id, apply)
 
-    return None
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """ジョブ情報を取得（長いテキストは参照のまま）"""
+    return _job_store.get(job_id)
 
 
 def delete_job(job_id: str):
     """ジョブを削除"""
-    jobs_data = load_jobs()
-    jobs_data['jobs'] = [job for job in jobs_data['jobs'] if job['id'] != job_id]
-    save_jobs(jobs_data)
+    _job_store.delete(job_id)
+
+
+def cancel_job(job_id: str) -> bool:
+    """
+    ジョブをキャンセルする
+    待機中ならキューから外し、実行中ならステージの区切りやストリーミング受信中に中断させる
+
+    Returns:
+        キャンセル状態になった場合 True
+    """
+    dequeued = get_scheduler().cancel(job_id)
+
+    def apply(job):
+        if job['status'] in ['pending', 'running']:
+            job['status'] = "cancelled"
+            job['completed_at'] = datetime.datetime.now().isoformat()
+
+    job = _job_store.update(job_id, apply)
+
+    # このプロセスで実行中のジョブだけに知らせる（他プロセスのジョブ・完了済みのジョブは状態の更新で止まる）
+    with _cancel_lock:
+        event = _cancel_events.pop(job_id, None) if dequeued else _cancel_events.get(job_id)
+    if event is not None:
+        event.set()
+
+    return bool(job and job['status'] == "cancelled")
+
+
+def _cancel_event(job_id: str) -> threading.Event:
+    """実行中のジョブのキャンセル要求イベントを取得（ワーカーから呼ぶ。終了時に finally で破棄する）"""
+    with _cancel_lock:
+        return _cancel_events.setdefault(job_id, threading.Event())
+
+
+def is_cancelled(job_id: str) -> bool:
+    """ジョブがキャンセル（または削除）されたか"""
+    with _cancel_lock:
+        event = _cancel_events.get(job_id)
+    if event is not None and event.is_set():
+        return True
+    job = get_job(job_id)
+    return job is None or job['status'] == "cancelled"
+
+
+def _raise_if_cancelled(job_id: str):
+    """キャンセルされていれば JobCancelled を送出"""
+    if is_cancelled(job_id):
+        raise JobCancelled(job_id)
+
+
+def _record_usage(job_id: str, stage: str, completion: llm_gateway.Completion, max_tokens: int = None, usage_key: str = None, metrics: Dict[str, Any] = None):
+    """
+    API呼び出しのトークン使用量（プロンプトキャッシュの書き込み・読み込みを含む）と処理時間・再試行回数を
+    ジョブの usage に記録し、計測ログ（telemetry）にも追記する
+    max_tokens で途切れた場合はジョブの truncated にも記録する
+    usage_key を指定すると、出力トークン数を max_tokens を決めるための実績として保存する
+
+    Args:
+        metrics: 併せて記録する計測値（seconds / ttft_seconds / template_version / response_cache など）
+    """
+    truncated = completion.stop_reason == "max_tokens"
+    output_tokens = completion.usage.get('output_tokens', 0)
+    logged = {}
+
+    def apply(job):
+        retry_info = (job.get('retries') or {}).get(stage) or {}
+        entry = dict(
+            completion.usage,
+            model=completion.model,
+            max_tokens=max_tokens,
+            stop_reason=completion.stop_reason,
+            retries=retry_info.get('attempts', 1) - 1,
+            retry_wait_seconds=retry_info.get('wait_seconds', 0.0),
+            **(metrics or {})
+        )
+        job.setdefault('usage', {})[stage] = entry
+        if truncated:
+            job.setdefault('truncated', {})[stage] = {"max_tokens": max_tokens, "output_tokens": output_tokens}
+        logged.update(entry, job_id=job_id, job_type=job.get('type'), stage=stage, usage_key=usage_key)
+
+    _job_store.update(job_id, apply)
+
+    if logged:
+        try:
+            telemetry.record(dict(logged, at=datetime.datetime.now().isoformat(timespec='seconds')))
+        except OSError as e:
+            print(f"計測ログの保存エラー: {e}")
+
+    if usage_key:
+        try:
+            token_budget.record(usage_key, output_tokens, max_tokens, truncated=truncated)
+        except OSError as e:
+            print(f"トークン実績の保存エラー: {e}")
+
+
+def _cached_completion(text: str, model: str = None) -> llm_gateway.Completion:
+    """応答キャッシュから返した結果（API は呼ばないためトークン数は0）"""
+    return llm_gateway.Completion(text, model=model, usage={
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+    })
+
+
+def response_cache_enabled() -> bool:
+    """応答キャッシュが有効か"""
+    return _response_cache.enabled
+
+
+def get_response_cache_stats() -> Dict[str, int]:
+    """応答キャッシュの件数と合計サイズ"""
+    return _response_cache.stats()
+
+
+def clear_response_cache():
+    """応答キャッシュをすべて削除"""
+    _response_cache.clear()
+
+
+def _record_cache_status(job_id: str, stage: str, status: str):
+    """ステージの応答キャッシュの状態（hit / miss / refresh）をジョブに記録"""
+    def apply(job):
+        job.setdefault('response_cache', {})[stage] = status
+
+    _job_store.update(job_id, apply)
+
+
+def _response_cache_key(template_version: Optional[str], request: Dict[str, Any]) -> str:
+    """応答キャッシュのキー（モデル・テンプレートのバージョン・プロンプト・max_tokens）"""
+    return make_key(
+        model=request.get('model'),
+        template_version=template_version,
+        messages=request.get('messages'),
+        system=request.get('system'),
+        max_tokens=request.get('max_tokens'),
+    )
+
+
+def _generate_text(api_key: str, job_id: str, stage: str = None, template_version: str = None, usage_key: str = None, force_refresh: bool = False, validate: Callable[[str], Any] = None, use_cache: bool = True, **kwargs) -> str:
+    """
+    共有ゲートウェイでストリーミング生成する
+    受信中にキャンセルされたら接続を閉じて JobCancelled を送出する
+    （他プロセスからのキャンセルは1秒ごとにジョブの状態で確認）
+    stage を指定するとトークン使用量・処理時間をジョブと計測ログに記録し、同じリクエストへの応答はキャッシュから返す
+
+    Args:
+        template_version: プロンプトテンプレートのバージョン（キャッシュキーに含める）
+        usage_key: 出力トークン数の実績を記録するキー（token_budget.usage_key）
+        force_refresh: キャッシュを使わずに API を呼び出す（結果でキャッシュを更新する）
+        validate: 応答を検証する関数（例外を送出した応答はキャッシュしない）
+        use_cache: False なら応答キャッシュを読み書きしない
+    """
+    started = time.monotonic()
+    metrics = {"template_version": template_version}
+
+    cache_key = None
+    if stage and use_cache and _response_cache.enabled:
+        cache_key = _response_cache_key(template_version, kwargs)
+        if not force_refresh:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                _record_cache_status(job_id, stage, "hit")
+                metrics.update(seconds=round(time.monotonic() - started, 3), response_cache="hit")
+                _record_usage(job_id, stage, _cached_completion(cached, kwargs.get('model')), max_tokens=kwargs.get('max_tokens'), usage_key=usage_key, metrics=metrics)
+                return cached
+        metrics['response_cache'] = "refresh" if force_refresh else "miss"
+        _record_cache_status(job_id, stage, metrics['response_cache'])
+
+    event = _cancel_event(job_id)
+    last_checked = [time.monotonic()]
+    first_text_at = []
+
+    def on_text(_text):
+        if not first_text_at:
+            first_text_at.append(time.monotonic())
+
+        if event.is_set():
+            raise JobCancelled(job_id)
+
+        if time.monotonic() - last_checked[0] >= 1.0:
+            last_checked[0] = time.monotonic()
+            _raise_if_cancelled(job_id)
+
+    completion = llm_gateway.stream(api_key, on_text=on_text, **kwargs)
+    if stage:
+        finished = time.monotonic()
+        metrics.update(
+            seconds=round(finished - started, 3),
+            ttft_seconds=round(first_text_at[0] - started, 3) if first_text_at else None
+        )
+        _record_usage(job_id, stage, completion, max_tokens=kwargs.get('max_tokens'), usage_key=usage_key, metrics=metrics)
+    if validate:
+        validate(completion.text)
+    # 上限で途切れた応答はキャッシュしない
+    if cache_key and completion.stop_reason != "max_tokens":
+        _response_cache.put(cache_key, completion.text)
+    return completion.text
 
 
 def get_running_jobs():
     """実行中のジョブを取得"""
-    jobs_data = load_jobs()
-    return [job for job in jobs_data['jobs'] if job['status'] in ['pending', 'running']]
+    return _job_store.list(statuses=['pending', 'running'])
+
+
+def get_queue_position(job_id: str) -> Optional[int]:
+    """待機中ジョブの実行順（1始まり、キューにない場合は None）"""
+    return get_scheduler().queue_position(job_id)
 
 
 def get_completed_jobs():
     """完了したジョブを取得"""
-    jobs_data = load_jobs()
-    return [job for job in jobs_data['jobs'] if job['status'] == 'completed']
+    return _job_store.list(statuses=['completed'])
 
 
 def cleanup_old_jobs(days: int = 7):
     """古い完了済みジョブを削除"""
-    jobs_data = load_jobs()
-    cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days)
+    cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+    for status in ['completed', 'failed']:
+        _job_store.prune(status, older_than=cutoff_date)
+
+
+# =====================================================
+# ジョブの自動整理（保持期間・件数・サイズの上限）
+# =====================================================
+
+# ステータスごとの保持ポリシー（環境変数で変更可能）
+RETENTION_POLICY = {
+    status: {
+        "max_age_days": int(os.getenv('JOB_RETENTION_DAYS', '7')),
+        "max_count": int(os.getenv('JOB_RETENTION_MAX_COUNT', '200')),
+        "max_bytes": int(os.getenv('JOB_RETENTION_MAX_MB', '50')) * 1024 * 1024,
+    }
+    for status in ['completed', 'failed', 'cancelled']
+}
+
+# 自動整理の実行間隔（秒）
+RETENTION_INTERVAL_SECONDS = int(os.getenv('JOB_RETENTION_INTERVAL', '600'))
+
+# 中断したジョブ（担当プロセスの異常終了・バッチの状態確認の失敗）を確認する間隔（秒）
+ORPHAN_CHECK_INTERVAL_SECONDS = int(os.getenv('JOB_ORPHAN_CHECK_INTERVAL', '60'))
+
+_retention_report = None
+_retention_thread = None
+_retention_lock = threading.Lock()
+
+
+def run_retention(policy: Dict[str, Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    保持ポリシーに従って古いジョブを削除し、参照されなくなった blob も削除する
+
+    Returns:
+        {"jobs_pruned": 件数, "bytes_reclaimed": バイト数, "blobs_removed": 件数, "by_status": {...}, "ran_at": 日時}
+    """
+    global _retention_report
+    policy = policy or RETENTION_POLICY
+    now = datetime.datetime.now()
+
+    report = {"jobs_pruned": 0, "bytes_reclaimed": 0, "blobs_removed": 0, "by_status": {}}
+    for status, limits in policy.items():
+        older_than = None
+        if limits.get('max_age_days') is not None:
+            older_than = (now - datetime.timedelta(days=limits['max_age_days'])).isoformat()
+
+        count, size = _job_store.prune(
+            status,
+            older_than=older_than,
+            max_count=limits.get('max_count'),
+            max_bytes=limits.get('max_bytes')
+        )
+        report['by_status'][status] = {"jobs_pruned": count, "bytes_reclaimed": size}
+        report['jobs_pruned'] += count
+        report['bytes_reclaimed'] += size
+
+    # ジョブ・分析履歴・シナリオ履歴のどこからも参照されていない blob を削除
+    referenced = collect_references(_job_store.list())
+    for analysis in analysis_history.iter_analyses():
+        collect_references(analysis, referenced)
+    collect_references(scenario_manager.load_scenario_history(), referenced)
+    blobs_removed, blob_bytes = collect_garbage(referenced)
+    report['blobs_removed'] = blobs_removed
+    report['bytes_reclaimed'] += blob_bytes
+
+    report['ran_at'] = now.isoformat()
+    _retention_report = report
+
+    if report['jobs_pruned'] or blobs_removed:
+        print(f"ジョブ自動整理: {report['jobs_pruned']}件のジョブ・{blobs_removed}件のblobを削除（{report['bytes_reclaimed']:,} bytes）")
+
+    return report
+
+
+def get_retention_report() -> Optional[Dict[str, Any]]:
+    """直近の自動整理の結果（未実行の場合は None）"""
+    return _retention_report
 
-    jobs_data['jobs'] = [
-        job for job in jobs_data['jobs']
-        if job['status'] not in ['completed', 'failed'] or
-        datetime.datetime.fromisoformat(job['created_at']) > cutoff_date
-    ]
 
-    save_jobs(jobs_data)
+def _retention_loop():
+    """バックグラウンドで定期的に自動整理を実行し、中断したジョブがあれば再開する"""
+    next_retention = 0.0
+    while True:
+        if time.monotonic() >= next_retention:
+            try:
+                run_retention()
+            except Exception as e:
+                print(f"ジョブ自動整理エラー: {e}")
+            next_retention = time.monotonic() + RETENTION_INTERVAL_SECONDS
+
+        if _resume_context is not None:
+            try:
+                resume_orphaned_jobs(*_resume_context)
+            except Exception as e:
+                print(f"ジョブ再開エラー: {e}")
+
+        time.sleep(max(0.0, min(ORPHAN_CHECK_INTERVAL_SECONDS, next_retention - time.monotonic())))
+
+
+def start_retention_worker():
+    """自動整理（と中断したジョブの再確認）のバックグラウンドスレッドを起動（起動済みなら何もしない）"""
+    global _retention_thread
+    with _retention_lock:
+        if _retention_thread is None:
+            _retention_thread = threading.Thread(target=_retention_loop, name="job-retention", daemon=True)
+            _retention_thread.start()
 
 
 # =====================================================
-# 分析履歴への自動保存
+# 中断したジョブの再開
 # =====================================================
 
-def save_analysis_to_history(title: str, content: str, basic_analysis: str, deep_analysis: str, themes: str = None):
-    """分析結果を履歴に保存する"""
+def _is_owner_alive(owner: Optional[Dict[str, Any]]) -> bool:
+    """ジョブを担当しているプロセスが生きているか"""
+    if not owner:
+        return False
+
+    # 他ホストのプロセスは確認できないので生存扱い
+    if owner.get('host') != _PROCESS_OWNER['host']:
+        return True
+
+    if owner.get('pid') == _PROCESS_OWNER['pid']:
+        # 再起動でPIDが再利用された場合はトークンで区別する
+        return owner.get('token') == _PROCESS_OWNER['token']
+
     try:
-        with _history_lock:
-            # 履歴を読み込み
-            try:
-                with open(ANALYSIS_HISTORY_PATH, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except FileNotFoundError:
-                history = {"version": "1.0.0", "last_updated": datetime.datetime.now().strftime("%Y-%m-%d"), "analyses": []}
-
-            # 新しい分析IDを生成
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            analysis_id = f"ana_{timestamp}"
-
-            # タイトルが空の場合、記事内容の最初の50文字を使用
-            if not title or title.strip() == "":
-                # 改行やタブを除去して最初の50文字を取得
-                clean_content = content.replace('\n', ' ').replace('\t', ' ').strip()
-                title = clean_content[:50] + "..." if len(clean_content) > 50 else clean_content
-
-            # 要約を生成（記事内容の最初の100文字）
-            summary = content[:100] + "..." if len(content) > 100 else content
-
-            # 新しい分析データを作成
-            new_analysis = {
-                "id": analysis_id,
-                "title": title,
-                "content": content,
-                "summary": summary,
-                "basic_analysis": basic_analysis,
-                "deep_analysis": deep_analysis,
-                "themes": themes,
-                "created_at": datetime.datetime.now().isoformat(),
-            }
+        os.kill(owner['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _claim_orphaned_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """担当プロセスが終了しているジョブを、このプロセスの担当に切り替える"""
+    def apply(job):
+        if job['status'] in ['pending', 'running'] and not _is_owner_alive(job.get('owner')):
+            job['owner'] = dict(_PROCESS_OWNER)
+            job['status'] = "pending"
+            job['resumed_count'] = job.get('resumed_count', 0) + 1
+
+    job = _job_store.update(job_id, apply)
+    if job and job.get('owner') == _PROCESS_OWNER and job['status'] == "pending":
+        return job
+    return None
 
-            # 履歴に追加（最新が先頭）
-            history['analyses'].insert(0, new_analysis)
 
-            # 保存
-            history['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d")
-            os.makedirs(os.path.dirname(ANALYSIS_HISTORY_PATH), exist_ok=True)
-            with open(ANALYSIS_HISTORY_PATH, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+# 定期的な再確認で再開に使う (api_key, prompts)（start_background_workers で設定）
+_resume_context = None
+
+
+def resume_orphaned_jobs(api_key: str, prompts) -> int:
+    """
+    異常終了したプロセスに残された pending / running のジョブを検出し、
+    最後に完了したステージの続きから再開する
+    担当をこのプロセスに切り替えたジョブだけを再開するので、何度呼んでも同じジョブを二重に実行しない
+
+    Returns:
+        再開したジョブ数
+    """
+    if not api_key:
+        return 0
+
+    resumed = 0
+    for job in get_running_jobs():
+        if _is_owner_alive(job.get('owner')):
+            continue
+
+        job = _claim_orphaned_job(job['id'])
+        if job is None:
+            continue
+
+        params = resolve_fields(job.get('params') or {})
+        if params.get('batch_job_id'):
+            # バッチ分析の記事は、まとめて実行するジョブ（analysis_batch）の再開に任せる
+            continue
+        elif job['type'] == "analysis_batch" and params.get('job_ids'):
+            start_article_analysis_batch_job(
+                job_id=job['id'],
+                api_key=api_key,
+                job_ids=params['job_ids'],
+                prompts=prompts,
+                num_themes=params.get('num_themes', 6),
+                force_refresh=params.get('force_refresh', False),
+                auto_generate_themes=params.get('auto_generate_themes', True)
+            )
+        elif job['type'] == "analysis" and params.get('article_content'):
+            start_article_analysis_job(
+                job_id=job['id'],
+                api_key=api_key,
+                article_title=params.get('article_title', ''),
+                article_content=params['article_content'],
+                prompts=prompts,
+                auto_generate_themes=params.get('auto_generate_themes', True),
+                num_themes=params.get('num_themes', 6),
+                force_refresh=params.get('force_refresh', False),
+                analysis_mode=params.get('analysis_mode', "standard")
+            )
+        elif job['type'] == "theme_generation" and params.get('analysis_result'):
+            start_theme_generation_job(
+                job_id=job['id'],
+                api_key=api_key,
+                analysis_result=params['analysis_result'],
+                num_themes=params.get('num_themes', 6),
+                prompts=prompts,
+                force_refresh=params.get('force_refresh', False)
+            )
+        elif job['type'] == "note_organization" and params.get('notes'):
+            start_note_organization_job(
+                job_id=job['id'],
+                api_key=api_key,
+                notes=params['notes'],
+                category_info_text=params.get('category_info_text', ''),
+                batch=params.get('batch', False)
+            )
+        else:
+            update_job_status(job['id'], "failed", error="ジョブの再開に必要な情報がありません")
+            continue
 
-            return analysis_id
-    except Exception as e:
-        print(f"履歴保存エラー: {e}")
-        return None
+        resumed += 1
+
+    return resumed
+
+
+def start_background_workers(api_key: Optional[str], prompts) -> int:
+    """
+    アプリの起動時に1回呼ぶ：中断したジョブを再開し、自動整理のスレッドを起動する
+    以降は自動整理のスレッドが ORPHAN_CHECK_INTERVAL_SECONDS ごとに中断したジョブを再確認する
+
+    Returns:
+        再開したジョブ数
+    """
+    global _resume_context
+    if api_key:
+        _resume_context = (api_key, prompts)
+    resumed = resume_orphaned_jobs(api_key, prompts)
+    start_retention_worker()
+    return resumed
 
 
 # =====================================================
 # 記事分析用のバックグラウンドタスク
 # =====================================================
 
-def run_article_analysis_job(job_id: str, api_key: str, article_title: str, article_content: str, prompts, auto_generate_themes: bool = True, num_themes: int = 6):
-    """記事分析をバックグラウンドで実行し、自動的にテーマ生成も行う"""
-    try:
-        update_job_status(job_id, "running", progress=10)
+def _record_retry(job_id: str, stage: str, attempt: int, delay: float, error: Exception):
+    """リトライの状況をジョブに記録（試行回数・待ち時間の合計・直近のエラー）"""
+    def apply(job):
+        retries = job.setdefault('retries', {})
+        info = retries.setdefault(stage, {"attempts": 1, "wait_seconds": 0.0, "last_error": None})
+        info['attempts'] = attempt + 1
+        info['wait_seconds'] = round(info['wait_seconds'] + delay, 2)
+        info['last_error'] = f"{type(error).__name__}: {error}"
+
+    _job_store.update(job_id, apply)
+
+
+def _cancellable_sleep(job_id: str, delay: float):
+    """再試行までの待機（待機中にキャンセルされたらすぐに JobCancelled を送出する）"""
+    event = _cancel_event(job_id)
+    # イベントを作る前にキャンセルされていた場合は待たずに止める
+    _raise_if_cancelled(job_id)
+    if event.wait(delay):
+        raise JobCancelled(job_id)
+    _raise_if_cancelled(job_id)
+
+
+def _run_stage(job_id: str, checkpoints: Dict[str, Any], stage: str, call: Callable[[], Any], policy: RetryPolicy = DEFAULT_RETRY_POLICY):
+    """
+    チェックポイントがあれば再利用し、なければ実行して保存する
+    一時的なAPIエラーはこのステージだけを再試行する（完了済みのステージは再実行しない）
+    """
+    if stage in checkpoints:
+        return checkpoints[stage]
+
+    _raise_if_cancelled(job_id)
+
+    output = policy.call(
+        call,
+        on_retry=lambda attempt, delay, error: _record_retry(job_id, stage, attempt, delay, error),
+        sleep=lambda delay: _cancellable_sleep(job_id, delay)
+    )
+    save_checkpoint(job_id, stage, output)
+    checkpoints[stage] = output
+    return output
+
+
+def _basic_analysis_request(prompts, article_title: str, article_content: str) -> Dict[str, Any]:
+    """基本分析のリクエスト（指示部分はプロンプトキャッシュから読み、記事部分だけを新たに処理させる）"""
+    content = prompts.format_blocks(
+        "analysis",
+        "basic_analysis",
+        article_title=article_title or "（タイトルなし）",
+        article_content=article_content
+    )
+    key = token_budget.usage_key("basic_analysis")
+    return {
+        "template_version": prompts.version("analysis", "basic_analysis"),
+        "usage_key": key,
+        "model": llm_gateway.DEFAULT_MODEL,
+        "max_tokens": token_budget.choose_max_tokens(key, default=3000),
+        "messages": [{"role": "user", "content": content}],
+    }
 
-        client = Anthropic(api_key=api_key)
 
-        # 基本分析
-        update_job_status(job_id, "running", progress=20)
-        prompt = prompts.format(
-            "analysis",
-            "basic_analysis",
-            article_title=article_title or "（タイトルなし）",
-            article_content=article_content
-        )
+def _deep_analysis_request(prompts, article_content: str, basic_analysis: str) -> Dict[str, Any]:
+    """深堀り分析のリクエスト"""
+    content = prompts.format_blocks(
+        "analysis",
+        "deep_analysis",
+        article_content=article_content,
+        basic_analysis=basic_analysis
+    )
+    key = token_budget.usage_key("deep_analysis")
+    return {
+        "template_version": prompts.version("analysis", "deep_analysis"),
+        "usage_key": key,
+        "model": llm_gateway.DEFAULT_MODEL,
+        "max_tokens": token_budget.choose_max_tokens(key, default=4000),
+        "messages": [{"role": "user", "content": content}],
+    }
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=3000,
-            messages=[{"role": "user", "content": prompt}]
-        )
 
-        basic_analysis = message.content[0].text
-        update_job_status(job_id, "running", progress=40)
+def _fast_analysis_request(prompts, article_title: str, article_content: str) -> Dict[str, Any]:
+    """高速分析のリクエスト（基本分析と深堀り分析を1回の呼び出しでまとめて出力させる）"""
+    content = prompts.format_blocks(
+        "analysis",
+        "fast_analysis",
+        article_title=article_title or "（タイトルなし）",
+        article_content=article_content
+    )
+    key = token_budget.usage_key("fast_analysis")
+    return {
+        "template_version": prompts.version("analysis", "fast_analysis"),
+        "usage_key": key,
+        "model": llm_gateway.DEFAULT_MODEL,
+        "max_tokens": token_budget.choose_max_tokens(key, default=7000),
+        "messages": [{"role": "user", "content": content}],
+    }
 
-        # 深堀り分析
-        prompt = prompts.format(
-            "analysis",
-            "deep_analysis",
-            article_content=article_content,
-            basic_analysis=basic_analysis
-        )
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+def _split_fast_analysis(text: str):
+    """
+    高速分析の応答を基本分析と深堀り分析に分ける
 
-        deep_analysis = message.content[0].text
-        update_job_status(job_id, "running", progress=60)
+    Raises:
+        ValueError: 見出し行が見つからない場合（出力が途中で途切れた場合など）
+    """
+    basic_start = text.find(FAST_ANALYSIS_BASIC_HEADING)
+    deep_start = text.find(FAST_ANALYSIS_DEEP_HEADING)
+    if basic_start < 0 or deep_start < basic_start:
+        raise ValueError("高速分析の応答に「基本分析」「深堀り分析」の見出しがありません")
 
-        # 自動的にテーマ生成を実行
-        themes = None
-        if auto_generate_themes:
-            # 分析結果を統合
-            analysis_result = f"""
+    basic_analysis = text[basic_start + len(FAST_ANALYSIS_BASIC_HEADING):deep_start].strip()
+    deep_analysis = text[deep_start + len(FAST_ANALYSIS_DEEP_HEADING):].strip()
+    return basic_analysis, deep_analysis
+
+
+def _combine_analysis(basic_analysis: str, deep_analysis: str) -> str:
+    """テーマ生成に渡す分析結果を統合"""
+    return f"""
 【基本分析】
 {basic_analysis}
 
@@ -253,102 +785,152 @@ def run_article_analysis_job(job_id: str, api_key: str, article_title: str, arti
 {deep_analysis}
 """
 
-            update_job_status(job_id, "running", progress=70)
 
-            # story_tips を読み込み（キャッシュを使わない）
-            story_tips = prompts.load("theme_generation", "story_tips", use_cache=False)
+def _themes_request(prompts, analysis_result: str, num_themes: int) -> Dict[str, Any]:
+    """テーマ生成のリクエスト（story_tips を含む指示部分はプロンプトキャッシュの対象）"""
+    # story_tips を読み込み（キャッシュを使わない）
+    story_tips = prompts.load("theme_generation", "story_tips", use_cache=False)
 
-            # テーマ生成プロンプト作成
-            prompt = prompts.format(
-                "theme_generation",
-                "generate_themes",
-                analysis_result=analysis_result,
-                num_themes=num_themes,
-                story_tips=story_tips
-            )
+    content = prompts.format_blocks(
+        "theme_generation",
+        "generate_themes",
+        analysis_result=analysis_result,
+        num_themes=num_themes,
+        story_tips=story_tips
+    )
+    # 実績が少ないうちはテーマ数から見積もる
+    key = token_budget.usage_key("themes", num_themes)
+    return {
+        "template_version": prompts.version("theme_generation", "generate_themes"),
+        "usage_key": key,
+        "model": llm_gateway.DEFAULT_MODEL,
+        "max_tokens": token_budget.choose_max_tokens(key, default=min(num_themes * 600 + 1000, 8000)),
+        "messages": [{"role": "user", "content": content}],
+    }
 
-            # テーマ生成API呼び出し
-            estimated_tokens = min(num_themes * 600 + 1000, 8000)
 
-            message = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=estimated_tokens,
-                messages=[{"role": "user", "content": prompt}]
-            )
+def _complete_article_analysis(job_id: str, checkpoints: Dict[str, Any], article_title: str, article_content: str, basic_analysis: str, deep_analysis: str, themes: Optional[str], num_themes: int):
+    """分析結果を履歴に保存し、ジョブを完了にする"""
+    # 自動的に履歴に保存（再開時に二重保存しないようチェックポイントに記録）
+    # チェックポイントの記録・ジョブの完了より前に、履歴をディスクに書き込む
+    _run_stage(job_id, checkpoints, "history_id", lambda: analysis_history.save_analysis(
+        title=article_title,
+        content=article_content,
+        basic_analysis=basic_analysis,
+        deep_analysis=deep_analysis,
+        themes=themes,
+        stage_metrics=(get_job(job_id) or {}).get('usage'),
+        durable=True
+    ))
+
+    # 結果を保存
+    result = {
+        "article_title": article_title,
+        "article_content": article_content,
+        "basic_analysis": basic_analysis,
+        "deep_analysis": deep_analysis,
+        "themes": themes,
+        "num_themes": num_themes
+    }
 
-            themes = message.content[0].text
-            update_job_status(job_id, "running", progress=90)
+    update_job_status(job_id, "completed", progress=100, result=result)
 
-        # 結果を保存
-        result = {
-            "article_title": article_title,
-            "article_content": article_content,
-            "basic_analysis": basic_analysis,
-            "deep_analysis": deep_analysis,
-            "themes": themes,
-            "num_themes": num_themes
-        }
 
-        update_job_status(job_id, "completed", progress=100, result=result)
+def run_article_analysis_job(job_id: str, api_key: str, article_title: str, article_content: str, prompts, auto_generate_themes: bool = True, num_themes: int = 6, force_refresh: bool = False, analysis_mode: str = "standard"):
+    """
+    記事分析をバックグラウンドで実行し、自動的にテーマ生成も行う
+    force_refresh が True なら応答キャッシュを使わずに分析し直す
+    analysis_mode が "fast" なら基本分析と深堀り分析を1回の呼び出しで行う
+    """
+    try:
+        update_job_status(job_id, "running", progress=10)
 
-        # 自動的に履歴に保存
-        save_analysis_to_history(
-            title=article_title,
-            content=article_content,
-            basic_analysis=basic_analysis,
-            deep_analysis=deep_analysis,
-            themes=themes
-        )
+        # 再開時は完了済みステージの結果を使い、同じAPI呼び出しを繰り返さない
+        job = get_job(job_id) or {}
+        checkpoints = resolve_fields(job.get('checkpoints') or {})
 
+        update_job_status(job_id, "running", progress=20)
+
+        if analysis_mode == "fast":
+            # 高速分析（基本分析と深堀り分析を1回で出力させて分ける）
+            fast_analysis = _run_stage(job_id, checkpoints, "fast_analysis", lambda: _generate_text(
+                api_key, job_id, "fast_analysis",
+                force_refresh=force_refresh,
+                validate=_split_fast_analysis,
+                **_fast_analysis_request(prompts, article_title, article_content)
+            ))
+            basic_analysis, deep_analysis = _split_fast_analysis(fast_analysis)
+        else:
+            # 基本分析
+            basic_analysis = _run_stage(job_id, checkpoints, "basic_analysis", lambda: _generate_text(
+                api_key, job_id, "basic_analysis",
+                force_refresh=force_refresh,
+                **_basic_analysis_request(prompts, article_title, article_content)
+            ))
+            update_job_status(job_id, "running", progress=40)
+
+            # 深堀り分析
+            deep_analysis = _run_stage(job_id, checkpoints, "deep_analysis", lambda: _generate_text(
+                api_key, job_id, "deep_analysis",
+                force_refresh=force_refresh,
+                **_deep_analysis_request(prompts, article_content, basic_analysis)
+            ))
+        update_job_status(job_id, "running", progress=60)
+
+        # 自動的にテーマ生成を実行
+        themes = None
+        if auto_generate_themes:
+            update_job_status(job_id, "running", progress=70)
+
+            themes = _run_stage(job_id, checkpoints, "themes", lambda: _generate_text(
+                api_key, job_id, "themes",
+                force_refresh=force_refresh,
+                **_themes_request(prompts, _combine_analysis(basic_analysis, deep_analysis), num_themes)
+            ))
+            update_job_status(job_id, "running", progress=90)
+
+        _complete_article_analysis(job_id, checkpoints, article_title, article_content, basic_analysis, deep_analysis, themes, num_themes)
+
+    except JobCancelled:
+        pass
     except Exception as e:
         update_job_status(job_id, "failed", error=str(e))
+    finally:
+        with _cancel_lock:
+            _cancel_events.pop(job_id, None)
 
 
-def start_article_analysis_job(job_id: str, api_key: str, article_title: str, article_content: str, prompts, auto_generate_themes: bool = True, num_themes: int = 6):
-    """記事分析ジョブをバックグラウンドで開始"""
-    thread = threading.Thread(
-        target=run_article_analysis_job,
-        args=(job_id, api_key, article_title, article_content, prompts, auto_generate_themes, num_themes),
-        daemon=True
+def start_article_analysis_job(job_id: str, api_key: str, article_title: str, article_content: str, prompts, auto_generate_themes: bool = True, num_themes: int = 6, force_refresh: bool = False, analysis_mode: str = "standard"):
+    """記事分析ジョブをキューに追加（ワーカーが空き次第バックグラウンドで実行）"""
+    get_scheduler().submit(
+        job_id, "analysis", run_article_analysis_job,
+        job_id, api_key, article_title, article_content, prompts, auto_generate_themes, num_themes, force_refresh, analysis_mode
     )
-    thread.start()
 
 
 # =====================================================
 # テーマ生成用のバックグラウンドタスク
 # =====================================================
 
-def run_theme_generation_job(job_id: str, api_key: str, analysis_result: str, num_themes: int, prompts):
-    """テーマ生成をバックグラウンドで実行"""
+def run_theme_generation_job(job_id: str, api_key: str, analysis_result: str, num_themes: int, prompts, force_refresh: bool = False):
+    """テーマ生成をバックグラウンドで実行（force_refresh が True なら応答キャッシュを使わない）"""
     try:
         update_job_status(job_id, "running", progress=20)
 
-        client = Anthropic(api_key=api_key)
-
-        # story_tips を読み込み（キャッシュを使わない）
-        story_tips = prompts.load("theme_generation", "story_tips", use_cache=False)
+        job = get_job(job_id) or {}
+        checkpoints = resolve_fields(job.get('checkpoints') or {})
 
         # プロンプト作成
-        prompt = prompts.format(
-            "theme_generation",
-            "generate_themes",
-            analysis_result=analysis_result,
-            num_themes=num_themes,
-            story_tips=story_tips
-        )
+        request = _themes_request(prompts, analysis_result, num_themes)
 
         update_job_status(job_id, "running", progress=40)
 
         # API呼び出し
-        estimated_tokens = min(num_themes * 600 + 1000, 8000)
-
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=estimated_tokens,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        themes = message.content[0].text
+        themes = _run_stage(job_id, checkpoints, "themes", lambda: _generate_text(
+            api_key, job_id, "themes",
+            force_refresh=force_refresh,
+            **request
+        ))
 
         update_job_status(job_id, "running", progress=80)
 
@@ -360,15 +942,431 @@ def run_theme_generation_job(job_id: str, api_key: str, analysis_result: str, nu
 
         update_job_status(job_id, "completed", progress=100, result=result)
 
+    except JobCancelled:
+        pass
     except Exception as e:
         update_job_status(job_id, "failed", error=str(e))
+    finally:
+        with _cancel_lock:
+            _cancel_events.pop(job_id, None)
+
+
+def start_theme_generation_job(job_id: str, api_key: str, analysis_result: str, num_themes: int, prompts, force_refresh: bool = False):
+    """テーマ生成ジョブをキューに追加（ワーカーが空き次第バックグラウンドで実行）"""
+    get_scheduler().submit(
+        job_id, "theme_generation", run_theme_generation_job,
+        job_id, api_key, analysis_result, num_themes, prompts, force_refresh
+    )
+
+
+# =====================================================
+# ネタメモのAI整理用のバックグラウンドタスク
+# =====================================================
 
+def _record_note_result(job_id: str, note_id: str, entry: Dict[str, Any], total: int):
+    """メモ1件の整理結果をジョブに記録し、進捗を更新する"""
+    def apply(job):
+        if job['status'] == "cancelled":
+            return
+        results = job.setdefault('note_results', {})
+        results[note_id] = entry
+        job['progress'] = int(len(results) / total * 100) if total else 100
+
+    _job_store.update(job_id, apply)
+
+
+def _organize_note(api_key: str, job_id: str, note: Dict[str, Any], category_info_text: str) -> Dict[str, Any]:
+    """メモ1件をAIで整理する（一時的なAPIエラーはこのメモだけを再試行する）"""
+    prompt = note_organizer.build_prompt(note['content'], category_info_text)
+
+    def call():
+        response_text = _generate_text(
+            api_key, job_id, f"note_{note['id']}",
+            usage_key=token_budget.usage_key("note_organization"),
+            use_cache=False,
+            model=llm_gateway.DEFAULT_MODEL,
+            max_tokens=note_organizer.NOTE_ORGANIZE_MAX_TOKENS,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return note_organizer.parse_response(response_text)
+
+    return DEFAULT_RETRY_POLICY.call(
+        call,
+        on_retry=lambda attempt, delay, error: _record_retry(job_id, f"note_{note['id']}", attempt, delay, error),
+        sleep=lambda delay: _cancellable_sleep(job_id, delay)
+    )
+
+
+def _remaining_notes(job_id: str, notes: list) -> list:
+    """まだ整理できていないメモ（再開時は整理済みのメモを飛ばす）"""
+    job = get_job(job_id) or {}
+    done_ids = {
+        note_id for note_id, entry in (job.get('note_results') or {}).items()
+        if entry.get('status') == "completed"
+    }
+    return [note for note in notes if note['id'] not in done_ids]
+
+
+def _finish_note_organization(job_id: str, notes: list):
+    """メモごとの結果を集計してジョブを完了にする（すべて失敗した場合は失敗）"""
+    job = get_job(job_id) or {}
+    results = job.get('note_results') or {}
+    succeeded = sum(1 for entry in results.values() if entry['status'] == "completed")
+    failed = sum(1 for entry in results.values() if entry['status'] == "failed")
+
+    if notes and not succeeded:
+        update_job_status(job_id, "failed", error=f"すべてのメモ（{failed}件）の整理に失敗しました")
+    else:
+        update_job_status(job_id, "completed", progress=100, result={
+            "total": len(notes),
+            "succeeded": succeeded,
+            "failed": failed
+        })
+
+
+def run_note_organization_job(job_id: str, api_key: str, notes: list, category_info_text: str):
+    """
+    未整理メモのAI整理をバックグラウンドで実行
+    メモごとに並列で問い合わせ（同時実行数は NOTE_ORGANIZE_CONCURRENCY まで）、
+    完了したものから job['note_results'] に記録する。1件の失敗で他のメモは止めない
+    """
+    try:
+        update_job_status(job_id, "running")
+
+        remaining = _remaining_notes(job_id, notes)
 
-def start_theme_generation_job(job_id: str, api_key: str, analysis_result: str, num_themes: int, prompts):
-    """テーマ生成ジョブをバックグラウンドで開始"""
-    thread = threading.Thread(
-        target=run_theme_generation_job,
-        args=(job_id, api_key, analysis_result, num_themes, prompts),
-        daemon=True
+        def process(note):
+            _raise_if_cancelled(job_id)
+            try:
+                entry = {"status": "completed", "result": _organize_note(api_key, job_id, note, category_info_text)}
+            except JobCancelled:
+                raise
+            except Exception as e:
+                entry = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+            _record_note_result(job_id, note['id'], entry, len(notes))
+
+        if remaining:
+            max_workers = max(1, min(note_organizer.NOTE_ORGANIZE_CONCURRENCY, len(remaining)))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="note-organize") as executor:
+                futures = [executor.submit(process, note) for note in remaining]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except JobCancelled:
+                    # まだ始まっていないメモは実行しない
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        _finish_note_organization(job_id, notes)
+
+    except JobCancelled:
+        pass
+    except Exception as e:
+        update_job_status(job_id, "failed", error=str(e))
+    finally:
+        with _cancel_lock:
+            _cancel_events.pop(job_id, None)
+
+
+def run_note_organization_batch_job(job_id: str, api_key: str, notes: list, category_info_text: str):
+    """
+    未整理メモのAI整理を Message Batches でまとめて実行（急がない大量のメモ向け）
+    すべてのメモを1つのバッチで送信し、完了後に結果をメモごとに振り分ける
+    """
+    try:
+        update_job_status(job_id, "running")
+
+        remaining = _remaining_notes(job_id, notes)
+
+        # custom_id に使える文字は限られているため、メモの並び順で対応付ける（再開しても変わらない）
+        custom_ids = {note['id']: f"note-{index}" for index, note in enumerate(notes)}
+        requests = {
+            custom_ids[note['id']]: {
+                "model": llm_gateway.DEFAULT_MODEL,
+                "max_tokens": note_organizer.NOTE_ORGANIZE_MAX_TOKENS,
+                "messages": [{"role": "user", "content": note_organizer.build_prompt(note['content'], category_info_text)}],
+            }
+            for note in remaining
+        }
+        results = _run_batch(job_id, api_key, "notes", requests)
+
+        for note in remaining:
+            outcome = results.get(custom_ids[note['id']], llm_gateway.BatchRequestError("missing", "結果がありません"))
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                _record_usage(
+                    job_id, f"note_{note['id']}", outcome,
+                    max_tokens=note_organizer.NOTE_ORGANIZE_MAX_TOKENS,
+                    usage_key=token_budget.usage_key("note_organization"),
+                    metrics={"batch": True}
+                )
+                entry = {"status": "completed", "result": note_organizer.parse_response(outcome.text)}
+            except Exception as e:
+                entry = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+            _record_note_result(job_id, note['id'], entry, len(notes))
+
+        _finish_note_organization(job_id, notes)
+
+    except JobCancelled:
+        pass
+    except BatchWaitInterrupted as e:
+        _release_for_resume(job_id, e)
+    except Exception as e:
+        update_job_status(job_id, "failed", error=str(e))
+    finally:
+        with _cancel_lock:
+            _cancel_events.pop(job_id, None)
+
+
+def start_note_organization_job(job_id: str, api_key: str, notes: list, category_info_text: str, batch: bool = False):
+    """
+    メモのAI整理ジョブをキューに追加（ワーカーが空き次第バックグラウンドで実行）
+    batch が True なら Message Batches でまとめて実行する
+    """
+    if batch:
+        # バッチの完了を待つ間は専用のワーカーで実行し、通常のジョブのワーカーを占有しない
+        get_scheduler().submit(job_id, "note_organization_batch", run_note_organization_batch_job, job_id, api_key, notes, category_info_text)
+    else:
+        get_scheduler().submit(job_id, "note_organization", run_note_organization_job, job_id, api_key, notes, category_info_text)
+
+
+# =====================================================
+# Message Batches によるまとめて実行
+# =====================================================
+
+def _record_batch_status(job_id: str, stage: str, status: Dict[str, Any]):
+    """実行中のバッチの状態をジョブに記録"""
+    def apply(job):
+        job['batch'] = dict(status, stage=stage)
+
+    _job_store.update(job_id, apply)
+
+
+def _resumable_batch_id(job_id: str, stage: str) -> Optional[str]:
+    """
+    再開時に結果を待つ、送信済みのバッチID
+    異常終了の前に同じステージで送信し、まだ処理中のバッチがあればそのIDを返す（二重に送信・課金しない）
+    """
+    batch = (get_job(job_id) or {}).get('batch') or {}
+    if batch.get('stage') != stage or not batch.get('id'):
+        return None
+    if batch.get('processing_status') in ["ended", "canceling"]:
+        return None
+    return batch['id']
+
+
+def _run_batch(job_id: str, api_key: str, stage: str, requests: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    リクエストを1つのバッチで実行して結果を返す
+    再開時は、同じステージで送信済みのバッチが処理中ならそれに再接続して結果を待つ
+    完了を待つ間にジョブがキャンセルされたら、バッチもキャンセルして JobCancelled を送出する
+    （状態確認のエラーなど、それ以外で止まった場合はバッチを残し、再開時に再接続する）
+    """
+    def on_create(batch_id):
+        _record_batch_status(job_id, stage, {"id": batch_id, "processing_status": "in_progress"})
+
+    def on_poll(status):
+        _record_batch_status(job_id, stage, status)
+        _raise_if_cancelled(job_id)
+
+    try:
+        return llm_gateway.run_batch(
+            api_key, requests,
+            on_poll=on_poll,
+            on_create=on_create,
+            sleep=lambda delay: _cancellable_sleep(job_id, delay),
+            retry_policy=DEFAULT_RETRY_POLICY,
+            batch_id=_resumable_batch_id(job_id, stage) if requests else None,
+            cancel_on=(JobCancelled,)
+        )
+    except JobCancelled:
+        raise
+    except Exception as e:
+        if _resumable_batch_id(job_id, stage) is not None:
+            raise BatchWaitInterrupted(f"{type(e).__name__}: {e}") from e
+        raise
+
+
+def _release_for_resume(job_id: str, error: Exception):
+    """
+    バッチの完了待ちが中断したジョブを再開待ちに戻す（担当プロセスを外し、次の再開の確認で再接続させる）
+    """
+    def apply(job):
+        if job['status'] in ['pending', 'running']:
+            job['status'] = "pending"
+            job['owner'] = None
+            job['batch'] = dict(job.get('batch') or {}, last_error=str(error))
+
+    _job_store.update(job_id, apply)
+
+
+def _run_analysis_batch_stage(batch_job_id: str, api_key: str, stage: str, requests: Dict[str, Dict[str, Any]], force_refresh: bool) -> Dict[str, Any]:
+    """
+    記事ごとのリクエストを1つのバッチで実行する（応答キャッシュにあるものは送信しない）
+
+    Args:
+        requests: 記事のジョブID -> リクエスト（template_version を含む）
+
+    Returns:
+        記事のジョブID -> 生成したテキスト または 失敗の例外
+    """
+    outputs = {}
+    batch_requests = {}
+    cache_keys = {}
+    usage_keys = {}
+    template_versions = {}
+
+    for job_id, request in requests.items():
+        request = dict(request)
+        template_versions[job_id] = request.pop('template_version', None)
+        usage_keys[job_id] = request.pop('usage_key', None)
+        if _response_cache.enabled:
+            cache_keys[job_id] = _response_cache_key(template_versions[job_id], request)
+            cached = None if force_refresh else _response_cache.get(cache_keys[job_id])
+            if cached is not None:
+                _record_cache_status(job_id, stage, "hit")
+                _record_usage(
+                    job_id, stage, _cached_completion(cached, request.get('model')),
+                    max_tokens=request.get('max_tokens'),
+                    usage_key=usage_keys[job_id],
+                    metrics={"template_version": template_versions[job_id], "response_cache": "hit", "batch": True}
+                )
+                outputs[job_id] = cached
+                continue
+            _record_cache_status(job_id, stage, "refresh" if force_refresh else "miss")
+        batch_requests[job_id] = request
+
+    results = _run_batch(batch_job_id, api_key, stage, batch_requests)
+
+    for job_id in batch_requests:
+        outcome = results.get(job_id, llm_gateway.BatchRequestError("missing", "結果がありません"))
+        if isinstance(outcome, Exception):
+            outputs[job_id] = outcome
+            continue
+
+        _record_usage(
+            job_id, stage, outcome,
+            max_tokens=batch_requests[job_id].get('max_tokens'),
+            usage_key=usage_keys[job_id],
+            metrics={"template_version": template_versions[job_id], "batch": True}
+        )
+        if job_id in cache_keys and outcome.stop_reason != "max_tokens":
+            _response_cache.put(cache_keys[job_id], outcome.text)
+        outputs[job_id] = outcome.text
+
+    return outputs
+
+
+def run_article_analysis_batch_job(job_id: str, api_key: str, job_ids: list, prompts, num_themes: int = 6, force_refresh: bool = False, auto_generate_themes: bool = True):
+    """
+    複数の記事分析ジョブを Message Batches でまとめて実行（急がない大量の記事向け）
+    ステージ（基本分析 → 深堀り分析 → テーマ生成）ごとに全記事を1つのバッチで送信し、
+    結果を記事ごとのジョブのチェックポイントに振り分ける。失敗した記事だけを失敗にし、他の記事は続行する
+    auto_generate_themes が False ならテーマ生成のステージは行わない
+    """
+    articles = {}
+    try:
+        update_job_status(job_id, "running", progress=0)
+
+        # 実行待ちの記事と、再開時は完了済みのステージを読み込む
+        for article_job_id in job_ids:
+            article_job = get_job(article_job_id)
+            if not article_job or article_job['status'] not in ['pending', 'running']:
+                continue
+            params = resolve_fields(article_job.get('params') or {})
+            articles[article_job_id] = {
+                "title": params.get('article_title', ''),
+                "content": params.get('article_content', ''),
+                "checkpoints": resolve_fields(article_job.get('checkpoints') or {}),
+            }
+            update_job_status(article_job_id, "running", progress=10)
+
+        def build_basic(article):
+            return _basic_analysis_request(prompts, article['title'], article['content'])
+
+        def build_deep(article):
+            return _deep_analysis_request(prompts, article['content'], article['checkpoints']['basic_analysis'])
+
+        def build_themes(article):
+            checkpoints = article['checkpoints']
+            analysis_result = _combine_analysis(checkpoints['basic_analysis'], checkpoints['deep_analysis'])
+            return _themes_request(prompts, analysis_result, num_themes)
+
+        stages = [
+            ("basic_analysis", build_basic, 40),
+            ("deep_analysis", build_deep, 60),
+        ]
+        if auto_generate_themes:
+            stages.append(("themes", build_themes, 90))
+
+        for index, (stage, build, progress) in enumerate(stages):
+            _raise_if_cancelled(job_id)
+            update_job_status(job_id, "running", progress=int(index / len(stages) * 100))
+
+            # 個別にキャンセルされた記事は以降のステージに含めない
+            for article_job_id in list(articles):
+                if is_cancelled(article_job_id):
+                    articles.pop(article_job_id)
+
+            requests = {
+                article_job_id: build(article)
+                for article_job_id, article in articles.items()
+                if stage not in article['checkpoints']
+            }
+            outputs = _run_analysis_batch_stage(job_id, api_key, stage, requests, force_refresh)
+
+            for article_job_id, output in outputs.items():
+                if is_cancelled(article_job_id):
+                    articles.pop(article_job_id, None)
+                    continue
+                if isinstance(output, Exception):
+                    update_job_status(article_job_id, "failed", error=f"{stage}: {output}")
+                    articles.pop(article_job_id, None)
+                    continue
+                save_checkpoint(article_job_id, stage, output)
+                articles[article_job_id]['checkpoints'][stage] = output
+                update_job_status(article_job_id, "running", progress=progress)
+
+        # 履歴に保存して各記事のジョブを完了にする
+        completed = 0
+        for article_job_id, article in articles.items():
+            checkpoints = article['checkpoints']
+            try:
+                _complete_article_analysis(
+                    article_job_id, checkpoints, article['title'], article['content'],
+                    checkpoints['basic_analysis'], checkpoints['deep_analysis'], checkpoints.get('themes'), num_themes
+                )
+                completed += 1
+            except Exception as e:
+                update_job_status(article_job_id, "failed", error=str(e))
+
+        update_job_status(job_id, "completed", progress=100, result={
+            "total": len(job_ids),
+            "succeeded": completed,
+            "failed": len(job_ids) - completed
+        })
+
+    except JobCancelled:
+        # まとめて実行するジョブをキャンセルしたら、残りの記事もキャンセルする
+        for article_job_id in articles:
+            cancel_job(article_job_id)
+    except BatchWaitInterrupted as e:
+        # 記事のジョブは実行中のまま残し、再開時にまとめて続きから実行する
+        _release_for_resume(job_id, e)
+    except Exception as e:
+        update_job_status(job_id, "failed", error=str(e))
+        for article_job_id in articles:
+            update_job_status(article_job_id, "failed", error=f"バッチ処理エラー: {e}")
+    finally:
+        with _cancel_lock:
+            _cancel_events.pop(job_id, None)
+
+
+def start_article_analysis_batch_job(job_id: str, api_key: str, job_ids: list, prompts, num_themes: int = 6, force_refresh: bool = False, auto_generate_themes: bool = True):
+    """記事分析のバッチジョブをキューに追加（ワーカーが空き次第バックグラウンドで実行）"""
+    get_scheduler().submit(
+        job_id, "analysis_batch", run_article_analysis_batch_job,
+        job_id, api_key, job_ids, prompts, num_themes, force_refresh, auto_generate_themes
     )
-    thread.start()
@@ -0,0 +1,167 @@
+"""
+バックグラウンドジョブのスケジューラ
+固定数のワーカースレッドと優先度付きキューでジョブを順番に実行する
+Message Batches の完了を待つジョブ（最大24時間ポーリングする）は、通常のワーカーを占有しないよう専用のワーカーで実行する
+"""
+import heapq
+import itertools
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+# 同時実行数の上限（環境変数で変更可能）
+DEFAULT_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', '2'))
+
+# ジョブ種別ごとの同時実行数の上限（未指定の種別は max_workers まで）
+DEFAULT_TYPE_LIMITS = {
+    "analysis": int(os.getenv('JOB_MAX_ANALYSIS', '2')),
+    "theme_generation": int(os.getenv('JOB_MAX_THEME_GENERATION', '1')),
+    "note_organization": int(os.getenv('JOB_MAX_NOTE_ORGANIZATION', '1')),
+    "analysis_batch": int(os.getenv('JOB_MAX_ANALYSIS_BATCH', '1')),
+    "note_organization_batch": int(os.getenv('JOB_MAX_NOTE_ORGANIZATION_BATCH', '1')),
+}
+
+# 専用のワーカーで実行する種別（全体の上限 max_workers に含めない。ワーカー数は種別ごとの上限の合計）
+DEFAULT_BATCH_TYPES = ("analysis_batch", "note_organization_batch")
+
+
+class JobScheduler:
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, type_limits: Optional[Dict[str, int]] = None, batch_types: Iterable[str] = DEFAULT_BATCH_TYPES):
+        """
+        Args:
+            max_workers: ワーカースレッド数（全体の同時実行数の上限）
+            type_limits: ジョブ種別ごとの同時実行数の上限
+            batch_types: 専用のワーカーで実行する種別（max_workers に含めない）
+        """
+        self.max_workers = max(1, max_workers)
+        self.type_limits = dict(DEFAULT_TYPE_LIMITS if type_limits is None else type_limits)
+        self.batch_types = frozenset(batch_types)
+        self.batch_workers = max(1, sum(self.type_limits.get(job_type, 1) for job_type in self.batch_types))
+
+        self._queue = []  # (priority, seq, job_id, job_type, func, args, kwargs)
+        self._seq = itertools.count()
+        self._running = {}  # job_type -> 実行中の件数
+        self._cond = threading.Condition()
+        self._workers = []
+        self._batch_workers = []
+        self._shutdown = False
+
+    def submit(self, job_id: str, job_type: str, func: Callable, *args, priority: int = 0, **kwargs):
+        """
+        ジョブをキューに追加する（priority が小さいほど先に実行、同じ場合は投入順）
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("スケジューラは停止済みです")
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id, job_type, func, args, kwargs))
+            self._ensure_workers(job_type in self.batch_types)
+            self._cond.notify_all()
+
+    def pending_count(self) -> int:
+        """待機中のジョブ数"""
+        with self._cond:
+            return len(self._queue)
+
+    def running_count(self) -> int:
+        """実行中のジョブ数"""
+        with self._cond:
+            return sum(self._running.values())
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """待機中のジョブの順番（1始まり、キューにない場合は None。同じワーカーで実行するジョブの中での順番）"""
+        with self._cond:
+            entry = next((entry for entry in self._queue if entry[2] == job_id), None)
+            if entry is None:
+                return None
+            batch = entry[3] in self.batch_types
+            waiting = [other for other in self._queue if (other[3] in self.batch_types) == batch]
+            return sorted(waiting).index(entry) + 1
+
+    def cancel(self, job_id: str) -> bool:
+        """待機中のジョブをキューから取り除く（実行中・キューにない場合は False）"""
+        with self._cond:
+            for entry in self._queue:
+                if entry[2] == job_id:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    return True
+        return False
+
+    def shutdown(self, wait: bool = True):
+        """新規受付を止め、ワーカーを停止する（待機中のジョブは破棄）"""
+        with self._cond:
+            self._shutdown = True
+            self._queue.clear()
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers + self._batch_workers:
+                worker.join()
+
+    def _ensure_workers(self, batch: bool = False):
+        """ワーカースレッドを必要に応じて起動（_cond を保持した状態で呼ぶ）"""
+        workers, count, name = (
+            (self._batch_workers, self.batch_workers, "job-batch-worker") if batch
+            else (self._workers, self.max_workers, "job-worker")
+        )
+        while len(workers) < count:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(batch,),
+                name=f"{name}-{len(workers) + 1}",
+                daemon=True
+            )
+            workers.append(worker)
+            worker.start()
+
+    def _take_next(self, batch: bool = False):
+        """実行可能なジョブをキューから取り出す（_cond を保持した状態で呼ぶ。batch なら専用ワーカーの種別だけ）"""
+        for entry in sorted(self._queue):
+            job_type = entry[3]
+            if (job_type in self.batch_types) != batch:
+                continue
+            limit = self.type_limits.get(job_type)
+            if limit is None or self._running.get(job_type, 0) < limit:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                return entry
+        return None
+
+    def _worker_loop(self, batch: bool = False):
+        """キューからジョブを取り出して実行し続ける"""
+        while True:
+            with self._cond:
+                entry = None
+                while not self._shutdown:
+                    entry = self._take_next(batch)
+                    if entry is not None:
+                        break
+                    self._cond.wait()
+                if entry is None:
+                    return
+
+                _, _, job_id, job_type, func, args, kwargs = entry
+                self._running[job_type] = self._running.get(job_type, 0) + 1
+
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"ジョブ実行エラー ({job_id}): {e}")
+            finally:
+                with self._cond:
+                    self._running[job_type] -= 1
+                    self._cond.notify_all()
+
+
+# プロセス全体で共有するスケジューラ
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    """共有スケジューラを取得（初回呼び出し時に作成）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+        return _scheduler
@@ -0,0 +1,297 @@
+"""
+ジョブストア（SQLite / WALモード）
+jobs.json の全件読み書きを置き換え、1ジョブ単位で読み書きする
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, Callable, Iterable, List
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+"""
+
+
+class JobStore:
+    def __init__(self, db_path, legacy_json_path=None):
+        """
+        Args:
+            db_path: SQLiteデータベースのパス
+            legacy_json_path: 旧形式の jobs.json（存在すれば初回のみ取り込む）
+        """
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._lock = threading.RLock()
+        self._conn = None
+
+        # id -> ジョブ のメモリ上のインデックス
+        # 他プロセスが書き込んだ場合は PRAGMA data_version の変化で検知して破棄する
+        self._index = {}
+        self._data_version = None
+
+        # 変更通知のリスナー（書き込み時・他プロセスの変更検知時に呼ばれる）
+        self._listeners = []
+
+    # -------------------------------------------------
+    # 接続管理
+    # -------------------------------------------------
+
+    def _connect(self):
+        """プロセス内で共有する接続を取得（self._lock を保持した状態で呼ぶ）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._migrate_legacy_json(conn)
+            self._conn = conn
+        self._sync_index(self._conn)
+        return self._conn
+
+    def _sync_index(self, conn):
+        """他の接続（他プロセス）による変更があればインデックスを破棄する"""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            external = self._data_version is not None
+            self._index.clear()
+            self._data_version = version
+            if external:
+                self._notify()
+
+    def add_listener(self, callback: Callable[[], None]):
+        """変更通知のリスナーを登録（ストアを操作しない軽い処理にすること）"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        """リスナーに変更を通知"""
+        for callback in self._listeners:
+            callback()
+
+    def _migrate_legacy_json(self, conn):
+        """旧形式の jobs.json が残っていれば取り込んでリネームする"""
+        if not self.legacy_json_path:
+            return
+
+        # 複数プロセスが同時に起動しても1回だけ取り込むよう、書き込みロック中に確認する
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not os.path.exists(self.legacy_json_path):
+                conn.execute("COMMIT")
+                return
+
+            try:
+                with open(self.legacy_json_path, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"旧ジョブファイルの読み込みエラー: {e}")
+                conn.execute("COMMIT")
+                return
+
+            # 旧形式は新しい順に並んでいるので、古い順に挿入する
+            for job in reversed(legacy.get('jobs', [])):
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, type, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                    _row_values(job)
+                )
+            os.replace(self.legacy_json_path, self.legacy_json_path + '.migrated')
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _lookup(self, conn, job_id: str) -> Optional[Dict[str, Any]]:
+        """インデックスからジョブを取得（なければDBから読み込んで登録）"""
+        job = self._index.get(job_id)
+        if job is None:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            self._index[job_id] = job
+        return job
+
+    def close(self):
+        """接続を閉じる"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._index.clear()
+            self._data_version = None
+
+    # -------------------------------------------------
+    # 操作
+    # -------------------------------------------------
+
+    def insert(self, job: Dict[str, Any]):
+        """ジョブを追加"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO jobs (id, type, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                _row_values(job)
+            )
+            self._index[job['id']] = copy.deepcopy(job)
+            self._notify()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブを1件取得"""
+        with self._lock:
+            job = self._lookup(self._connect(), job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def update(self, job_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """
+        ジョブを1件だけ読み込み、mutate で書き換えて保存する
+
+        Returns:
+            更新後のジョブ（存在しない場合は None）
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 書き込みロック取得後に、他プロセスの変更を反映してから読む
+                self._sync_index(conn)
+                current = self._lookup(conn, job_id)
+                if current is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job = copy.deepcopy(current)
+                mutate(job)
+                conn.execute(
+                    "UPDATE jobs SET type = ?, status = ?, data = ? WHERE id = ?",
+                    (job['type'], job['status'], json.dumps(job, ensure_ascii=False), job_id)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                self._index.pop(job_id, None)
+                raise
+
+            self._index[job_id] = job
+            self._notify()
+            return copy.deepcopy(job)
+
+    def delete(self, job_id: str):
+        """ジョブを削除"""
+        with self._lock:
+            self._connect().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._index.pop(job_id, None)
+            self._notify()
+
+    def list(self, statuses: Iterable[str] = None) -> List[Dict[str, Any]]:
+        """ジョブ一覧を新しい順に取得（statuses で絞り込み可能）"""
+        with self._lock:
+            conn = self._connect()
+            if statuses:
+                statuses = list(statuses)
+                placeholders = ", ".join("?" for _ in statuses)
+                rows = conn.execute(
+                    f"SELECT data FROM jobs WHERE status IN ({placeholders}) ORDER BY seq DESC",
+                    statuses
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT data FROM jobs ORDER BY seq DESC").fetchall()
+            return [json.loads(row[0]) for row in rows]
+
+    def replace_all(self, jobs: List[Dict[str, Any]]):
+        """ジョブ一覧をまるごと置き換える（先頭が最新）"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM jobs")
+                for job in reversed(jobs):
+                    conn.execute(
+                        "INSERT INTO jobs (id, type, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                        _row_values(job)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._index.clear()
+                self._notify()
+
+    def prune(self, status: str, older_than: str = None, max_count: int = None, max_bytes: int = None):
+        """
+        指定ステータスのジョブを古い順に削除する
+
+        Args:
+            status: 対象のステータス
+            older_than: この日時（ISO形式）より前に作成されたジョブを削除
+            max_count: 新しい順にこの件数だけ残す
+            max_bytes: 新しい順に合計サイズがこのバイト数に収まる分だけ残す
+
+        Returns:
+            (削除件数, 削除したレコードの合計バイト数)
+        """
+        conditions = []
+        params = [status]
+        if older_than is not None:
+            conditions.append("created_at < ?")
+            params.append(older_than)
+        if max_count is not None:
+            conditions.append("rank > ?")
+            params.append(max_count)
+        if max_bytes is not None:
+            conditions.append("running_bytes > ?")
+            params.append(max_bytes)
+        if not conditions:
+            return 0, 0
+
+        query = f"""
+            SELECT seq, size FROM (
+                SELECT seq, created_at, length(CAST(data AS BLOB)) AS size,
+                       ROW_NUMBER() OVER (ORDER BY seq DESC) AS rank,
+                       SUM(length(CAST(data AS BLOB))) OVER (ORDER BY seq DESC) AS running_bytes
+                FROM jobs WHERE status = ?
+            ) WHERE {" OR ".join(conditions)}
+        """
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(query, params).fetchall()
+                conn.executemany("DELETE FROM jobs WHERE seq = ?", [(seq,) for seq, _ in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            if rows:
+                self._index.clear()
+                self._notify()
+            return len(rows), sum(size for _, size in rows)
+
+    def count(self) -> int:
+        """ジョブ件数を取得"""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def _row_values(job: Dict[str, Any]):
+    """INSERT 用の値タプルを作成"""
+    return (
+        job['id'],
+        job['type'],
+        job['status'],
+        job['created_at'],
+        json.dumps(job, ensure_ascii=False),
+    )
@@ -0,0 +1,359 @@
+"""
+LLMゲートウェイ
+プロセス全体で APIキーごとに1つの Anthropic クライアント（HTTPコネクションプール）を共有し、
+すべてのページ・ジョブからの呼び出しを complete() / stream() に集約する
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from anthropic import Anthropic, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS
+
+from utils import llm_transport, telemetry
+from utils.retry_policy import RetryPolicy
+
+
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+
+# コネクションプールの設定（環境変数で変更可能）
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10'))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '120'))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('LLM_REQUEST_TIMEOUT', '600'))
+
+# Message Batches の完了を確認する間隔（秒）
+BATCH_POLL_INTERVAL_SECONDS = float(os.getenv('LLM_BATCH_POLL_INTERVAL', '60'))
+
+
+class Completion:
+    """生成結果（本文・終了理由・トークン使用量）"""
+
+    def __init__(self, text: str, stop_reason: str = None, usage: Dict[str, int] = None, model: str = None):
+        self.text = text
+        self.stop_reason = stop_reason
+        self.usage = usage or {}
+        self.model = model
+
+    @classmethod
+    def from_message(cls, message, text: str = None):
+        """Anthropic の Message から作成"""
+        if text is None:
+            text = "".join(block.text for block in message.content if getattr(block, 'type', 'text') == 'text')
+        usage = getattr(message, 'usage', None)
+        return cls(
+            text=text,
+            stop_reason=getattr(message, 'stop_reason', None),
+            usage={
+                "input_tokens": getattr(usage, 'input_tokens', 0) or 0,
+                "output_tokens": getattr(usage, 'output_tokens', 0) or 0,
+                "cache_creation_input_tokens": getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                "cache_read_input_tokens": getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            },
+            model=getattr(message, 'model', None),
+        )
+
+
+class BatchRequestError(Exception):
+    """Message Batch の個別リクエストが成功しなかった（errored / canceled / expired）"""
+
+    def __init__(self, result_type: str, message: str = None):
+        super().__init__(f"{result_type}: {message}" if message else result_type)
+        self.result_type = result_type
+
+
+class LLMGateway:
+    def __init__(self, api_key: str, base_url: str = None, transport=None):
+        """
+        Args:
+            api_key: Anthropic APIキー
+            base_url: 接続先（省略時は SDK のデフォルト / ANTHROPIC_BASE_URL）
+            transport: HTTP トランスポート（省略時は LLM_TRANSPORT に従う。llm_transport を参照）
+        """
+        # SDK が使う HTTP ライブラリの Limits クラスで、待機中の接続を長めに保持するプールを作る
+        limits_class = type(DEFAULT_CONNECTION_LIMITS)
+        limits = limits_class(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        )
+        # 応答の記録・再生（LLM_TRANSPORT=record / replay）の場合はトランスポートを差し替える
+        if transport is None:
+            transport = llm_transport.transport_from_env(limits)
+        if transport is not None:
+            http_client = DefaultHttpxClient(limits=limits, transport=transport)
+        else:
+            http_client = DefaultHttpxClient(limits=limits)
+        # リトライは RetryPolicy で行うため、SDK側の自動リトライは無効にする
+        self.client = Anthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+            http_client=http_client,
+        )
+
+    def _request(self, prompt: str = None, messages: List[Dict[str, Any]] = None, model: str = DEFAULT_MODEL, max_tokens: int = 4000, **kwargs) -> Dict[str, Any]:
+        """リクエストのパラメータを組み立てる"""
+        if messages is None:
+            messages = [{"role": "user", "content": prompt}]
+        return dict(model=model, max_tokens=max_tokens, messages=messages, **kwargs)
+
+    def complete(self, prompt: str = None, retry_policy: RetryPolicy = None, on_retry: Callable[[int, float, Exception], None] = None, **kwargs) -> Completion:
+        """
+        テキストを生成する
+
+        Args:
+            prompt: ユーザープロンプト（messages を直接渡す場合は省略）
+            retry_policy: 一時的なエラーを再試行する場合のポリシー
+            on_retry: 再試行の直前に呼ばれる（RetryPolicy.call と同じ）
+            **kwargs: messages, model, max_tokens, system など messages.create の引数
+        """
+        request = self._request(prompt, **kwargs)
+
+        def call():
+            return Completion.from_message(self.client.messages.create(**request))
+
+        return retry_policy.call(call, on_retry=on_retry) if retry_policy else call()
+
+    def stream(self, prompt: str = None, on_text: Callable[[str], None] = None, retry_policy: RetryPolicy = None, on_retry: Callable[[int, float, Exception], None] = None, **kwargs) -> Completion:
+        """
+        ストリーミングでテキストを生成する
+        on_text で例外を送出すると接続を閉じて生成を中断する
+
+        Args:
+            prompt: ユーザープロンプト（messages を直接渡す場合は省略）
+            on_text: テキストの断片を受け取るたびに呼ばれる
+            retry_policy: 一時的なエラーを再試行する場合のポリシー
+            on_retry: 再試行の直前に呼ばれる（途中まで受け取った表示のリセットなどに使う）
+            **kwargs: messages, model, max_tokens, system など messages.create の引数
+        """
+        request = self._request(prompt, **kwargs)
+
+        def call():
+            chunks = []
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    chunks.append(text)
+                    if on_text:
+                        on_text(text)
+                message = stream.get_final_message()
+            return Completion.from_message(message, text="".join(chunks))
+
+        return retry_policy.call(call, on_retry=on_retry) if retry_policy else call()
+
+    # -------------------------------------------------
+    # Message Batches（急がない大量の処理を低コストでまとめて実行）
+    # -------------------------------------------------
+
+    def create_batch(self, requests: Dict[str, Dict[str, Any]], retry_policy: RetryPolicy = None) -> str:
+        """
+        リクエストをまとめて Message Batch として送信する
+
+        Args:
+            requests: custom_id -> complete() と同じ引数（prompt / messages / model / max_tokens など）
+            retry_policy: 一時的なエラーを再試行する場合のポリシー
+
+        Returns:
+            バッチID
+        """
+        batch_requests = [
+            {"custom_id": custom_id, "params": self._request(**kwargs)}
+            for custom_id, kwargs in requests.items()
+        ]
+
+        def call():
+            return self.client.messages.batches.create(requests=batch_requests).id
+
+        return retry_policy.call(call) if retry_policy else call()
+
+    def retrieve_batch(self, batch_id: str, retry_policy: RetryPolicy = None) -> Dict[str, Any]:
+        """バッチの状態を取得（processing_status と request_counts）"""
+        def call():
+            batch = self.client.messages.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            return {
+                "id": batch.id,
+                "processing_status": batch.processing_status,
+                "request_counts": {
+                    name: getattr(counts, name, 0) or 0
+                    for name in ["processing", "succeeded", "errored", "canceled", "expired"]
+                },
+            }
+
+        return retry_policy.call(call) if retry_policy else call()
+
+    def cancel_batch(self, batch_id: str):
+        """バッチをキャンセル（処理済みの結果は残る）"""
+        self.client.messages.batches.cancel(batch_id)
+
+    def _cancel_quietly(self, batch_id: str):
+        """バッチをキャンセル（失敗してもエラーを表示するだけで、呼び出し元の例外を優先する）"""
+        try:
+            self.cancel_batch(batch_id)
+        except Exception as e:
+            print(f"バッチのキャンセルエラー: {e}")
+
+    def batch_results(self, batch_id: str) -> Dict[str, Any]:
+        """
+        完了したバッチの結果を取得
+
+        Returns:
+            custom_id -> Completion（成功）または BatchRequestError（失敗）
+        """
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                results[entry.custom_id] = Completion.from_message(result.message)
+            else:
+                error = getattr(result, 'error', None)
+                detail = getattr(getattr(error, 'error', None), 'message', None)
+                results[entry.custom_id] = BatchRequestError(result.type, detail)
+        return results
+
+    def run_batch(self, requests: Dict[str, Dict[str, Any]], poll_interval: float = None, on_poll: Callable[[Dict[str, Any]], None] = None, sleep: Callable[[float], None] = time.sleep, retry_policy: RetryPolicy = None, batch_id: str = None, on_create: Callable[[str], None] = None, cancel_on: Tuple[Type[BaseException], ...] = ()) -> Dict[str, Any]:
+        """
+        バッチを送信し、完了するまで待って結果を返す
+        batch_id を指定した場合は新しく送信せず、送信済みのバッチの完了を待って結果を返す（再開時の再接続）
+        待機中（sleep / on_poll）に cancel_on の例外が起きた場合はバッチをキャンセルしてから送出する。
+        それ以外の例外ではバッチは処理を続けたまま送出する（記録したバッチIDで再接続できる）
+
+        Args:
+            requests: custom_id -> complete() と同じ引数
+            poll_interval: 状態を確認する間隔（秒）
+            on_poll: 状態を確認するたびに retrieve_batch() の結果で呼ばれる
+            on_create: 新しくバッチを送信した直後にバッチIDで呼ばれる（再開に備えて記録する）
+            sleep: 待機に使う関数（キャンセル可能な待機に差し替えられる）
+            retry_policy: 送信・状態確認の一時的なエラーを再試行する場合のポリシー
+            batch_id: 送信済みのバッチID（同じ requests で送信したもの）
+            cancel_on: バッチをキャンセルする例外（利用者によるキャンセルなど）
+
+        Returns:
+            custom_id -> Completion または BatchRequestError
+        """
+        if not requests:
+            return {}
+
+        poll_interval = BATCH_POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        if batch_id is None:
+            batch_id = self.create_batch(requests, retry_policy=retry_policy)
+            if on_create:
+                try:
+                    on_create(batch_id)
+                except BaseException:
+                    # バッチIDを記録できなければ再接続できないので、処理させずにキャンセルする
+                    self._cancel_quietly(batch_id)
+                    raise
+        try:
+            while True:
+                status = self.retrieve_batch(batch_id, retry_policy=retry_policy)
+                if on_poll:
+                    on_poll(status)
+                if status['processing_status'] == "ended":
+                    break
+                sleep(poll_interval)
+        except cancel_on:
+            self._cancel_quietly(batch_id)
+            raise
+
+        return self.batch_results(batch_id)
+
+
+# APIキー（と接続先）ごとに共有するゲートウェイ
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(api_key: str, base_url: str = None) -> LLMGateway:
+    """共有ゲートウェイを取得（初回のみ作成）"""
+    key = (hashlib.sha256(api_key.encode('utf-8')).hexdigest(), base_url)
+    with _gateways_lock:
+        gateway = _gateways.get(key)
+        if gateway is None:
+            gateway = LLMGateway(api_key, base_url=base_url)
+            _gateways[key] = gateway
+        return gateway
+
+
+class _CallMetrics:
+    """
+    ジョブを通さない呼び出し（ページから直接呼ぶ生成）の計測
+    処理時間・最初の出力までの時間・再試行回数を、ジョブのステージと同じ形式で計測ログに追記する
+    """
+
+    def __init__(self, stage: str, on_text: Callable[[str], None] = None, on_retry: Callable[[int, float, Exception], None] = None):
+        self.stage = stage
+        self.started = time.monotonic()
+        self.first_text_at = None
+        self.retries = 0
+        self.retry_wait_seconds = 0.0
+        self._on_text = on_text
+        self._on_retry = on_retry
+
+    def on_text(self, text: str):
+        if self.first_text_at is None:
+            self.first_text_at = time.monotonic()
+        if self._on_text:
+            self._on_text(text)
+
+    def on_retry(self, attempt: int, delay: float, error: Exception):
+        self.retries += 1
+        self.retry_wait_seconds += delay
+        if self._on_retry:
+            self._on_retry(attempt, delay, error)
+
+    def record(self, completion: Completion, max_tokens: int = None):
+        entry = dict(
+            completion.usage,
+            model=completion.model,
+            max_tokens=max_tokens,
+            stop_reason=completion.stop_reason,
+            retries=self.retries,
+            retry_wait_seconds=round(self.retry_wait_seconds, 2),
+            seconds=round(time.monotonic() - self.started, 3),
+            ttft_seconds=round(self.first_text_at - self.started, 3) if self.first_text_at is not None else None,
+            stage=self.stage,
+            at=datetime.datetime.now().isoformat(timespec='seconds'),
+        )
+        try:
+            telemetry.record(entry)
+        except OSError as e:
+            print(f"計測ログの保存エラー: {e}")
+
+
+def complete(api_key: str, prompt: str = None, stage: str = None, on_retry: Callable[[int, float, Exception], None] = None, **kwargs) -> Completion:
+    """
+    共有ゲートウェイでテキストを生成する（引数は LLMGateway.complete と同じ）
+    stage を指定すると処理時間・トークン数・再試行回数を計測ログに記録する（ジョブのステージは job_manager が記録する）
+    """
+    gateway = get_gateway(api_key.strip())
+    if not stage:
+        return gateway.complete(prompt, on_retry=on_retry, **kwargs)
+
+    metrics = _CallMetrics(stage, on_retry=on_retry)
+    completion = gateway.complete(prompt, on_retry=metrics.on_retry, **kwargs)
+    metrics.record(completion, max_tokens=kwargs.get('max_tokens'))
+    return completion
+
+
+def stream(api_key: str, prompt: str = None, on_text: Callable[[str], None] = None, stage: str = None, on_retry: Callable[[int, float, Exception], None] = None, **kwargs) -> Completion:
+    """
+    共有ゲートウェイでストリーミング生成する（引数は LLMGateway.stream と同じ）
+    stage を指定すると complete() と同じく計測ログに記録する（最初の出力までの時間も含む）
+    """
+    gateway = get_gateway(api_key.strip())
+    if not stage:
+        return gateway.stream(prompt, on_text=on_text, on_retry=on_retry, **kwargs)
+
+    metrics = _CallMetrics(stage, on_text=on_text, on_retry=on_retry)
+    completion = gateway.stream(prompt, on_text=metrics.on_text, on_retry=metrics.on_retry, **kwargs)
+    metrics.record(completion, max_tokens=kwargs.get('max_tokens'))
+    return completion
+
+
+def run_batch(api_key: str, requests: Dict[str, Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    """共有ゲートウェイでバッチを実行する（引数は LLMGateway.run_batch と同じ）"""
+    return get_gateway(api_key.strip()).run_batch(requests, **kwargs)
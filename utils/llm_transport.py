@@ -0,0 +1,194 @@
+"""
+Claude API の記録・再生用トランスポート
+LLMゲートウェイの HTTP クライアントに差し込み、実際の応答をフィクスチャファイルに記録（record）したり、
+記録した応答を API に接続せずに再生（replay）したりする。ストリーミング（SSE）の応答もそのまま記録・再生できる
+
+使い方:
+    LLM_TRANSPORT=record streamlit run app.py   # 実際のAPIを呼び出し、応答を data/llm_fixtures/ に記録
+    LLM_TRANSPORT=replay streamlit run app.py   # 記録した応答を返す（APIキーは任意の文字列でよい）
+
+同じリクエスト（メソッド・パス・本文）には同じフィクスチャが対応する。
+同じリクエストを何度も送った場合（バッチの状態確認など）は、最後に記録した応答を返す。
+記録がないリクエストには 404（not_found_error）を返す（再試行の対象にならず、すぐに失敗する）
+"""
+import codecs
+import hashlib
+import importlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from anthropic import DEFAULT_CONNECTION_LIMITS
+
+from utils.file_store import read_json, write_json_atomic
+
+
+# SDK が使う HTTP ライブラリ（anthropic のバージョンにより httpx / httpx2）
+_http = importlib.import_module(type(DEFAULT_CONNECTION_LIMITS).__module__.partition('.')[0])
+
+# 設定（環境変数で変更可能）
+TRANSPORT_MODE = os.getenv('LLM_TRANSPORT', '').strip().lower()  # "" / "record" / "replay"
+FIXTURES_DIR = os.getenv('LLM_FIXTURES_DIR') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'llm_fixtures')
+# 再生時に記録したときの受信間隔を再現するか（ストリーミング表示やタイムアウトの確認用）
+REPLAY_REALTIME = os.getenv('LLM_REPLAY_REALTIME', '').lower() in ('1', 'true', 'yes')
+
+# 記録しないレスポンスヘッダー（再生時に本文の長さ・圧縮と食い違うもの）
+_SKIPPED_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding', 'connection', 'keep-alive', 'date'}
+
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """リクエストのキー（メソッド・パス・本文のハッシュ。JSON はキーの順番によらず同じになる）"""
+    try:
+        normalized = json.dumps(json.loads(body), ensure_ascii=False, sort_keys=True) if body else ""
+    except ValueError:
+        normalized = body.hex()
+    data = json.dumps([method.upper(), path, normalized], ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _fixture_path(fixtures_dir: str, key: str) -> str:
+    return os.path.join(fixtures_dir, f"{key}.json")
+
+
+def _describe(request) -> Dict[str, Any]:
+    """フィクスチャに残すリクエストの内容（確認用。照合にはキーだけを使う）"""
+    body = request.content
+    try:
+        parsed = json.loads(body) if body else None
+    except ValueError:
+        parsed = None
+    return {"method": request.method, "path": request.url.raw_path.decode('ascii'), "body": parsed}
+
+
+class _RecordingStream(_http.SyncByteStream):
+    """応答を呼び出し元に渡しながら記録し、最後まで受信できたらフィクスチャに保存する"""
+
+    def __init__(self, inner, on_complete, started: float):
+        """
+        Args:
+            started: リクエストを送信した時刻（time.monotonic()。応答ヘッダーまでの待ち時間も記録する）
+        """
+        self._inner = inner
+        self._on_complete = on_complete
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._chunks = []
+        self._started = started
+        self._completed = False
+
+    def __iter__(self):
+        for chunk in self._inner:
+            # マルチバイト文字の途中で区切られても、次の断片とつなげて文字列にする
+            text = self._decoder.decode(chunk)
+            if text:
+                self._chunks.append([round(time.monotonic() - self._started, 3), text])
+            yield chunk
+        text = self._decoder.decode(b'', final=True)
+        if text:
+            self._chunks.append([round(time.monotonic() - self._started, 3), text])
+        self._completed = True
+
+    def close(self):
+        try:
+            self._inner.close()
+        finally:
+            # 途中で打ち切られた応答（キャンセルなど）は記録しない
+            if self._completed:
+                self._on_complete(self._chunks)
+
+
+class _ReplayStream(_http.SyncByteStream):
+    """記録した断片を順に返す（realtime なら記録したときの間隔で返す）"""
+
+    def __init__(self, chunks, realtime: bool):
+        self._chunks = chunks
+        self._realtime = realtime
+
+    def __iter__(self):
+        started = time.monotonic()
+        for offset, text in self._chunks:
+            if self._realtime:
+                wait = offset - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
+            yield text.encode('utf-8')
+
+
+class RecordingTransport(_http.BaseTransport):
+    """実際の API に送信し、応答をフィクスチャに記録する"""
+
+    def __init__(self, fixtures_dir: str = None, inner=None):
+        self.fixtures_dir = fixtures_dir or FIXTURES_DIR
+        self.inner = inner or _http.HTTPTransport()
+
+    def handle_request(self, request):
+        # 圧縮された本文は記録できないため、圧縮なしで受け取る
+        request.headers['accept-encoding'] = 'identity'
+        request.read()
+        key = request_key(request.method, request.url.raw_path.decode('ascii'), request.content)
+        described = _describe(request)
+
+        started = time.monotonic()
+        response = self.inner.handle_request(request)
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _SKIPPED_HEADERS}
+
+        def save(chunks):
+            os.makedirs(self.fixtures_dir, exist_ok=True)
+            write_json_atomic(_fixture_path(self.fixtures_dir, key), {
+                "request": described,
+                "response": {"status": response.status_code, "headers": headers, "chunks": chunks},
+            })
+
+        return _http.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, save, started),
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport(_http.BaseTransport):
+    """記録した応答を返す（API には接続しない）"""
+
+    def __init__(self, fixtures_dir: str = None, realtime: bool = None):
+        self.fixtures_dir = fixtures_dir or FIXTURES_DIR
+        self.realtime = REPLAY_REALTIME if realtime is None else realtime
+
+    def handle_request(self, request):
+        request.read()
+        path = request.url.raw_path.decode('ascii')
+        key = request_key(request.method, path, request.content)
+        fixture = read_json(_fixture_path(self.fixtures_dir, key), lambda: None)
+        if fixture is None:
+            return _http.Response(404, json={"type": "error", "error": {
+                "type": "not_found_error",
+                "message": f"記録された応答がありません: {request.method} {path}（キー {key[:12]}）",
+            }}, request=request)
+
+        response = fixture['response']
+        return _http.Response(
+            response['status'],
+            headers=response['headers'],
+            stream=_ReplayStream(response['chunks'], self.realtime),
+            request=request,
+        )
+
+
+def transport_from_env(limits=None) -> Optional[Any]:
+    """
+    LLM_TRANSPORT に応じたトランスポートを作成（未設定なら None = 通常の接続）
+
+    Args:
+        limits: 記録モードで実際に接続するときのコネクションプールの設定
+    """
+    if TRANSPORT_MODE == "record":
+        inner = _http.HTTPTransport(limits=limits) if limits is not None else None
+        return RecordingTransport(inner=inner)
+    if TRANSPORT_MODE == "replay":
+        return ReplayTransport()
+    if TRANSPORT_MODE:
+        raise ValueError(f"LLM_TRANSPORT の値が正しくありません: {TRANSPORT_MODE}（record / replay のいずれか）")
+    return None
@@ -0,0 +1,74 @@
+"""
+ネタメモのAI整理
+未整理のクイックメモをカテゴリに分類・構造化するプロンプトの作成と応答の解析
+"""
+import json
+import os
+import re
+from typing import Any, Dict
+
+
+# 1つのジョブ内で同時に問い合わせるメモの数（環境変数で変更可能）
+NOTE_ORGANIZE_CONCURRENCY = int(os.getenv('NOTE_ORGANIZE_CONCURRENCY', '4'))
+
+# 1件あたりの最大出力トークン数
+NOTE_ORGANIZE_MAX_TOKENS = 1000
+
+
+def build_category_info(neta_data: Dict[str, Any]) -> str:
+    """プロンプトに含めるカテゴリ一覧を作成"""
+    if not neta_data:
+        return ""
+    return "\n".join(
+        f"- **{cat_id}** ({cat_data['name']}): {cat_data['description']}"
+        for cat_id, cat_data in neta_data['categories'].items()
+    )
+
+
+def build_prompt(note_content: str, category_info_text: str) -> str:
+    """メモ1件をカテゴリに分類するプロンプトを作成"""
+    return f"""以下のネタメモを分析して、適切なカテゴリに分類し、構造化してください。
+
+【利用可能なカテゴリ】
+{category_info_text}
+
+【ネタメモ】
+{note_content}
+
+【出力形式】（必ずJSON形式で返してください）
+{{
+  "category": "カテゴリID（上記から選択）",
+  "element_name": "要素名（簡潔に）",
+  "additional_fields": {{
+    "description": "説明",
+    "examples": ["例1", "例2"],  // dialogue_patternsの場合
+    "tags": ["タグ1", "タグ2"],  // 該当する場合
+    "trigger": "トリガー",  // situationsの場合
+    "category": "サブカテゴリ"  // dialogue_patternsの場合
+  }},
+  "reasoning": "このカテゴリを選んだ理由"
+}}
+
+【重要】
+- category は必ず上記のカテゴリIDから選択
+- element_name は簡潔で分かりやすく
+- additional_fields はカテゴリに応じて適切なフィールドを含める
+- 必ずJSON形式で返答してください"""
+
+
+def parse_response(response_text: str) -> Dict[str, Any]:
+    """
+    AIの応答からJSONを取り出す（コードブロックの場合も対応）
+
+    Raises:
+        ValueError: JSONが見つからない・必須項目がない場合
+    """
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        raise ValueError("応答にJSONが含まれていません")
+
+    result = json.loads(json_match.group())
+    for key in ['category', 'element_name']:
+        if not result.get(key):
+            raise ValueError(f"応答に {key} がありません")
+    return result
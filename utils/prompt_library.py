@@ -2,9 +2,14 @@
 プロンプトライブラリ
 外部ファイルからプロンプトを読み込み、動的に置換する
 """
+import hashlib
 import os
 
 
+# この行より前を毎回同じ内容の「静的な前半」とし、プロンプトキャッシュの対象にする
+CACHE_BREAKPOINT = "=== CACHE_BREAKPOINT ==="
+
+
 class PromptLibrary:
     def __init__(self, base_dir=None):
         """
@@ -63,8 +68,43 @@ class PromptLibrary:
         Returns:
             str: 置換済みのプロンプト
         """
+        return "".join(self.split(category, prompt_name, **kwargs))
+
+    def split(self, category, prompt_name, **kwargs):
+        """
+        プロンプトを CACHE_BREAKPOINT の行で区切り、それぞれ置換する
+
+        Returns:
+            list: 置換済みのプロンプトの断片（区切りがなければ1つ）
+        """
+        template = self.load(category, prompt_name)
+        segments = template.split(CACHE_BREAKPOINT + "\n")
+        return [segment.format(**kwargs) for segment in segments]
+
+    def format_blocks(self, category, prompt_name, **kwargs):
+        """
+        プロンプトを Messages API の content ブロックとして作成
+        区切りより前の静的な部分に cache_control を付け、2回目以降はキャッシュから読ませる
+
+        Returns:
+            list: [{"type": "text", "text": ..., "cache_control": ...}, ...]
+        """
+        segments = self.split(category, prompt_name, **kwargs)
+        blocks = []
+        for i, segment in enumerate(segments):
+            block = {"type": "text", "text": segment}
+            if i < len(segments) - 1:
+                block["cache_control"] = {"type": "ephemeral"}
+            blocks.append(block)
+        return blocks
+
+    def version(self, category, prompt_name):
+        """
+        テンプレートのバージョン（内容のハッシュ）を取得
+        テンプレートを編集すると変わるため、応答キャッシュのキーに使う
+        """
         template = self.load(category, prompt_name)
-        return template.format(**kwargs)
+        return hashlib.sha256(template.encode('utf-8')).hexdigest()[:16]
 
     def clear_cache(self):
         """キャッシュをクリア"""
@@ -0,0 +1,131 @@
+"""
+LLM応答キャッシュ（SQLite / ローカルディスク）
+同じ記事を再分析したときに、同じリクエストへの応答を再利用して API 呼び出しを省く
+サイズ上限を超えたら最後に使われた日時が古いものから削除し（LRU）、有効期限（TTL）を過ぎたものは使わない
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at);
+"""
+
+
+def make_key(**parts: Any) -> str:
+    """キャッシュキーを作成（モデル・テンプレートのバージョン・プロンプト・max_tokens などのハッシュ）"""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path, max_bytes: int, ttl_seconds: float):
+        """
+        Args:
+            db_path: SQLiteデータベースのパス
+            max_bytes: 保存する応答の合計サイズの上限（0以下ならキャッシュしない）
+            ttl_seconds: 保存してから使える期間（秒）
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self):
+        """プロセス内で共有する接続を取得（self._lock を保持した状態で呼ぶ）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """接続を閉じる"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュされた応答を取得（ない・期限切れの場合は None）"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            text, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            return text
+
+    def put(self, key: str, text: str):
+        """応答を保存し、サイズ上限を超えた分を古い順に削除する"""
+        if not self.enabled:
+            return
+
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, text, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, text, size, now, now)
+                )
+                # 期限切れを削除してから、最近使われた順に上限に収まる分だけ残す
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                conn.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY last_used_at DESC, rowid DESC) AS running_bytes
+                            FROM responses
+                        ) WHERE running_bytes > ?
+                    )
+                """, (self.max_bytes,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        """すべての応答を削除"""
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        """件数と合計サイズを取得"""
+        with self._lock:
+            count, total = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"count": count, "bytes": total}
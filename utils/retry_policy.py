@@ -0,0 +1,113 @@
+"""
+API呼び出しのリトライポリシー
+一時的なエラー（429 / 5xx / 529 / タイムアウト・接続エラー）を、
+指数バックオフ＋ジッター（equal jitter: バックオフの 50%〜100% をランダムに待つ）で再試行する。
+retry-after ヘッダーがあればそれに従う
+"""
+import email.utils
+import os
+import random
+import time
+from typing import Any, Callable, Optional
+
+
+# 再試行するHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# ステータスコードを持たない一時的なエラー（anthropic SDK の例外クラス名）
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "OverloadedError"}
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 4, base_delay: float = 2.0, max_delay: float = 60.0, jitter: float = 0.5):
+        """
+        Args:
+            max_attempts: 最大試行回数（初回を含む）
+            base_delay: 1回目の再試行までの基準待ち時間（秒）。以降は2倍ずつ増える
+            max_delay: 待ち時間の上限（秒）
+            jitter: 待ち時間をランダムに縮める割合（0.5 なら 50%〜100% の範囲の equal jitter。1.0 にすると 0%〜100% の full jitter）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def is_retryable(self, error: Exception) -> bool:
+        """再試行すべきエラーか"""
+        status_code = getattr(error, 'status_code', None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """エラーレスポンスの retry-after（秒）を取得（なければ None）"""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return None
+
+        value = headers.get('retry-after-ms')
+        if value:
+            try:
+                return max(0.0, float(value) / 1000)
+            except ValueError:
+                pass
+
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        # HTTP日付形式
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay_for(self, attempt: int, error: Exception) -> float:
+        """attempt 回目の失敗後の待ち時間（秒）"""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            # サーバーの指定は上限で切らずに従う
+            return retry_after
+
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, fn: Callable[[], Any], on_retry: Callable[[int, float, Exception], None] = None, sleep: Callable[[float], None] = time.sleep):
+        """
+        fn を実行し、一時的なエラーなら待ってから再試行する
+
+        Args:
+            fn: 実行する関数
+            on_retry: 再試行の直前に (失敗した試行回数, 待ち時間, エラー) で呼ばれる
+            sleep: 待機に使う関数（キャンセル可能な待機に差し替えられる）
+        """
+        attempt = 1
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+
+                delay = self.delay_for(attempt, e)
+                if on_retry:
+                    on_retry(attempt, delay, e)
+                sleep(delay)
+                attempt += 1
+
+
+# ジョブのステージで使うデフォルトのポリシー（環境変数で変更可能）
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv('LLM_MAX_ATTEMPTS', '4')),
+    base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY', '2')),
+    max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY', '60')),
+)
+
+# 画面から直接呼び出す場合のポリシー（ユーザーを長く待たせないよう短め）
+INTERACTIVE_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=10.0)
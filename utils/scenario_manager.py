@@ -1,40 +1,166 @@
 """
 シナリオ管理ユーティリティ
+scenario_history.json は一覧に必要な項目（タイトル・要約・生成設定・作成日時）だけを持ち、
+シナリオ本文は data/blobs/ に保存して詳細を開いたときだけ読み込む
 """
-import json
 import os
 import datetime
+import threading
+from utils.file_store import file_lock, locked_update, read_json, write_json_atomic
+from utils.ids import new_id
+from utils.blob_store import BLOB_MIN_CHARS, externalize, resolve_fields
+from utils import search_index
 
 
 # シナリオ履歴のファイルパス
 SCENARIO_HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'scenario_history.json')
 
+# blob に保存する本文フィールド
+SCENARIO_BODY_FIELDS = ['content']
+
+# 検索インデックスでの文書の種類
+SEARCH_KIND = "scenario"
+
+# 一覧・詳細の表示用に読み込んだシナリオ履歴（ファイルが更新されたら読み直す）
+# migrated: 旧形式の本文（インラインのテキスト）を blob に移す処理をこのプロセスで確認済みか
+_history_cache = {"signature": None, "scenarios": [], "by_id": {}, "migrated": False}
+_history_cache_lock = threading.Lock()
+
+
+def _empty_scenario_history():
+    return {"version": "1.0.0", "last_updated": datetime.datetime.now().strftime("%Y-%m-%d"), "scenarios": []}
+
 
 def load_scenario_history():
     """シナリオ履歴を読み込む"""
+    return read_json(SCENARIO_HISTORY_PATH, _empty_scenario_history)
+
+
+def _has_inline_bodies(scenarios):
+    """本文をそのまま持っている旧形式のシナリオがあるか（blob に移す長さの本文だけを数える）"""
+    return any(
+        isinstance(scenario.get(field), str) and len(scenario[field]) >= BLOB_MIN_CHARS
+        for scenario in scenarios
+        for field in SCENARIO_BODY_FIELDS
+    )
+
+
+def _migrate_inline_bodies():
+    """
+    旧形式のシナリオの本文を blob の参照に置き換えて保存する
+    本文を持つシナリオだけを変更し、本文のないシナリオには何も書き込まない
+    """
+    with file_lock(SCENARIO_HISTORY_PATH):
+        history = read_json(SCENARIO_HISTORY_PATH, _empty_scenario_history)
+        changed = False
+        for scenario in history['scenarios']:
+            for field in SCENARIO_BODY_FIELDS:
+                value = scenario.get(field)
+                externalized = externalize(value)
+                if externalized is not value:
+                    scenario[field] = externalized
+                    changed = True
+        # 他のプロセスが先に移行していれば書き込まない
+        if changed:
+            write_json_atomic(SCENARIO_HISTORY_PATH, history)
+
+
+def _history_signature():
+    """シナリオ履歴ファイルの更新を検知するための値（ファイルがなければ None）"""
     try:
-        with open(SCENARIO_HISTORY_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        stat = os.stat(SCENARIO_HISTORY_PATH)
     except FileNotFoundError:
-        return {"version": "1.0.0", "last_updated": datetime.datetime.now().strftime("%Y-%m-%d"), "scenarios": []}
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _cached_history():
+    """
+    シナリオ履歴の一覧（新しい順）と ID -> シナリオ の索引
+    再実行のたびにファイルを読み直さず、他のプロセスやこのプロセスが書き込んだときだけ読み直す
+    初めて読み込んだときに旧形式の本文が残っていれば、blob に移してから読み直す
+    （呼び出し元は返り値を変更しないこと）
+    """
+    signature = _history_signature()
+    with _history_cache_lock:
+        if signature != _history_cache['signature']:
+            scenarios = load_scenario_history().get('scenarios', []) if signature is not None else []
+            if not _history_cache['migrated']:
+                if _has_inline_bodies(scenarios):
+                    _migrate_inline_bodies()
+                    signature = _history_signature()
+                    scenarios = load_scenario_history().get('scenarios', [])
+                _history_cache['migrated'] = True
+            _history_cache.update(
+                signature=signature,
+                scenarios=scenarios,
+                by_id={scenario['id']: scenario for scenario in scenarios},
+            )
+        return _history_cache['scenarios'], _history_cache['by_id']
+
+
+def _matches(scenario, tone=None, date_from=None, date_to=None):
+    """雰囲気（tone）・作成日の範囲（date_from〜date_to、どちらも含む）の条件に合うか"""
+    if tone and (scenario.get('parameters') or {}).get('tone') != tone:
+        return False
+    created_on = scenario['created_at'][:10]
+    if date_from and created_on < date_from.isoformat():
+        return False
+    if date_to and created_on > date_to.isoformat():
+        return False
+    return True
+
+
+def count_scenarios(tone=None, date_from=None, date_to=None):
+    """保存済みのシナリオのうち、雰囲気・作成日の条件に合う件数（条件なしなら全件数）"""
+    scenarios, _ = _cached_history()
+    if not (tone or date_from or date_to):
+        return len(scenarios)
+    return sum(1 for s in scenarios if _matches(s, tone, date_from, date_to))
+
+
+def list_scenarios(limit, offset=0, tone=None, date_from=None, date_to=None):
+    """
+    条件に合うシナリオを新しい順に1ページ分取得（本文は参照のまま）
+
+    Args:
+        limit: 取得件数
+        offset: 先頭から読み飛ばす件数
+        tone: 生成設定の雰囲気（None ならすべて）
+        date_from, date_to: 作成日の範囲（datetime.date。None なら制限なし）
+
+    Returns:
+        [シナリオ, ...]（件数は count_scenarios で取得）
+    """
+    scenarios, _ = _cached_history()
+    if tone or date_from or date_to:
+        scenarios = [s for s in scenarios if _matches(s, tone, date_from, date_to)]
+    return [dict(s) for s in scenarios[offset:offset + limit]]
+
+
+def list_scenario_tones():
+    """保存済みのシナリオの雰囲気（tone）の一覧（絞り込みの選択肢用）"""
+    scenarios, _ = _cached_history()
+    return sorted({(s.get('parameters') or {}).get('tone') for s in scenarios} - {None, ""})
+
+
+def get_scenario(scenario_id):
+    """シナリオを1件取得（本文も読み込む。見つからない場合は None）"""
+    _, by_id = _cached_history()
+    return resolve_fields(by_id.get(scenario_id), SCENARIO_BODY_FIELDS)
 
 
 def save_scenario_history(data):
     """シナリオ履歴を保存する"""
     data['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d")
-    # ディレクトリが存在しない場合は作成
-    os.makedirs(os.path.dirname(SCENARIO_HISTORY_PATH), exist_ok=True)
-    with open(SCENARIO_HISTORY_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with file_lock(SCENARIO_HISTORY_PATH):
+        write_json_atomic(SCENARIO_HISTORY_PATH, data)
 
 
 def save_scenario(scenario_params, scenario_content):
     """シナリオを保存する"""
-    history = load_scenario_history()
-
     # 新しいシナリオIDを生成
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    scenario_id = f"scn_{timestamp}"
+    scenario_id = new_id("scn")
 
     # タイトルを抽出（シナリオ本文の最初の行または最初の100文字）
     lines = scenario_content.split('\n')
@@ -51,26 +177,69 @@ def save_scenario(scenario_params, scenario_content):
     summary = scenario_content[:150] + "..." if len(scenario_content) > 150 else scenario_content
 
     # 新しいシナリオデータを作成
+    # 本文は blob に保存し、履歴には参照だけを持たせる
     new_scenario = {
         "id": scenario_id,
         "title": title,
         "summary": summary,
-        "content": scenario_content,
+        "content": externalize(scenario_content),
         "parameters": scenario_params,
         "created_at": datetime.datetime.now().isoformat(),
     }
 
-    # 履歴に追加（最新が先頭）
-    history['scenarios'].insert(0, new_scenario)
+    # ファイルロックを取得して履歴に追加（最新が先頭）
+    with locked_update(SCENARIO_HISTORY_PATH, _empty_scenario_history) as history:
+        history['scenarios'].insert(0, new_scenario)
+        history['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d")
 
-    # 保存
-    save_scenario_history(history)
+    try:
+        search_index.get_index().add(SEARCH_KIND, _search_document(dict(new_scenario, content=scenario_content)))
+    except Exception as e:
+        print(f"検索インデックスの更新エラー: {e}")
 
     return scenario_id
 
 
 def delete_scenario(scenario_id):
     """指定されたIDのシナリオを削除する"""
-    history = load_scenario_history()
-    history['scenarios'] = [s for s in history['scenarios'] if s['id'] != scenario_id]
-    save_scenario_history(history)
+    with locked_update(SCENARIO_HISTORY_PATH, _empty_scenario_history) as history:
+        history['scenarios'] = [s for s in history['scenarios'] if s['id'] != scenario_id]
+        history['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    try:
+        search_index.get_index().remove(SEARCH_KIND, scenario_id)
+    except Exception as e:
+        print(f"検索インデックスの更新エラー: {e}")
+
+
+def _search_document(scenario):
+    """検索インデックスに登録する内容（タイトル・シナリオ本文）"""
+    return {
+        "id": scenario['id'],
+        "title": scenario.get('title'),
+        "summary": scenario.get('summary'),
+        "created_at": scenario['created_at'],
+        "texts": [scenario.get('content') or ""],
+    }
+
+
+def search_scenarios(query, limit=50, tone=None, date_from=None, date_to=None):
+    """
+    タイトル・シナリオ本文からシナリオを検索（関連度の高い順）
+    雰囲気・作成日の条件に合うシナリオのうち、関連度の上位 limit 件を返す
+
+    Returns:
+        [{id, title, summary, created_at, score}, ...]
+    """
+    index = search_index.get_index()
+    # 検索インデックスを作る前に保存されたシナリオは、初回の検索時にまとめて登録する
+    if not index.is_built(SEARCH_KIND):
+        index.rebuild(SEARCH_KIND, (
+            _search_document(resolve_fields(s, SCENARIO_BODY_FIELDS)) for s in load_scenario_history().get('scenarios', [])
+        ))
+    _, by_id = _cached_history()
+
+    def where(scenario_id):
+        return scenario_id in by_id and _matches(by_id[scenario_id], tone, date_from, date_to)
+
+    return index.search(SEARCH_KIND, query, limit, where=where)
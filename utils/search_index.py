@@ -0,0 +1,396 @@
+"""
+保存済みの分析・シナリオの全文検索（SQLite の転置インデックス）
+日本語は単語に区切らず、文字の2-gram（bigram）を見出し語にする。
+文書ごとに見出し語の出現回数を記録し、検索語のすべての bigram を含む文書を BM25 で順位付けする
+
+保存・削除のたびに該当する文書だけを更新する（全件の作り直しは初回の rebuild のみ）
+"""
+import array
+import collections
+import datetime
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List
+
+
+SEARCH_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'search_index.db')
+
+# タイトル中の見出し語は本文の何回分として数えるか
+TITLE_WEIGHT = 3
+
+# メモリマップで読み込む最大サイズ（バイト）
+MMAP_SIZE = 256 * 1024 * 1024
+
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    kind TEXT PRIMARY KEY,
+    doc_count INTEGER NOT NULL DEFAULT 0,
+    total_length INTEGER NOT NULL DEFAULT 0,
+    built_at TEXT
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    term TEXT NOT NULL,
+    df INTEGER NOT NULL,
+    UNIQUE (kind, term)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    doc INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    term_ids BLOB NOT NULL,
+    UNIQUE (kind, doc_id)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term_id, doc)
+) WITHOUT ROWID;
+"""
+
+# IN 句に一度に渡す値の数（SQLite の変数の上限より小さく）
+_QUERY_CHUNK = 500
+
+# 検索時に SQL で結合する見出し語の最大数（SQLite の結合は64表まで。残りは候補を絞ってから調べる）
+MAX_JOIN_TERMS = 16
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def _runs(text: str) -> List[str]:
+    """正規化（全角英数→半角・小文字化）して、記号・空白で区切った文字列の並び"""
+    if not text:
+        return []
+    return _WORD_PATTERN.findall(unicodedata.normalize('NFKC', text).lower())
+
+
+def _idf(doc_count: int, df: int) -> float:
+    """BM25 の IDF"""
+    return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+
+def tokenize(text: str) -> List[str]:
+    """文書の見出し語（1文字ずつと、隣り合う2文字ずつ。1文字の検索語にも一致させる）"""
+    terms = []
+    for run in _runs(text):
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(query: str) -> List[str]:
+    """検索語の見出し語（2文字以上の語は bigram、1文字の語はその文字。重複は除く）"""
+    terms = []
+    for run in _runs(query):
+        terms.extend([run] if len(run) == 1 else (run[i:i + 2] for i in range(len(run) - 1)))
+    return list(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLiteデータベースのパス
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        """プロセス内で共有する接続を取得（self._lock を保持した状態で呼ぶ）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # 検索時の転置リストの読み込みをページキャッシュではなくメモリマップで行う
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """接続を閉じる"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # -------------------------------------------------
+    # 更新
+    # -------------------------------------------------
+
+    @staticmethod
+    def _count_terms(document: Dict[str, Any]) -> collections.Counter:
+        """文書の見出し語ごとの出現回数（タイトルは TITLE_WEIGHT 倍）"""
+        counts = collections.Counter()
+        for term in tokenize(document.get('title')):
+            counts[term] += TITLE_WEIGHT
+        for text in document.get('texts', []):
+            counts.update(tokenize(text))
+        return counts
+
+    @staticmethod
+    def _term_ids(conn, kind: str, terms: List[str], create: bool) -> Dict[str, int]:
+        """見出し語 -> term_id（create なら未登録の見出し語を df=0 で登録する）"""
+        ids = {}
+        for start in range(0, len(terms), _QUERY_CHUNK):
+            chunk = terms[start:start + _QUERY_CHUNK]
+            ids.update(conn.execute(
+                f"SELECT term, term_id FROM terms WHERE kind = ? AND term IN ({', '.join('?' * len(chunk))})",
+                [kind, *chunk]
+            ).fetchall())
+        if create:
+            for term in terms:
+                if term not in ids:
+                    ids[term] = conn.execute(
+                        "INSERT INTO terms (kind, term, df) VALUES (?, ?, 0)", (kind, term)
+                    ).lastrowid
+        return ids
+
+    @staticmethod
+    def _adjust_collection(conn, kind: str, doc_delta: int, length_delta: int):
+        conn.execute("INSERT OR IGNORE INTO collections (kind) VALUES (?)", (kind,))
+        conn.execute(
+            "UPDATE collections SET doc_count = doc_count + ?, total_length = total_length + ? WHERE kind = ?",
+            (doc_delta, length_delta, kind)
+        )
+
+    def _delete(self, conn, kind: str, doc_id: str):
+        row = conn.execute(
+            "SELECT doc, length, term_ids FROM documents WHERE kind = ? AND doc_id = ?", (kind, doc_id)
+        ).fetchone()
+        if row is None:
+            return
+        doc, length, packed = row
+        term_ids = array.array('q', packed).tolist()
+        conn.executemany("DELETE FROM postings WHERE term_id = ? AND doc = ?", [(term_id, doc) for term_id in term_ids])
+        conn.executemany("UPDATE terms SET df = df - 1 WHERE term_id = ?", [(term_id,) for term_id in term_ids])
+        conn.execute("DELETE FROM documents WHERE doc = ?", (doc,))
+        self._adjust_collection(conn, kind, -1, -length)
+
+    def _insert(self, conn, kind: str, document: Dict[str, Any], counts: collections.Counter, term_ids: Dict[str, int]):
+        ids = [term_ids[term] for term in counts]
+        length = sum(counts.values())
+        doc = conn.execute(
+            "INSERT INTO documents (kind, doc_id, title, summary, created_at, length, term_ids) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, document['id'], document.get('title') or "", document.get('summary') or "",
+             document['created_at'], length, array.array('q', ids).tobytes())
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO postings (term_id, doc, tf) VALUES (?, ?, ?)",
+            [(term_ids[term], doc, tf) for term, tf in counts.items()]
+        )
+        return ids, length
+
+    def add(self, kind: str, document: Dict[str, Any]):
+        """
+        文書を追加（同じIDの文書があれば置き換える）
+
+        Args:
+            kind: 文書の種類（"analysis" / "scenario"）
+            document: {id, title, summary, created_at, texts: [検索対象の本文, ...]}
+        """
+        counts = self._count_terms(document)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(conn, kind, document['id'])
+                ids, length = self._insert(conn, kind, document, counts, self._term_ids(conn, kind, list(counts), create=True))
+                conn.executemany("UPDATE terms SET df = df + 1 WHERE term_id = ?", [(term_id,) for term_id in ids])
+                self._adjust_collection(conn, kind, 1, length)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, kind: str, doc_id: str):
+        """文書を削除"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(conn, kind, doc_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def is_built(self, kind: str) -> bool:
+        """rebuild 済みか（それ以前に保存された文書もインデックスにあるか）"""
+        with self._lock:
+            row = self._connect().execute("SELECT built_at FROM collections WHERE kind = ?", (kind,)).fetchone()
+            return row is not None and row[0] is not None
+
+    def rebuild(self, kind: str, documents: Iterable[Dict[str, Any]]) -> int:
+        """kind の文書をすべて作り直す（既存の履歴を初めて検索するとき用）。登録した件数を返す"""
+        count = 0
+        total_length = 0
+        term_ids = {}
+        df = collections.Counter()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM postings WHERE doc IN (SELECT doc FROM documents WHERE kind = ?)", (kind,)
+                )
+                conn.execute("DELETE FROM documents WHERE kind = ?", (kind,))
+                conn.execute("DELETE FROM terms WHERE kind = ?", (kind,))
+                for document in documents:
+                    counts = self._count_terms(document)
+                    for term in counts:
+                        if term not in term_ids:
+                            term_ids[term] = conn.execute(
+                                "INSERT INTO terms (kind, term, df) VALUES (?, ?, 0)", (kind, term)
+                            ).lastrowid
+                    ids, length = self._insert(conn, kind, document, counts, term_ids)
+                    df.update(ids)
+                    count += 1
+                    total_length += length
+                conn.executemany("UPDATE terms SET df = ? WHERE term_id = ?", [(n, term_id) for term_id, n in df.items()])
+                conn.execute(
+                    "INSERT OR REPLACE INTO collections (kind, doc_count, total_length, built_at) VALUES (?, ?, ?, ?)",
+                    (kind, count, total_length, datetime.datetime.now().isoformat())
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    # -------------------------------------------------
+    # 検索
+    # -------------------------------------------------
+
+    @staticmethod
+    def _score_rest(conn, candidates, rest, doc_count: int, avg_length: float) -> List[tuple]:
+        """
+        結合しなかった見出し語をすべて含む候補だけを残し、そのスコアを加えてスコアの高い順に並べ直す
+
+        Args:
+            candidates: [(doc_id, title, summary, created_at, score, doc, length), ...]
+            rest: [(term_id, df), ...]
+        """
+        scores = {row[5]: row[4] for row in candidates}
+        lengths = {row[5]: row[6] for row in candidates}
+        for term_id, df in rest:
+            docs = list(scores)
+            tfs = {}
+            for start in range(0, len(docs), _QUERY_CHUNK):
+                chunk = docs[start:start + _QUERY_CHUNK]
+                tfs.update(conn.execute(
+                    f"SELECT doc, tf FROM postings WHERE term_id = ? AND doc IN ({', '.join('?' * len(chunk))})",
+                    [term_id, *chunk]
+                ).fetchall())
+            idf = _idf(doc_count, df)
+            scores = {
+                doc: score + idf * tfs[doc] * (BM25_K1 + 1) / (
+                    tfs[doc] + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / avg_length))
+                for doc, score in scores.items() if doc in tfs
+            }
+        rows = [row[:4] + (scores[row[5]],) + row[5:] for row in candidates if row[5] in scores]
+        rows.sort(key=lambda row: (row[4], row[3]), reverse=True)
+        return rows
+
+    def search(self, kind: str, query: str, limit: int = 50, where: Callable[[str], bool] = None) -> List[Dict[str, Any]]:
+        """
+        検索語のすべての見出し語を含む文書を、スコアの高い順に返す
+
+        Args:
+            where: 文書IDを受け取り、結果に含めるなら True を返す条件（limit 件に絞る前に適用する）
+
+        Returns:
+            [{id, title, summary, created_at, score}, ...]
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT doc_count, total_length FROM collections WHERE kind = ?", (kind,)).fetchone()
+            if row is None or not row[0]:
+                return []
+            doc_count, total_length = row
+            avg_length = total_length / doc_count
+
+            # 見出し語ごとの文書頻度（1つでも含む文書がなければ該当なし）
+            found = dict(
+                (term, (term_id, df)) for term, term_id, df in conn.execute(
+                    f"SELECT term, term_id, df FROM terms WHERE kind = ? AND term IN ({', '.join('?' * len(terms))})",
+                    [kind, *terms]
+                )
+            )
+            if len(found) < len(terms) or any(df == 0 for _, df in found.values()):
+                return []
+
+            # 文書頻度の最も小さい見出し語の文書を候補にし、他の見出し語は (term_id, doc) で引く
+            # （SQLite の結合できる表の数には上限があるため、結合するのは文書頻度の小さい MAX_JOIN_TERMS 個まで）
+            ordered = sorted(found.values(), key=lambda item: item[1])
+            joined, rest = ordered[:MAX_JOIN_TERMS], ordered[MAX_JOIN_TERMS:]
+            joins = " ".join(
+                f"CROSS JOIN postings p{i} ON p{i}.term_id = ? AND p{i}.doc = p0.doc" for i in range(1, len(joined))
+            )
+            norm = f"({BM25_K1} * (1 - {BM25_B} + {BM25_B} * d.length / ?))"
+            score = " + ".join(f"? * p{i}.tf * {BM25_K1 + 1} / (p{i}.tf + {norm})" for i in range(len(joined)))
+
+            params = []
+            for term_id, df in joined:
+                params += [_idf(doc_count, df), avg_length]
+            params += [term_id for term_id, _ in joined[1:]]
+            # 条件・残りの見出し語がある場合は、すべての候補をスコアの高い順に読む（LIMIT -1 は制限なし）
+            params += [joined[0][0], kind, limit if where is None and not rest else -1]
+
+            cursor = conn.execute(
+                f"""
+                SELECT d.doc_id, d.title, d.summary, d.created_at, {score} AS score, d.doc, d.length
+                FROM postings p0
+                {joins}
+                CROSS JOIN documents d ON d.doc = p0.doc
+                WHERE p0.term_id = ? AND d.kind = ?
+                ORDER BY score DESC, d.created_at DESC
+                LIMIT ?
+                """,
+                params
+            )
+            if rest:
+                candidates = self._score_rest(conn, cursor.fetchall(), rest, doc_count, avg_length)
+            else:
+                candidates = cursor
+            rows = []
+            for row in candidates:
+                if where is None or where(row[0]):
+                    rows.append(row[:5])
+                    if len(rows) >= limit:
+                        break
+            cursor.close()
+
+        return [
+            {"id": doc_id, "title": title, "summary": summary, "created_at": created_at, "score": round(score, 3)}
+            for doc_id, title, summary, created_at, score in rows
+        ]
+
+
+# プロセス全体で共有するインデックス
+_index = SearchIndex(SEARCH_INDEX_PATH)
+
+
+def get_index() -> SearchIndex:
+    """共有の検索インデックス"""
+    return _index
@@ -0,0 +1,92 @@
+"""
+LLM呼び出しの計測ログ
+呼び出しごとの処理時間・最初の出力までの時間・トークン数・モデル・再試行回数を
+data/metrics.jsonl に1行ずつ追記し（一定サイズを超えたら1世代だけ残して切り替える）、
+ステージとプロンプトのバージョンごとに集計する（プロンプト変更後の遅延・トークン増を確認する）
+"""
+import collections
+import json
+import math
+import os
+import statistics
+from typing import Any, Dict, List
+
+from utils.file_store import file_lock
+
+
+METRICS_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'metrics.jsonl')
+
+# ログの最大サイズ（環境変数で変更可能）。超えたら metrics.jsonl.1 に切り替える
+METRICS_LOG_MAX_BYTES = int(float(os.getenv('LLM_METRICS_MAX_MB', '10')) * 1024 * 1024)
+
+
+def record(entry: Dict[str, Any]):
+    """計測結果を1行追記する"""
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with file_lock(METRICS_LOG_PATH):
+        try:
+            if os.path.getsize(METRICS_LOG_PATH) + len(line) > METRICS_LOG_MAX_BYTES:
+                os.replace(METRICS_LOG_PATH, METRICS_LOG_PATH + '.1')
+        except FileNotFoundError:
+            pass
+        with open(METRICS_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+def read_entries(limit: int = 1000) -> List[Dict[str, Any]]:
+    """直近の計測結果を古い順に取得（切り替え前の世代も含む）"""
+    entries = collections.deque(maxlen=limit)
+    for path in (METRICS_LOG_PATH + '.1', METRICS_LOG_PATH):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # 書き込み途中で止まった行は読み飛ばす
+                        continue
+        except FileNotFoundError:
+            continue
+    return list(entries)
+
+
+def percentile(values, percent: float) -> float:
+    """最近傍順位法によるパーセンタイル（token_budget の max_tokens の決定にも使う）"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+
+
+def summarize(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    ステージ・プロンプトのバージョンごとに集計する（応答キャッシュから返した呼び出しは時間の集計に含めない）
+    ステージは usage_key（テーマ生成はテーマ数ごと、ネタメモはメモごとではなくまとめて）で分ける
+
+    Returns:
+        [{stage, template_version, calls, cache_hits, p50_seconds, p95_seconds, p50_ttft_seconds,
+          avg_input_tokens, avg_cache_read_tokens, avg_output_tokens, retries, last_at}, ...]
+    """
+    groups = collections.OrderedDict()
+    for entry in entries:
+        stage = entry.get('usage_key') or entry.get('stage')
+        groups.setdefault((stage, entry.get('template_version')), []).append(entry)
+
+    rows = []
+    for (stage, template_version), group in groups.items():
+        called = [e for e in group if e.get('response_cache') != "hit"]
+        seconds = [e['seconds'] for e in called if e.get('seconds') is not None]
+        ttft = [e['ttft_seconds'] for e in called if e.get('ttft_seconds') is not None]
+        rows.append({
+            "stage": stage,
+            "template_version": template_version,
+            "calls": len(group),
+            "cache_hits": len(group) - len(called),
+            "p50_seconds": percentile(seconds, 50) if seconds else None,
+            "p95_seconds": percentile(seconds, 95) if seconds else None,
+            "p50_ttft_seconds": percentile(ttft, 50) if ttft else None,
+            "avg_input_tokens": round(statistics.mean(e.get('input_tokens', 0) for e in called)) if called else 0,
+            "avg_cache_read_tokens": round(statistics.mean(e.get('cache_read_input_tokens', 0) for e in called)) if called else 0,
+            "avg_output_tokens": round(statistics.mean(e.get('output_tokens', 0) for e in called)) if called else 0,
+            "retries": sum(e.get('retries', 0) for e in group),
+            "last_at": group[-1].get('at'),
+        })
+    return rows
@@ -0,0 +1,84 @@
+"""
+出力トークン数の実績に基づく max_tokens の決定
+ステージ（と num_themes）ごとに実際の出力トークン数を記録し、
+実績の高いパーセンタイルに余裕を持たせた値を max_tokens にする
+"""
+import math
+import os
+from typing import Optional
+
+from utils.file_store import locked_update, read_json
+from utils.telemetry import percentile
+
+
+TOKEN_USAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'token_usage.json')
+
+# 設定（環境変数で変更可能）
+PERCENTILE = float(os.getenv('LLM_MAX_TOKENS_PERCENTILE', '95'))
+HEADROOM = float(os.getenv('LLM_MAX_TOKENS_HEADROOM', '1.2'))
+MIN_SAMPLES = int(os.getenv('LLM_MAX_TOKENS_MIN_SAMPLES', '5'))
+MAX_TOKENS_FLOOR = 1024
+MAX_TOKENS_CEILING = int(os.getenv('LLM_MAX_TOKENS_CEILING', '16000'))
+
+# キーごとに残す直近の件数
+MAX_SAMPLES = 200
+
+# 応答キャッシュのキーが少しの変動で変わらないよう、この単位で切り上げる
+ROUND_TO = 512
+
+# 途中で途切れた出力は本当の長さが分からないため、上限をこの倍率で見積もる
+TRUNCATED_FACTOR = 1.5
+
+
+def _empty_usage():
+    return {"version": "1.0.0", "stages": {}}
+
+
+def usage_key(stage: str, num_themes: Optional[int] = None) -> str:
+    """実績を集計するキー（テーマ生成は num_themes ごと）"""
+    return f"{stage}:{num_themes}" if num_themes is not None else stage
+
+
+def record(key: str, output_tokens: int, max_tokens: int, truncated: bool = False):
+    """実際の出力トークン数を記録する"""
+    if not output_tokens:
+        return
+    with locked_update(TOKEN_USAGE_PATH, _empty_usage) as data:
+        samples = data['stages'].setdefault(key, [])
+        samples.append({"output_tokens": output_tokens, "max_tokens": max_tokens, "truncated": truncated})
+        del samples[:-MAX_SAMPLES]
+
+
+def choose_max_tokens(key: str, default: int) -> int:
+    """
+    実績から max_tokens を決める（実績が MIN_SAMPLES 件未満なら default）
+
+    Args:
+        key: usage_key() で作ったキー
+        default: 実績が少ないときの値
+    """
+    samples = read_json(TOKEN_USAGE_PATH, _empty_usage)['stages'].get(key, [])
+    if len(samples) < MIN_SAMPLES:
+        return default
+
+    values = [
+        max(sample['output_tokens'], sample['max_tokens'] * TRUNCATED_FACTOR) if sample.get('truncated') else sample['output_tokens']
+        for sample in samples
+    ]
+    budget = percentile(values, PERCENTILE) * HEADROOM
+    budget = math.ceil(budget / ROUND_TO) * ROUND_TO
+    return int(min(MAX_TOKENS_CEILING, max(MAX_TOKENS_FLOOR, budget)))
+
+
+def get_stats():
+    """キーごとの件数・パーセンタイル・途切れた回数（設定画面の表示用）"""
+    stats = {}
+    for key, samples in read_json(TOKEN_USAGE_PATH, _empty_usage)['stages'].items():
+        values = [sample['output_tokens'] for sample in samples]
+        stats[key] = {
+            "count": len(samples),
+            "p50": percentile(values, 50) if values else 0,
+            "high": percentile(values, PERCENTILE) if values else 0,
+            "truncated": sum(1 for sample in samples if sample.get('truncated')),
+        }
+    return stats